@@ -0,0 +1,121 @@
+"""
+Compressed archive of the scrollback lines dropped from the Scrollback ring.
+The lines are grouped in pages of a fixed number of lines, every full page is compressed and appended to a
+temporary file. Only the pages index stays in memory, and reading a line decompresses its page only.
+"""
+from array import array
+from struct import Struct
+from threading import RLock
+from tempfile import TemporaryFile
+from collections import OrderedDict
+import zlib
+import lzma
+
+
+_COUNT = Struct('<I')
+_COMPRESSORS = {'zlib': (lambda data: zlib.compress(data, 6), zlib.decompress),
+                'lzma': (lzma.compress, lzma.decompress)}
+
+
+class Archive:
+    PAGE_LINES = 1024    # Number of lines per compressed page
+    CACHE_PAGES = 8      # Number of decompressed pages kept in memory
+
+    def __init__(self, compression='zlib', page_lines=PAGE_LINES):
+        """
+        This Class is used to spill old scrollback lines to a compressed temporary file.
+        :param
+            compression: 'zlib' or 'lzma'
+            page_lines: Number of lines per compressed page
+        """
+        if compression not in _COMPRESSORS:
+            raise ValueError("Unsupported compression '%s'" % compression)
+        self._compress, self._decompress = _COMPRESSORS[compression]
+        self._page_lines = page_lines
+        self._file = TemporaryFile(prefix='PyQTerminal-')
+        self._offsets = array('Q')    # File offset of every page
+        self._sizes = array('I')      # Compressed size of every page
+        self._page = []               # Lines of the page being filled
+        self._cache = OrderedDict()
+        self._lock = RLock()          # The archive can be read by a search thread
+
+    def __len__(self):
+        return len(self._offsets) * self._page_lines + len(self._page)
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+    def clear(self):
+        with self._lock:
+            self._file.seek(0)
+            self._file.truncate()
+            self._offsets = array('Q')
+            self._sizes = array('I')
+            self._page = []
+            self._cache.clear()
+
+    def disk_usage(self):
+        """
+        :return the size of the archive file [bytes]
+        """
+        return sum(self._sizes)
+
+    def memory_usage(self):
+        """
+        :return the approximate memory used by the index, the page being filled, and the cache [bytes]
+        """
+        pages = list(self._cache.values()) + [self._page]
+        return (self._offsets.buffer_info()[1] * self._offsets.itemsize +
+                self._sizes.buffer_info()[1] * self._sizes.itemsize +
+                sum(len(entry) for page in pages for entry in page))
+
+    def append(self, entry):
+        """
+        This method is used to add an encoded scrollback line, the page is written when full.
+        """
+        with self._lock:
+            self._page.append(entry)
+            if len(self._page) == self._page_lines:
+                self._write_page(self._page)
+                self._page = []
+
+    def _write_page(self, entries):
+        lengths = array('I', [len(entry) for entry in entries])
+        data = self._compress(_COUNT.pack(len(entries)) + lengths.tobytes() + b''.join(entries))
+        self._file.seek(0, 2)
+        self._offsets.append(self._file.tell())
+        self._sizes.append(len(data))
+        self._file.write(data)
+
+    def _read_page(self, number):
+        entries = self._cache.get(number)
+        if entries is not None:
+            self._cache.move_to_end(number)
+            return entries
+        self._file.seek(self._offsets[number])
+        data = self._decompress(self._file.read(self._sizes[number]))
+        count = _COUNT.unpack_from(data)[0]
+        lengths = array('I')
+        lengths.frombytes(data[_COUNT.size:_COUNT.size + count * lengths.itemsize])
+        position = _COUNT.size + count * lengths.itemsize
+        entries = []
+        for length in lengths:
+            entries.append(data[position:position + length])
+            position += length
+        self._cache[number] = entries
+        if len(self._cache) > self.CACHE_PAGES:
+            self._cache.popitem(last=False)
+        return entries
+
+    def get_entry(self, index):
+        """
+        :return the encoded line [index], 0 is the oldest archived line
+        """
+        with self._lock:
+            if not 0 <= index < len(self):
+                raise IndexError('archive index out of range')
+            number, position = divmod(index, self._page_lines)
+            if number == len(self._offsets):
+                return self._page[position]
+            return self._read_page(number)[position]
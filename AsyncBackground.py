@@ -0,0 +1,225 @@
+"""
+asyncio based transport for Connection.
+A single event loop thread serves the channels of every AsyncConnection, instead of one reading thread per channel,
+and the received data of all the channels is delivered to the GUI thread through one bridged queue.
+"""
+from PyQt4.QtCore import SIGNAL, QObject
+from threading import Thread, Lock, Event
+from time import monotonic
+from collections import deque
+from asyncio import SelectorEventLoop, set_event_loop, run_coroutine_threadsafe
+from Background import Connection
+
+
+class Bridge(QObject):
+    def __init__(self):
+        """
+        This Class is used to move the received data from the event loop thread to the GUI thread.
+        It must be created in the GUI thread.
+        """
+        super(Bridge, self).__init__()
+        self._queue = deque()
+        self._lock = Lock()
+        self.connect(self, SIGNAL("dispatch()"), self.dispatch)
+
+    def put(self, connection, data):
+        """
+        This method is used to queue data for a connection, it is called from the event loop thread.
+        Only the first item queued to an empty queue emits "dispatch()".
+        """
+        with self._lock:
+            notify = not self._queue
+            self._queue.append((connection, data))
+        if notify:
+            self.emit(SIGNAL("dispatch()"))
+
+    def dispatch(self):
+        """
+        This method is used to hand the queued data to the connections, in the GUI thread.
+        """
+        with self._lock:
+            queue = self._queue
+            self._queue = deque()
+        for connection, data in queue:
+            if connection.push_data(data):
+                connection.emit(SIGNAL("reset_timer()"))
+
+
+class EventLoop:
+    _INSTANCE = None
+    _INSTANCE_LOCK = Lock()
+
+    def __init__(self):
+        """
+        This Class is used to run the shared asyncio event loop in a daemon thread.
+        Use EventLoop.instance() to get the process wide loop.
+        """
+        self._loop = SelectorEventLoop()    # Readers are not supported by the proactor loop
+        self._bridge = Bridge()
+        self._thread = Thread(target=self._run, name='EventLoop')
+        self._thread.daemon = True
+        self._thread.start()
+
+    @classmethod
+    def instance(cls):
+        with cls._INSTANCE_LOCK:
+            if cls._INSTANCE is None:
+                cls._INSTANCE = EventLoop()
+            return cls._INSTANCE
+
+    def _run(self):
+        set_event_loop(self._loop)
+        self._loop.run_forever()
+
+    def get_loop(self):
+        return self._loop
+
+    def get_bridge(self):
+        return self._bridge
+
+    def call_soon(self, callback, *args):
+        """
+        This method is used to run a callback in the event loop thread, it can be called from any thread.
+        """
+        self._loop.call_soon_threadsafe(callback, *args)
+
+    def run_coroutine(self, coroutine):
+        """
+        This method is used to schedule a coroutine in the event loop thread, it can be called from any thread.
+        :return concurrent.futures.Future of the coroutine result
+        """
+        return run_coroutine_threadsafe(coroutine, self._loop)
+
+
+class AsyncConnection(Connection):
+    def __init__(self, event_loop=None):
+        """
+        This Class is used to serve a channel from the shared event loop, with the same API as Connection.
+        :param event_loop: The EventLoop serving the channel (default = EventLoop.instance())
+        """
+        super(AsyncConnection, self).__init__()
+        self._event_loop = event_loop if event_loop else EventLoop.instance()
+        self._reading_channel = None
+        self._paused = False          # The channel reader is removed while the backlog is over MAX_BACKLOG
+        self._in_flight = 0           # Number of characters read, still in the bridge queue
+        # _paused and _in_flight are changed by the event loop and the GUI threads, under _received_lock
+        self._health_handle = None
+        self._last_receive = 0.0
+
+    def start_connection(self):
+        async def worker():
+            if session:
+                if session.is_connected():
+                    self._event_loop.get_bridge().put(self, "\r\nStarting new channel ...\r\n")
+                    # Opening a shell blocks, run it in the default executor of the loop
+                    channel = await self._event_loop.get_loop().run_in_executor(None, session.open_channel)
+                    if channel:
+                        self.set_channel(channel)
+                        self.take_data()    # Drop the pending messages, the terminal is cleared
+                        self.emit(SIGNAL("clear_all()"))
+                        self.emit(SIGNAL("reset_timer()"))
+                        self._start_reading(channel)
+                        return
+            self._event_loop.get_bridge().put(self, "\r\nError: Unable to start connection.\r\n")
+
+        session = self.get_session()
+        self._event_loop.run_coroutine(worker())
+
+    def read_data(self):
+        self._event_loop.call_soon(self._start_reading, self.get_channel())
+
+    def _start_reading(self, channel):
+        # Called in the event loop thread
+        if channel and channel is not self._reading_channel:
+            self._reading_channel = channel
+            self._decoder.reset()
+            self._event_loop.get_loop().add_reader(channel.fileno(), self._on_readable, channel)
+            self._schedule_health_check(channel)
+
+    def _stop_reading(self, channel):
+        # Called in the event loop thread
+        if channel is self._reading_channel:
+            with self._received_lock:
+                paused = self._paused
+                self._paused = False
+            if not paused:
+                self._event_loop.get_loop().remove_reader(channel.fileno())
+            self._reading_channel = None
+            if self._health_handle:
+                self._health_handle.cancel()
+                self._health_handle = None
+
+    def _schedule_health_check(self, channel):
+        # Called in the event loop thread
+        if self._health_interval is not None:
+            self._health_handle = self._event_loop.get_loop().call_later(self._health_interval,
+                                                                         self._on_health_check, channel)
+
+    def _on_health_check(self, channel):
+        # Called in the event loop thread, the probe is skipped while the channel receives data
+        self._health_handle = None
+        if channel is not self._reading_channel:
+            return
+        if monotonic() - self._last_receive >= (self._health_interval or 0) and not self.check_health():
+            self._stop_reading(channel)
+            return
+        self._schedule_health_check(channel)
+
+    def _on_readable(self, channel):
+        # Called in the event loop thread
+        if not channel.recv_ready():
+            if channel.closed or channel.eof_received:
+                self._stop_reading(channel)
+            return
+        raw_data = channel.recv(self.MAX_READ_SIZE)
+        if not raw_data:    # End of file, the channel is closed
+            self._alive = False
+            self._stop_reading(channel)
+            return
+        self._last_receive = monotonic()
+        data = self.receive_data(raw_data)
+        with self._received_lock:
+            self._in_flight += len(data)
+        self._event_loop.get_bridge().put(self, data)
+        # Stop reading the channel until the terminal takes the backlog, see on_room
+        with self._received_lock:
+            pause = not self._paused and self._backlog + self._in_flight >= self.MAX_BACKLOG
+            if pause:
+                self._paused = True
+        if pause:
+            self._event_loop.get_loop().remove_reader(channel.fileno())
+
+    def push_data(self, data):
+        with self._received_lock:
+            self._in_flight = max(0, self._in_flight - len(data))
+        return super(AsyncConnection, self).push_data(data)
+
+    def on_room(self):
+        with self._received_lock:
+            paused = self._paused
+        if paused:
+            self._event_loop.call_soon(self._resume_reading)
+
+    def _resume_reading(self):
+        # Called in the event loop thread
+        channel = self._reading_channel
+        with self._received_lock:
+            resume = channel and self._paused and self._backlog + self._in_flight < self.MAX_BACKLOG
+            if resume:
+                self._paused = False
+        if resume:
+            self._event_loop.get_loop().add_reader(channel.fileno(), self._on_readable, channel)
+
+    def stop_reading(self):
+        """
+        This method is used to remove the channel reader from the event loop, and wait for it to be removed.
+        """
+        def worker():
+            self._stop_reading(channel)
+            stopped.set()
+
+        channel = self._reading_channel
+        if channel:
+            stopped = Event()
+            self._event_loop.call_soon(worker)
+            stopped.wait(1)
@@ -1,20 +1,44 @@
 from PyQt4.QtCore import SIGNAL, QObject
-from threading import Thread
-from time import sleep
+from threading import Thread, Lock, Condition
+from collections import deque
+from codecs import getincrementaldecoder
+from select import select
+from socket import socketpair
 from _socket import error
-from paramiko import SSHClient, AutoAddPolicy
+from time import monotonic
+from Metrics import Metrics
+from Transport import Writer, BaseSession, Session, start_sessions, PASTE_START, PASTE_END
 
 
 class Connection(QObject):
-    DATA_READ_INT = 0.1                  # Read data every 0.5 [s]
+    MIN_READ_SIZE = 4096                 # Initial size of a single read [bytes]
+    MAX_READ_SIZE = 65536                # The read size grows up to 64 [KB] while the channel has more data
+    ENCODING = 'utf-8'                   # Encoding of the channel data
+    ERRORS = 'replace'                   # Decoding error policy: 'strict', 'replace' or 'ignore'
+    HEALTH_INTERVAL = 30                 # Period of the session health probe while the channel is idle [s]
+    MAX_BACKLOG = 262144                 # The channel is not read while this much text waits for the terminal [chars]
 
     def __init__(self):
         super(Connection, self).__init__()
         self._session = None
         self._channel = None
+        self._alive = False                           # Cached liveness of the channel, see check_health
+        self._connecting = False                      # The session is being started, see start_session
+        self._health_interval = self.HEALTH_INTERVAL
         self._exit_reading_flag = False
         self._reading_thread = None
-        self._reading_interval = Connection.DATA_READ_INT
+        self._wakeup_sockets = None
+        self._decoder = None
+        self._recorder = None
+        self._session_log = None
+        self._writer = None
+        self._metrics = Metrics()
+        self._echo_start = None    # Time of the first keystroke waiting for its echo
+        self.set_encoding(self.ENCODING, self.ERRORS)
+        self._received = deque()
+        self._backlog = 0                             # Number of received characters not taken yet
+        self._received_lock = Lock()
+        self._room = Condition(self._received_lock)   # Notified when the backlog goes under MAX_BACKLOG
 
     def set_session(self, session):
         self._session = session
@@ -24,42 +48,236 @@ class Connection(QObject):
 
     def set_channel(self, channel):
         self._channel = channel
+        self._alive = channel is not None
+        if self._writer:
+            self._writer.close()
+        self._writer = Writer(channel) if channel is not None else None
 
     def get_channel(self):
         return self._channel
 
-    def set_reading_interval(self, interval):
-        self._reading_interval = interval
+    def push_data(self, data):
+        """
+        This method is used to append received text to the buffer, it can be called from any thread.
+        Only the first push to an empty buffer emits "data_ready()", the rest is collected by take_data.
+        """
+        with self._received_lock:
+            notify = not self._received
+            self._received.append(data)
+            self._backlog += len(data)
+            if self._metrics.enabled:
+                self._metrics.observe('queue_depth', len(self._received))
+        if notify:
+            self.emit(SIGNAL("data_ready()"))
+        return notify
+
+    def take_data(self):
+        """
+        This method is used to collect all the received text since the last call.
+        """
+        with self._received_lock:
+            data = ''.join(self._received)
+            self._received.clear()
+            self._backlog = 0
+            self._room.notify_all()
+        self.on_room()
+        return data
+
+    def take_chunk(self):
+        """
+        This method is used to collect the oldest received chunk, the terminal takes only what it can parse.
+        The channel is read again once the backlog is under MAX_BACKLOG.
+        :return the chunk text, or None if nothing is waiting
+        """
+        with self._received_lock:
+            if not self._received:
+                return None
+            data = self._received.popleft()
+            full = self._backlog >= self.MAX_BACKLOG
+            self._backlog -= len(data)
+            room = self._backlog < self.MAX_BACKLOG
+            if room and full:
+                self._room.notify_all()
+        if room:
+            self.on_room()
+        return data
+
+    def get_backlog(self):
+        """
+        :return the number of received characters waiting for the terminal
+        """
+        return self._backlog
+
+    def wait_for_room(self):
+        """
+        This method is used by the reading thread to stop reading while the backlog is over MAX_BACKLOG.
+        The channel is not drained meanwhile, so its flow control (SSH window, PTY buffer) slows the sender down.
+        :return False if the reading must stop
+        """
+        with self._room:
+            while self._backlog >= self.MAX_BACKLOG and not self._exit_reading_flag:
+                self._room.wait()
+        return not self._exit_reading_flag
+
+    def on_room(self):
+        """
+        This method is called when the backlog is under MAX_BACKLOG after a take, the reading thread does not need it.
+        """
+
+    def set_recorder(self, recorder):
+        """
+        This method is used to record the received data to a capture file.
+        :param recorder: A Capture.Recorder, or None to stop recording
+        """
+        self._recorder = recorder
+
+    def get_recorder(self):
+        return self._recorder
+
+    def set_session_log(self, session_log):
+        """
+        This method is used to log the received data, the reading thread only queues it for the log writer thread.
+        :param session_log: A SessionLog.SessionLog, or None to stop logging
+        """
+        self._session_log = session_log
+
+    def get_session_log(self):
+        return self._session_log
+
+    def set_encoding(self, encoding, errors='replace'):
+        """
+        This method is used to change the decoding of the channel data.
+        :param
+            encoding: Any codec supported by the codecs module
+            errors: Decoding error policy: 'strict', 'replace' or 'ignore'
+        """
+        self._decoder = getincrementaldecoder(encoding)(errors)
+
+    def set_metrics(self, metrics):
+        self._metrics = metrics
+
+    def get_metrics(self):
+        return self._metrics
+
+    def receive_data(self, raw_data):
+        """
+        This method is used to handle the bytes read from the channel: record and measure them, then decode them.
+        :return the decoded text
+        """
+        if self._recorder:
+            self._recorder.record(raw_data)
+        if self._session_log:
+            self._session_log.record(raw_data)
+        metrics = self._metrics
+        if metrics.enabled:
+            metrics.count('bytes_received', len(raw_data))
+            metrics.count('chunks_received')
+            if self._echo_start is not None:
+                metrics.observe('echo_latency_ms', (monotonic() - self._echo_start) * 1000)
+                self._echo_start = None
+        return self.decode_data(raw_data)
+
+    def decode_data(self, raw_data):
+        """
+        This method is used to convert the bytes received from the channel to text.
+        A character split between two reads is kept by the incremental decoder, and completed by the next read.
+        """
+        return self._decoder.decode(raw_data)
+
+    def set_health_interval(self, interval):
+        """
+        This method is used to change the period of the health probe.
+        :param interval: The period [s], or None to disable the probe
+        """
+        self._health_interval = interval
+
+    def get_health_interval(self):
+        return self._health_interval
 
     def is_connected(self):
+        """
+        This method is used to check the channel from the cached state only, it does no network I/O.
+        The state is updated by the end of file of the channel, and by check_health.
+        """
         session = self.get_session()
         channel = self.get_channel()
-        if session and channel:
-            if channel in session.get_channels():
-                if session.is_connected():
-                    try:
-                        session.get_client().get_transport().send_ignore()
-                        return True
-                    except EOFError:
-                        print("Checking connection error")
-                    except:
-                        print("Checking connection error")
-                session.remove_channel(channel)
+        if session and channel and self._alive:
+            if channel in session.get_channels() and session.is_connected():
+                if not channel.closed and not channel.eof_received:
+                    return True
         return False
 
+    def check_health(self):
+        """
+        This method is used to probe the session transport, it is called periodically while the channel is idle.
+        :return the liveness of the channel
+        """
+        session = self.get_session()
+        channel = self.get_channel()
+        if not self.is_connected():
+            return False
+        try:
+            session.probe()
+        except EOFError:
+            print("Checking connection error")
+            self._alive = False
+        except:
+            print("Checking connection error")
+            self._alive = False
+        if not self._alive:
+            session.remove_channel(channel)
+        return self._alive
+
+    def is_connecting(self):
+        return self._connecting
+
+    def start_session(self, *args, **kwargs):
+        """
+        This method is used to start the session in a background thread, then open the terminal channel.
+        The caller never blocks on the connection: "connecting()" is emitted first, then "connected(bool)" with the
+        session.start_session result.
+        :param
+            args, kwargs: The arguments of session.start_session
+        """
+        def worker():
+            try:
+                started = session.start_session(*args, **kwargs)
+                reason = session.get_error()
+            except Exception as e:    # e.g. authentication failure, or paramiko missing
+                print("starting session error")
+                started, reason = False, e
+            self._connecting = False
+            self.emit(SIGNAL("connected(bool)"), bool(started))
+            if started:
+                self.start_connection()
+            else:
+                self.push_data("\r\nError: %s\r\n" % (reason or 'Unable to start session.'))
+
+        session = self.get_session()
+        if not session or self._connecting:
+            return False
+        self._connecting = True
+        self.emit(SIGNAL("connecting()"))
+        self.push_data("Connecting ...\r\n")
+        thread = Thread(target=worker)
+        thread.daemon = True
+        thread.start()
+        return True
+
     def start_connection(self):
         def worker():
             if session:
                 if session.is_connected():
-                    self.emit(SIGNAL("add_text(QString)"), "\nStarting new channel ...\n")
+                    self.push_data("\r\nStarting new channel ...\r\n")
                     channel = session.open_channel()
                     if channel:
                         self.set_channel(channel)
+                        self.take_data()    # Drop the pending messages, the terminal is cleared
                         self.emit(SIGNAL("clear_all()"))
                         self.emit(SIGNAL("reset_timer()"))
                         self.read_data()
                         return
-            self.emit(SIGNAL("add_text(QString)"), "\nError: Unable to start connection.\n")
+            self.push_data("\r\nError: Unable to start connection.\r\n")
 
         session = self.get_session()
         thread1 = Thread(target=worker)
@@ -67,23 +285,57 @@ class Connection(QObject):
 
     def read_data(self):
         def worker():
-            while True and self.is_connected() and not self._exit_reading_flag:
-                if channel.recv_ready():
-                    data = channel.recv(1024).decode().replace('\r', '')
-                    self.emit(SIGNAL("add_text(QString)"), data)
-                    self.emit(SIGNAL("reset_timer()"))
+            read_size = self.MIN_READ_SIZE
+            while self.is_connected() and self.wait_for_room():
+                # Block until the channel has data, close_connection wakes the thread up, or the health probe is due
+                readable = select([channel, wakeup], [], [], self._health_interval)[0]
+                if not readable:
+                    self.check_health()
                     continue
-                sleep(self._reading_interval)
+                if self._exit_reading_flag or channel not in readable:
+                    break
+                raw_data = channel.recv(read_size)
+                if not raw_data:    # End of file, the channel is closed
+                    self._alive = False
+                    break
+                data = self.receive_data(raw_data)
+                if self.push_data(data):
+                    self.emit(SIGNAL("reset_timer()"))
+
+                # Adapt the read size to the channel throughput
+                if len(raw_data) == read_size:
+                    read_size = min(read_size * 2, self.MAX_READ_SIZE)
+                elif len(raw_data) < read_size // 4:
+                    read_size = max(read_size // 2, self.MIN_READ_SIZE)
+            wakeup.close()
 
         channel = self.get_channel()
+        self._decoder.reset()
+        wakeup, self._wakeup_sockets = socketpair()
         self._reading_thread = Thread(target=worker)
         self._reading_thread.start()
 
-    def close_connection(self):
-        # Exit Reading
+    def stop_reading(self):
+        """
+        This method is used to stop the reading thread, and wait for it to exit.
+        """
         self._exit_reading_flag = True
-        self._reading_thread.join(1)
+        with self._room:
+            self._room.notify_all()    # Wake up a reader waiting for room
+        if self._wakeup_sockets:
+            try:
+                self._wakeup_sockets.send(b'\0')
+            except error:
+                pass    # The reading thread already exited
+            self._wakeup_sockets.close()
+            self._wakeup_sockets = None
+        if self._reading_thread:
+            self._reading_thread.join(1)
         self._exit_reading_flag = False
+
+    def close_connection(self):
+        # Exit Reading
+        self.stop_reading()
         # Close the channel
         session = self.get_session()
         channel = self.get_channel()
@@ -92,7 +344,7 @@ class Connection(QObject):
                 session.close_channel(channel)
                 self.set_channel(None)
         self.emit(SIGNAL("stop_timer()"))
-        self.emit(SIGNAL("add_text(QString)"), "\nConnection closed\n")
+        self.push_data("\r\nConnection closed\r\n")
         return True
 
     def close_session(self):
@@ -102,125 +354,39 @@ class Connection(QObject):
                 self.close_connection()
             session.close_session()
             self.set_session(None)
-        self.emit(SIGNAL("add_text(QString)"), "\nSession closed\n\n")
+        self.push_data("\r\nSession closed\r\n\r\n")
         return True
 
-    def send(self, cmd):
-        channel = self.get_channel()
-        if self.is_connected():
-            try:
-                sent = channel.send(cmd)
-                # channel.recv(len(str(key))).decode().replace('\r', '')
-                return True and sent
-            except error as e:
-                print("sending command error")
-                assert e
-        return False
-
-    def timeout(self):
-        self.emit(SIGNAL("add_text(QString)"), "\nTimeout")
-        self.close_connection()
+    def get_writer(self):
+        return self._writer
 
-
-class Session:
-    SESSIONS_COUNT = 0     # Number of opened sessions
-    MAX_CHANNELS = 10      # Maximum number of opened channels per session
-
-    def __init__(self):
+    def send(self, cmd):
         """
-        This Class is used to open an SSH connection (session) with remote server.
+        This method is used to queue text for the channel, the keystrokes close in time are written together.
         """
-        Session.SESSIONS_COUNT += 1
-        self.channelCount = 0
-        self._channels = []
-        self._error = ''
-        self._client = None
-
-    def get_channel_count(self):
-        return len(self._channels)
-
-    def add_channel(self, channel):
-        self._channels.append(channel)
-
-    def remove_channel(self, channel):
-        if channel in self._channels:
-            self._channels.remove(channel)
-
-    def get_channels(self):
-        return self._channels
-
-    def set_client(self, client):
-        self._client = client
-
-    def get_client(self):
-        return self._client
+        if self.is_connected():
+            if self._metrics.enabled:
+                self._metrics.count('chars_sent', len(cmd))
+                if self._echo_start is None:
+                    self._echo_start = monotonic()
+            return self._writer.write(cmd)
+        return False
 
-    def start_session(self, server, username='', password='', timeout=15):
+    def paste(self, text, bracketed=False):
         """
-        This method is used to start a new connection to server.
+        This method is used to queue a paste for the channel, it is written in WRITE_SIZE chunks with no delay.
         :param
-            server: The remote server in order to initiate ssh connection with
-            username: Remote server username
-            password: Remote server password
-            timeout: Timeout while trying to connect [s]
-        """
-        try:
-            client = SSHClient()
-            client.set_missing_host_key_policy(AutoAddPolicy())
-            client.connect(server, username=username, password=password, timeout=timeout)
-            self.set_client(client)
-            return True
-        except error as e:
-            print("opening session error")
-            self._error = e
-            return False
-
-    def close_session(self):
+            text: The pasted text
+            bracketed: Surround the text with the bracketed paste markers ( <ESC>[200~ and <ESC>[201~ )
         """
-        This method is used to close the connection to remote server.
-        """
-        try:
-            if self.get_client():
-                self.get_client().close()
-                Session.SESSIONS_COUNT -= 1
-                return True
-            else:
-                return False
-        except error as e:
-            print("closing session error")
-            self._error = e
-            return False
-
-    def is_connected(self):
-        if self.get_client():
-            if self.get_client().get_transport():
-                if self.get_client().get_transport().is_active():
-                    return True
+        if bracketed:
+            text = PASTE_START + text.replace(PASTE_END, '') + PASTE_END
+        if self.is_connected():
+            if self._metrics.enabled:
+                self._metrics.count('chars_sent', len(text))
+            return self._writer.write(text, coalesce=False)
         return False
 
-    def open_channel(self, timeout=120):
-        """
-        This method is used to open a new channel.
-        :return shell terminal status, and the shell channel
-        """
-        if self.get_channel_count() < self.MAX_CHANNELS and self.is_connected():
-            try:
-                channel = self.get_client().invoke_shell()
-                channel.settimeout(timeout)
-                self.add_channel(channel)
-                return channel
-            except error as e:
-                print("opening channel error")
-                self._error = e
-        # return None
-
-    def close_channel(self, channel):
-        """
-        This method is used to close a channel with the remote server.
-        :param channel: The channel that will be closed
-        """
-        if channel in self.get_channels():
-            channel.close()
-            self.remove_channel(channel)
-            return True
-        return False
+    def timeout(self):
+        self.push_data("\r\nTimeout")
+        self.close_connection()
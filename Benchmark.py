@@ -0,0 +1,144 @@
+"""
+Throughput benchmark of the terminal output path (parser, screen, scrollback and renderer).
+Usage:
+    python Benchmark.py                       # Replay the built-in corpus without Qt
+    python Benchmark.py --qt                  # Replay the corpus on a QTerminal
+    python Benchmark.py --capture FILE ...    # Replay capture files (see Capture.py)
+    xvfb-run python Benchmark.py --qt         # Qt 4 has no offscreen platform, a headless machine needs Xvfb
+Every corpus is reported as throughput [MB/s], frame latency [ms] (median / 99th percentile / maximum), and the
+peak memory allocated while replaying it [MB].
+"""
+from argparse import ArgumentParser
+from os import environ, path
+from sys import platform
+from time import perf_counter
+import tracemalloc
+from Capture import Replayer, read_capture, read_raw
+
+
+CHUNK_SIZE = 4096
+
+
+def _chunks(data):
+    return [(0.0, data[i:i + CHUNK_SIZE]) for i in range(0, len(data), CHUNK_SIZE)]
+
+
+def vi_example(size):
+    """ The vi session capture of the repository, repeated """
+    example_path = path.join(path.dirname(path.abspath(__file__)), 'vi_example.txt')
+    example = b''.join(chunk for _, chunk in read_raw(example_path))
+    return _chunks(example * max(1, size // len(example)))
+
+
+def sgr_flood(size):
+    """ Colorized output, a color change every word ( ls --color, compilers ) """
+    words = []
+    for i in range(64):
+        words.append('\x1b[%d;%dm%s\x1b[0m' % (1 + i % 2, 31 + i % 7, 'word%02d' % i))
+    line = (' '.join(words) + '\r\n').encode()
+    return _chunks(line * (size // len(line)))
+
+
+def top_redraw(size):
+    """ Full screen redraws with absolute positioning ( top ) """
+    frames = []
+    total = 0
+    frame_number = 0
+    while total < size:
+        rows = ['\x1b[H\x1b[7m  PID USER      PR  NI    VIRT    RES  %%CPU  TIME+   frame %d\x1b[K\x1b[0m' % frame_number]
+        for row in range(2, 25):
+            rows.append('\x1b[%d;1H%5d root      20   0 %7d %6d %5.1f  0:%02d.%02d command%d\x1b[K' %
+                        (row, row * 37 + frame_number, row * 1024, row * 64, (row * frame_number) % 100 / 10.0,
+                         row, frame_number % 60, row))
+        frame = ''.join(rows).encode()
+        frames.append(frame)
+        total += len(frame)
+        frame_number += 1
+    return [(0.0, frame) for frame in frames]
+
+
+def firehose(size):
+    """ Plain text lines ( cat of a big log, yes ) """
+    line = b'2017-08-18 11:24:57 INFO  [worker-3] request processed in 12 ms, status=200 size=5120\r\n'
+    return _chunks(line * (size // len(line)))
+
+
+CORPUS = [vi_example, sgr_flood, top_redraw, firehose]
+
+
+def _new_replayer(qt):
+    if not qt:
+        return Replayer()
+    from Terminal import QTerminal
+    terminal = QTerminal()
+    terminal.set_frame_budget(float('inf'))    # Every chunk is rendered as one complete frame
+    terminal.resize(1030, 670)
+    terminal.show()
+    return Replayer(terminal)
+
+
+def run(name, chunks, qt=False, memory=True):
+    """
+    This function is used to replay a corpus and measure it.
+    :return dictionary of the results
+    """
+    replayer = _new_replayer(qt)
+    latencies = []
+    size = sum(len(chunk) for _, chunk in chunks)
+    start = perf_counter()
+    for _, chunk in chunks:
+        frame_start = perf_counter()
+        replayer.feed(chunk)
+        latencies.append(perf_counter() - frame_start)
+    elapsed = perf_counter() - start
+
+    peak = None
+    if memory:
+        replayer = _new_replayer(qt)
+        tracemalloc.start()
+        replayer.replay(chunks)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    latencies.sort()
+    return {'name': name,
+            'size': size,
+            'throughput': size / elapsed / 1e6,
+            'frame_median': latencies[len(latencies) // 2] * 1000,
+            'frame_p99': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+            'frame_max': latencies[-1] * 1000,
+            'peak_memory': peak / 1e6 if peak is not None else None}
+
+
+def main():
+    parser = ArgumentParser(description='Benchmark the terminal output path.')
+    parser.add_argument('--qt', action='store_true', help='render on a QTerminal (needs an X display)')
+    parser.add_argument('--size', type=float, default=4, help='size of every generated corpus [MB]')
+    parser.add_argument('--capture', nargs='*', default=[], help='replay capture files instead of the corpus')
+    parser.add_argument('--no-memory', action='store_true', help='skip the peak memory measurement')
+    arguments = parser.parse_args()
+
+    application = None
+    if arguments.qt:
+        if platform.startswith('linux') and not environ.get('DISPLAY'):
+            parser.error('--qt needs an X display, run the benchmark under xvfb-run on a headless machine')
+        from PyQt4.QtGui import QApplication
+        application = QApplication([])    # Kept alive until the end of the benchmark
+
+    if arguments.capture:
+        corpus = [(path.basename(capture), read_capture(capture)[1]) for capture in arguments.capture]
+    else:
+        size = int(arguments.size * 1e6)
+        corpus = [(generator.__name__, generator(size)) for generator in CORPUS]
+
+    print('%-16s %10s %10s %12s %12s %12s %12s' %
+          ('corpus', 'size [MB]', 'MB/s', 'frame p50', 'frame p99', 'frame max', 'peak [MB]'))
+    for name, chunks in corpus:
+        result = run(name, chunks, arguments.qt, not arguments.no_memory)
+        print('%-16s %10.2f %10.2f %10.3fms %10.3fms %10.3fms %12s' %
+              (name, result['size'] / 1e6, result['throughput'], result['frame_median'], result['frame_p99'],
+               result['frame_max'], '%.2f' % result['peak_memory'] if result['peak_memory'] is not None else '-'))
+
+
+if __name__ == '__main__':
+    main()
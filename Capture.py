@@ -0,0 +1,119 @@
+"""
+Capture and replay of the terminal output.
+The capture format follows asciicast v2: a JSON header line, then one JSON line per received chunk:
+    {"version": 2, "width": 80, "height": 24, "timestamp": 1503051897}
+    [0.248, "o", "Last login: ..."]
+The chunk time is in seconds since the start of the capture. The chunk text is the received bytes decoded as
+UTF-8 with 'surrogateescape', so the exact bytes are restored on replay even if they are not valid UTF-8.
+"""
+from json import dumps, loads
+from threading import Lock
+from time import time, monotonic, sleep
+from codecs import getincrementaldecoder
+from Parser import Parser
+from Screen import Screen, line_runs
+from Scrollback import Scrollback
+
+
+class Recorder:
+    def __init__(self, path, width=80, height=24):
+        """
+        This Class is used to record the chunks received by a Connection to a capture file.
+        :param
+            path: The capture file path
+            width: Number of columns of the terminal
+            height: Number of rows of the terminal
+        """
+        self._file = open(path, 'w', encoding='utf-8')
+        self._file.write(dumps({'version': 2, 'width': width, 'height': height, 'timestamp': int(time())}) + '\n')
+        self._start = monotonic()
+        self._lock = Lock()
+
+    def record(self, raw_data):
+        """
+        This method is used to add a received chunk, it can be called from any thread.
+        """
+        event = dumps([round(monotonic() - self._start, 6), 'o', raw_data.decode('utf-8', 'surrogateescape')])
+        with self._lock:
+            if not self._file.closed:
+                self._file.write(event + '\n')
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+def read_capture(path):
+    """
+    This function is used to read a capture file.
+    :return the header dictionary, and a list of (time [s], bytes) chunks
+    """
+    with open(path, encoding='utf-8') as capture:
+        header = loads(capture.readline())
+        chunks = []
+        for line in capture:
+            if line.strip():
+                event_time, event_type, data = loads(line)
+                if event_type == 'o':
+                    chunks.append((event_time, data.encode('utf-8', 'surrogateescape')))
+    return header, chunks
+
+
+def read_raw(path, chunk_size=1024):
+    """
+    This function is used to read a raw output dump (e.g. vi_example.txt) as chunks with no timing.
+    :return list of (time [s], bytes) chunks
+    """
+    with open(path, 'rb') as raw:
+        data = raw.read()
+    return [(0.0, data[i:i + chunk_size]) for i in range(0, len(data), chunk_size)]
+
+
+class Replayer:
+    def __init__(self, terminal=None, width=80, height=24):
+        """
+        This Class is used to feed captured chunks to the emulator.
+        :param
+            terminal: A QTerminal, or None to replay on a Parser, Screen and Scrollback without Qt
+            width: Number of columns of the screen without Qt
+            height: Number of rows of the screen without Qt
+        """
+        self._terminal = terminal
+        self._decoder = getincrementaldecoder('utf-8')('replace')
+        self.parser = Parser()
+        self.screen = Screen(width, height)
+        self.scrollback = Scrollback()
+
+    def feed(self, raw_data):
+        """
+        This method is used to process a chunk and render it, as a single frame.
+        """
+        data = self._decoder.decode(raw_data)
+        if self._terminal is not None:
+            self._terminal.add_received_text(data)
+            self._terminal.render_frame()
+            self._terminal.flush()    # Paint the frame now, the event loop is not running
+            return
+        screen = self.screen
+        screen.process(self.parser.feed(data))
+        for chars, attrs in screen.take_history():
+            self.scrollback.append(chars, attrs)
+        screen.take_scrolls()
+        for y in screen.take_dirty():
+            chars, attrs = screen.get_line(y)
+            line_runs(chars, attrs, screen.line_end(y))    # Same work as the renderer without painting
+
+    def replay(self, chunks, realtime=False):
+        """
+        This method is used to feed all the chunks of a capture.
+        :param
+            chunks: List of (time [s], bytes) chunks
+            realtime: Wait for the chunk times, otherwise feed the chunks as fast as possible
+        """
+        start = monotonic()
+        for event_time, raw_data in chunks:
+            if realtime:
+                delay = event_time - (monotonic() - start)
+                if delay > 0:
+                    sleep(delay)
+            self.feed(raw_data)
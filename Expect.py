@@ -0,0 +1,217 @@
+"""
+Headless connection for automation scripts, with an expect / send_line API.
+No Qt module is imported: the channel is read by a background thread into an output buffer, and expect blocks on a
+condition until a pattern appears in the buffer, the timeout expires, or the channel is closed.
+Usage:
+    session = Session()
+    session.start_session('10.0.0.1', 'user', 'password')
+    connection = HeadlessConnection(session)
+    connection.start_connection()
+    connection.expect(r'[$#] $')
+    connection.send_line('show version')
+    if connection.expect([r'[$#] $', 'Invalid input'], timeout=10) == 0:
+        print(connection.before)
+"""
+from threading import Thread, Condition
+from codecs import getincrementaldecoder
+from select import select
+from socket import socketpair
+from time import monotonic
+from re import compile
+from _socket import error
+from Transport import Writer
+
+
+EOF = -1        # expect result when the channel is closed
+TIMEOUT = -2    # expect result when the timeout expired
+
+
+class HeadlessConnection:
+    LOOKBACK = 65536         # Maximum number of unmatched output characters kept for expect
+    TIMEOUT = 30             # Default expect timeout [s]
+    READ_SIZE = 65536        # Maximum size of a single read [bytes]
+    ENCODING = 'utf-8'
+    ERRORS = 'replace'
+
+    def __init__(self, session=None, lookback=LOOKBACK):
+        """
+        This Class is used to drive a channel of a session without a terminal widget, nor a QApplication.
+        :param
+            session: The session opening the channel, e.g. Transport.Session or LocalBackground.LocalSession
+            lookback: Maximum number of unmatched output characters kept, the oldest ones are dropped
+        """
+        self._session = session
+        self._channel = None
+        self._writer = None
+        self._reading_thread = None
+        self._wakeup_sockets = None
+        self._decoder = getincrementaldecoder(self.ENCODING)(self.ERRORS)
+        self._recorder = None
+        self._lookback = lookback
+        self._buffer = ''
+        self._eof = False
+        self._condition = Condition()
+        self.before = ''     # Output before the last match
+        self.match = None    # Last match object, None after EOF or TIMEOUT
+
+    def set_session(self, session):
+        self._session = session
+
+    def get_session(self):
+        return self._session
+
+    def get_channel(self):
+        return self._channel
+
+    def set_recorder(self, recorder):
+        """
+        This method is used to record the received data to a capture file.
+        :param recorder: A Capture.Recorder, or None to stop recording
+        """
+        self._recorder = recorder
+
+    def is_connected(self):
+        session = self._session
+        channel = self._channel
+        if session and channel and not self._eof:
+            if channel in session.get_channels() and session.is_connected():
+                return not channel.closed and not channel.eof_received
+        return False
+
+    def start_connection(self):
+        """
+        This method is used to open a channel on the session, and start reading it.
+        :return True if the channel is opened
+        """
+        session = self._session
+        if session and session.is_connected():
+            channel = session.open_channel()
+            if channel:
+                self._channel = channel
+                self._writer = Writer(channel)
+                with self._condition:
+                    self._buffer = ''
+                    self._eof = False
+                self._decoder.reset()
+                self._start_reading()
+                return True
+        print("Error: Unable to start connection.")
+        return False
+
+    def _start_reading(self):
+        def worker():
+            while True:
+                readable = select([channel, wakeup], [], [])[0]
+                if channel not in readable:
+                    break
+                try:
+                    raw_data = channel.recv(self.READ_SIZE)
+                except error:
+                    raw_data = b''
+                if not raw_data:    # End of file, the channel is closed
+                    break
+                if self._recorder:
+                    self._recorder.record(raw_data)
+                data = self._decoder.decode(raw_data)
+                with self._condition:
+                    self._buffer = (self._buffer + data)[-self._lookback:]
+                    self._condition.notify_all()
+            wakeup.close()
+            with self._condition:
+                self._eof = True
+                self._condition.notify_all()
+
+        channel = self._channel
+        wakeup, self._wakeup_sockets = socketpair()
+        self._reading_thread = Thread(target=worker, name='HeadlessReader')
+        self._reading_thread.daemon = True
+        self._reading_thread.start()
+
+    def send(self, text):
+        """
+        This method is used to queue text for the channel.
+        :return False if the channel is closed
+        """
+        if self.is_connected():
+            return self._writer.write(text, coalesce=False)
+        return False
+
+    def send_line(self, line='', newline='\r'):
+        return self.send(line + newline)
+
+    def expect(self, patterns, timeout=None):
+        """
+        This method is used to wait for the first of the patterns to appear in the output.
+        The matched output, and the output before it, are consumed: the next expect searches the following output.
+        :param
+            patterns: A regular expression, or a list of them (text or compiled)
+            timeout: Maximum waiting time [s] (default = TIMEOUT), float('inf') waits until a match or EOF
+        :return the index of the matched pattern, EOF if the channel is closed, or TIMEOUT
+                the match is kept in self.match, and the output before it in self.before
+        """
+        if not isinstance(patterns, (list, tuple)):
+            patterns = [patterns]
+        expressions = [compile(pattern) if isinstance(pattern, str) else pattern for pattern in patterns]
+        deadline = monotonic() + (self.TIMEOUT if timeout is None else timeout)
+        with self._condition:
+            while True:
+                found = self._search(expressions)
+                if found:
+                    index, match = found
+                    self.before = self._buffer[:match.start()]
+                    self.match = match
+                    self._buffer = self._buffer[match.end():]
+                    return index
+                remaining = deadline - monotonic()
+                if self._eof or remaining <= 0:
+                    self.before = self._buffer
+                    self.match = None
+                    self._buffer = ''
+                    return EOF if self._eof else TIMEOUT
+                # Woken up by the reading thread on new output, the buffer is bounded by the lookback
+                self._condition.wait(remaining if remaining != float('inf') else None)
+
+    def _search(self, expressions):
+        # The earliest match wins, the first pattern wins on the same position
+        best = None
+        for index, expression in enumerate(expressions):
+            match = expression.search(self._buffer)
+            if match and (best is None or match.start() < best[1].start()):
+                best = index, match
+        return best
+
+    def read_available(self):
+        """
+        This method is used to consume all the output received so far.
+        """
+        with self._condition:
+            data = self._buffer
+            self._buffer = ''
+        return data
+
+    def close_connection(self):
+        if self._wakeup_sockets:
+            try:
+                self._wakeup_sockets.send(b'\0')
+            except error:
+                pass    # The reading thread already exited
+            self._wakeup_sockets.close()
+            self._wakeup_sockets = None
+        if self._reading_thread:
+            self._reading_thread.join(1)
+            self._reading_thread = None
+        if self._writer:
+            self._writer.close()
+            self._writer = None
+        if self._session and self._channel:
+            self._session.close_channel(self._channel)
+        self._channel = None
+        return True
+
+    def close_session(self):
+        if self._session:
+            if self._channel:
+                self.close_connection()
+            self._session.close_session()
+            self._session = None
+        return True
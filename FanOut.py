@@ -0,0 +1,171 @@
+"""
+Run the same command on many hosts in parallel.
+Every host is served by a worker of a bounded thread pool: connect, run the command on an exec channel, read its
+output until the end of file, close. A host failing or timing out only ends its own worker, so the batch takes about
+the time of the slowest host.
+Usage:
+    python FanOut.py --inventory hosts.txt --username user --password secret "uname -a"
+The inventory holds one host per line, as "host" or "user@host".
+"""
+from argparse import ArgumentParser
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from codecs import getincrementaldecoder
+from select import select
+from time import monotonic
+from Transport import Session
+
+
+# Result of a host, the times are in [s], exit_status is None if the command did not complete
+Result = namedtuple('Result', 'host exit_status output error connect_time run_time')
+
+
+def connect_ssh(entry, timeout):
+    """
+    This function is used to open the SSH session of an inventory entry.
+    :param
+        entry: The host name, or a dictionary with the 'host', 'username' and 'password' keys
+        timeout: Timeout while trying to connect [s]
+    :return the started Session
+    """
+    if isinstance(entry, str):
+        entry = {'host': entry}
+    session = Session()
+    if not session.start_session(entry['host'], entry.get('username', ''), entry.get('password', ''), timeout):
+        raise ConnectionError(str(session.get_error()) or 'unable to connect')
+    return session
+
+
+def host_name(entry):
+    return entry if isinstance(entry, str) else entry['host']
+
+
+class FanOut:
+    WORKERS = 32             # Maximum number of hosts served at the same time
+    CONNECT_TIMEOUT = 15     # Timeout of a host connection [s]
+    COMMAND_TIMEOUT = 60     # Timeout of the command on a host, after the connection [s]
+    READ_SIZE = 65536        # Maximum size of a single read [bytes]
+
+    def __init__(self, workers=WORKERS, connect=connect_ssh):
+        """
+        This Class is used to run a command on an inventory of hosts with bounded concurrency.
+        :param
+            workers: Maximum number of hosts served at the same time
+            connect: Function opening the session of an entry: connect(entry, timeout) -> started session
+        """
+        self._workers = workers
+        self._connect = connect
+
+    def run(self, inventory, command, on_output=None, on_result=None,
+            connect_timeout=CONNECT_TIMEOUT, command_timeout=COMMAND_TIMEOUT):
+        """
+        This method is used to run a command on every host of the inventory, and wait for all of them.
+        The callbacks are called from the worker threads.
+        :param
+            inventory: List of entries, see connect_ssh
+            command: The command line run on every host
+            on_output: Called as on_output(host, text) with the output of a host, as it is received
+            on_result: Called as on_result(Result) when a host is done
+            connect_timeout: Timeout of a host connection [s]
+            command_timeout: Timeout of the command on a host [s]
+        :return list of Result, in the inventory order
+        """
+        results = [None] * len(inventory)
+        if not inventory:
+            return results
+        with ThreadPoolExecutor(max_workers=min(self._workers, len(inventory))) as pool:
+            futures = {pool.submit(self.run_host, entry, command, on_output, connect_timeout, command_timeout): i
+                       for i, entry in enumerate(inventory)}
+            for future in as_completed(futures):
+                result = future.result()
+                results[futures[future]] = result
+                if on_result:
+                    on_result(result)
+        return results
+
+    def run_host(self, entry, command, on_output=None,
+                 connect_timeout=CONNECT_TIMEOUT, command_timeout=COMMAND_TIMEOUT):
+        """
+        This method is used to run a command on a single host, any failure is returned in the Result.
+        """
+        host = host_name(entry)
+        start = monotonic()
+        connect_time = None
+        session = None
+        output = []
+        exit_status = None
+        error = None
+        try:
+            session = self._connect(entry, connect_timeout)
+            connect_time = monotonic() - start
+            channel = session.exec_channel(command, command_timeout)
+            if not channel:
+                raise ConnectionError(str(session.get_error()) or 'unable to open a channel')
+            decoder = getincrementaldecoder('utf-8')('replace')
+            deadline = monotonic() + command_timeout
+            while True:
+                remaining = deadline - monotonic()
+                if remaining <= 0:
+                    error = 'command timeout'
+                    break
+                if not select([channel], [], [], remaining)[0]:
+                    continue
+                raw_data = channel.recv(self.READ_SIZE)
+                if not raw_data:    # End of file, the command is done
+                    break
+                text = decoder.decode(raw_data)
+                output.append(text)
+                if on_output and text:
+                    on_output(host, text)
+            if error is None:
+                exit_status = channel.recv_exit_status()
+        except Exception as e:
+            error = '%s: %s' % (type(e).__name__, e)
+        finally:
+            if session:
+                session.close_session()
+        return Result(host, exit_status, ''.join(output), error, connect_time, monotonic() - start)
+
+
+def read_inventory(path, username='', password=''):
+    """
+    This function is used to read an inventory file, one "host" or "user@host" per line, '#' starts a comment.
+    :return list of entries, see connect_ssh
+    """
+    inventory = []
+    with open(path) as lines:
+        for line in lines:
+            line = line.split('#')[0].strip()
+            if line:
+                user, _, host = line.rpartition('@')
+                inventory.append({'host': host, 'username': user or username, 'password': password})
+    return inventory
+
+
+def main():
+    parser = ArgumentParser(description='Run a command on many hosts in parallel.')
+    parser.add_argument('command', help='the command line run on every host')
+    parser.add_argument('--inventory', required=True, help='file of the hosts, one "host" or "user@host" per line')
+    parser.add_argument('--username', default='', help='default username')
+    parser.add_argument('--password', default='', help='password')
+    parser.add_argument('--workers', type=int, default=FanOut.WORKERS, help='maximum number of parallel hosts')
+    parser.add_argument('--timeout', type=float, default=FanOut.COMMAND_TIMEOUT, help='command timeout [s]')
+    arguments = parser.parse_args()
+
+    def on_output(host, text):
+        for line in text.splitlines():
+            print('%s: %s' % (host, line))
+
+    inventory = read_inventory(arguments.inventory, arguments.username, arguments.password)
+    start = monotonic()
+    results = FanOut(arguments.workers).run(inventory, arguments.command, on_output,
+                                            command_timeout=arguments.timeout)
+    print('\n%-32s %6s %10s %10s  %s' % ('host', 'status', 'connect', 'total', 'error'))
+    for result in results:
+        print('%-32s %6s %9.2fs %9.2fs  %s' % (result.host, '-' if result.exit_status is None else result.exit_status,
+                                             result.connect_time or 0, result.run_time, result.error or ''))
+    print('%d hosts in %.2fs' % (len(results), monotonic() - start))
+
+
+if __name__ == '__main__':
+    main()
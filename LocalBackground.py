@@ -0,0 +1,208 @@
+"""
+Local shell transport, an alternative to the SSH Session.
+The shell runs on a pseudo terminal created by pty.fork, the terminal reads and writes the PTY master directly,
+with no handshake and no encryption. Unix only.
+"""
+from os import environ, execvpe, read, write, close, kill, waitpid, _exit, WNOHANG
+from select import select
+from signal import SIGHUP, SIGKILL
+from struct import pack
+from time import monotonic, sleep
+from fcntl import ioctl
+from termios import TIOCSWINSZ
+import pty
+from Transport import BaseSession
+
+
+class PtyChannel:
+    CLOSE_GRACE = 0.2    # Time given to the command to exit on SIGHUP, before SIGKILL [s]
+
+    def __init__(self, command, width=80, height=24, env=None):
+        """
+        This Class is used to run a command on a pseudo terminal, with the interface of a paramiko Channel.
+        :param
+            command: The command and its arguments, e.g. ['/bin/bash', '-l']
+            width: Number of columns of the terminal
+            height: Number of rows of the terminal
+            env: Environment of the command (default = the current environment with TERM=xterm)
+        """
+        if env is None:
+            env = dict(environ, TERM='xterm')
+        pid, fd = pty.fork()
+        if pid == 0:    # Child, only exec: the parent can have running threads
+            try:
+                execvpe(command[0], command, env)
+            finally:
+                _exit(127)
+        self._pid = pid
+        self._fd = fd
+        self._exit_status = None
+        self._reaped = False
+        self.closed = False
+        self.eof_received = False
+        self.resize_pty(width, height)
+
+    def fileno(self):
+        return self._fd
+
+    def get_pid(self):
+        return self._pid
+
+    def settimeout(self, timeout):
+        pass    # The reads block on select, the timeout of the terminal is handled by the Connection
+
+    def resize_pty(self, width=80, height=24):
+        """
+        This method is used to change the size of the terminal, the command receives SIGWINCH.
+        """
+        if not self.closed:
+            ioctl(self._fd, TIOCSWINSZ, pack('HHHH', height, width, 0, 0))
+
+    def recv_ready(self):
+        return not self.closed and bool(select([self._fd], [], [], 0)[0])
+
+    def recv(self, nbytes):
+        """
+        This method is used to read the command output.
+        :return the bytes read, empty at the end of file
+        """
+        if self.closed:
+            return b''
+        try:
+            data = read(self._fd, nbytes)
+        except OSError:    # EIO when the command exited and the slave side is closed
+            data = b''
+        if not data:
+            self.eof_received = True
+        return data
+
+    def send(self, data):
+        """
+        This method is used to write to the command input.
+        :return the number of bytes written
+        """
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        if self.closed:
+            raise OSError('channel closed')
+        return write(self._fd, data)
+
+    def exit_status_ready(self):
+        return self._reap(WNOHANG)
+
+    def recv_exit_status(self):
+        """
+        :return the exit status of the command, minus the signal number if it was killed, or None if unknown
+        """
+        self._reap(0)
+        return self._exit_status
+
+    def _reap(self, options):
+        if not self._reaped:
+            try:
+                pid, status = waitpid(self._pid, options)
+            except ChildProcessError:    # Reaped by someone else, its status is lost
+                self._reaped = True
+                return True
+            if pid == 0:
+                return False
+            self._reaped = True
+            self._exit_status = status >> 8 if status & 0x7f == 0 else -(status & 0x7f)
+        return True
+
+    def close(self):
+        """
+        This method is used to hang up the command, and release the PTY.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        if not self._reap(WNOHANG):
+            try:
+                kill(self._pid, SIGHUP)
+            except ProcessLookupError:
+                pass
+        close(self._fd)
+        deadline = monotonic() + self.CLOSE_GRACE
+        while not self._reap(WNOHANG) and monotonic() < deadline:
+            sleep(0.01)
+        if not self._reap(WNOHANG):
+            # Do not block the caller on a command ignoring SIGHUP
+            try:
+                kill(self._pid, SIGKILL)
+            except ProcessLookupError:
+                pass
+            self._reap(0)
+
+
+class LocalSession(BaseSession):
+    def __init__(self):
+        """
+        This Class is used to open shells on the local machine, as channels of a session.
+        """
+        super(LocalSession, self).__init__()
+        self._command = None
+        self._width = 80
+        self._height = 24
+        self._env = None
+        self._started = False
+
+    def start_session(self, command=None, width=80, height=24, env=None):
+        """
+        This method is used to set the command started by every channel, no process is started yet.
+        :param
+            command: The command and its arguments (default = $SHELL, or /bin/sh)
+            width: Number of columns of the terminal
+            height: Number of rows of the terminal
+            env: Environment of the command (default = the current environment with TERM=xterm)
+        """
+        self._command = list(command) if command else [environ.get('SHELL', '/bin/sh')]
+        self._width = width
+        self._height = height
+        self._env = env
+        self._started = True
+        return True
+
+    def close_session(self):
+        """
+        This method is used to close all the channels of the session.
+        """
+        if not self._started:
+            return False
+        for channel in list(self.get_channels()):
+            self.close_channel(channel)
+        self._started = False
+        return True
+
+    def is_connected(self):
+        return self._started
+
+    def open_channel(self, timeout=120):
+        """
+        This method is used to start the command on a new pseudo terminal.
+        :return the PtyChannel, or None if the command can not be started
+        """
+        if self.get_channel_count() < self.MAX_CHANNELS and self.is_connected():
+            try:
+                channel = PtyChannel(self._command, self._width, self._height, self._env)
+                self.add_channel(channel)
+                return channel
+            except OSError as e:
+                print("opening channel error")
+                self._error = e
+        # return None
+
+    def exec_channel(self, command, timeout=120):
+        """
+        This method is used to run a single command with /bin/sh on a new pseudo terminal.
+        :return the PtyChannel, or None if the command can not be started
+        """
+        if self.get_channel_count() < self.MAX_CHANNELS and self.is_connected():
+            try:
+                channel = PtyChannel(['/bin/sh', '-c', command], self._width, self._height, self._env)
+                self.add_channel(channel)
+                return channel
+            except OSError as e:
+                print("opening channel error")
+                self._error = e
+        # return None
@@ -0,0 +1,141 @@
+"""
+Performance counters of the terminal.
+The metrics are disabled by default, the instrumented code checks Metrics.enabled before measuring anything.
+    counters:   totals, reported with their rate per second ( bytes received, chunks received, frames )
+    gauges:     last value ( row cache size )
+    histograms: distributions in power of two buckets ( parse time, render time, echo latency, queue depth )
+"""
+from json import dumps
+from math import frexp
+from threading import Lock
+from time import monotonic
+
+
+class Histogram:
+    def __init__(self):
+        """
+        This Class is used to keep the distribution of a measure, in buckets [2 ** (n - 1), 2 ** n).
+        """
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self._buckets = {}    # Bucket exponent: number of values
+
+    def record(self, value):
+        exponent = frexp(value)[1] if value > 0 else None
+        self._buckets[exponent] = self._buckets.get(exponent, 0) + 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def percentile(self, fraction):
+        """
+        :param fraction: The percentile as a fraction, e.g. 0.99
+        :return the upper bound of the bucket holding the percentile, or None if empty
+        """
+        if not self.count:
+            return None
+        rank = fraction * self.count
+        seen = 0
+        for exponent in sorted(self._buckets, key=lambda e: -2000 if e is None else e):
+            seen += self._buckets[exponent]
+            if seen >= rank:
+                return 0.0 if exponent is None else min(2.0 ** exponent, self.max)
+        return self.max
+
+    def to_dict(self):
+        return {'count': self.count, 'mean': self.mean(), 'min': self.min, 'max': self.max,
+                'p50': self.percentile(0.5), 'p99': self.percentile(0.99)}
+
+
+class Metrics:
+    def __init__(self, enabled=False):
+        """
+        This Class is used to collect counters, gauges and histograms, it can be fed from any thread.
+        :param enabled: Collect the metrics, otherwise the instrumented code skips the measures
+        """
+        self.enabled = enabled
+        self._lock = Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+        self._start = monotonic()
+
+    def set_enabled(self, enabled):
+        self.enabled = enabled
+
+    def reset(self):
+        with self._lock:
+            self._counters = {}
+            self._gauges = {}
+            self._histograms = {}
+            self._start = monotonic()
+
+    def count(self, name, value=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def gauge(self, name, value):
+        self._gauges[name] = value
+
+    def observe(self, name, value):
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram()
+            histogram.record(value)
+
+    def get_counter(self, name):
+        return self._counters.get(name, 0)
+
+    def get_gauge(self, name):
+        return self._gauges.get(name)
+
+    def get_histogram(self, name):
+        return self._histograms.get(name)
+
+    def snapshot(self):
+        """
+        :return dictionary of all the metrics, the counters are given with their rate per second
+        """
+        with self._lock:
+            elapsed = monotonic() - self._start
+            return {'elapsed': elapsed,
+                    'counters': {name: {'total': total, 'rate': total / elapsed if elapsed > 0 else None}
+                                 for name, total in self._counters.items()},
+                    'gauges': dict(self._gauges),
+                    'histograms': {name: histogram.to_dict() for name, histogram in self._histograms.items()}}
+
+    def dump(self, path=None):
+        """
+        This method is used to export the metrics as JSON.
+        :param path: The written file (default = only return the JSON text)
+        :return the JSON text
+        """
+        text = dumps(self.snapshot(), indent=2, sort_keys=True)
+        if path:
+            with open(path, 'w') as output:
+                output.write(text + '\n')
+        return text
+
+    def format(self):
+        """
+        :return the metrics as short text lines, for an overlay
+        """
+        snapshot = self.snapshot()
+        lines = []
+        for name, counter in sorted(snapshot['counters'].items()):
+            lines.append('%-16s %12d %10.1f/s' % (name, counter['total'], counter['rate'] or 0))
+        for name, value in sorted(snapshot['gauges'].items()):
+            lines.append('%-16s %12s' % (name, value))
+        for name, histogram in sorted(snapshot['histograms'].items()):
+            lines.append('%-16s p50 %8.3f  p99 %8.3f  max %8.3f' %
+                         (name, histogram['p50'], histogram['p99'], histogram['max']))
+        return '\n'.join(lines)
@@ -0,0 +1,230 @@
+"""
+A table driven, incremental VT100/xterm escape sequence parser.
+The states and transitions follow the DEC ANSI parser described in:
+http://vt100.net/emu/dec_ansi_parser
+"""
+from re import compile
+
+
+# Parser actions (first item of every emitted action tuple)
+PRINT = 0          # (PRINT, text)
+EXECUTE = 1        # (EXECUTE, control character)
+CSI_DISPATCH = 2   # (CSI_DISPATCH, final character, parameters tuple, private marker + intermediates)
+ESC_DISPATCH = 3   # (ESC_DISPATCH, final character, intermediates)
+OSC_DISPATCH = 4   # (OSC_DISPATCH, string)
+
+# Parser states
+GROUND = 0
+ESCAPE = 1
+ESCAPE_INTERMEDIATE = 2
+CSI_ENTRY = 3
+CSI_PARAM = 4
+CSI_INTERMEDIATE = 5
+CSI_IGNORE = 6
+OSC_STRING = 7
+STRING_IGNORE = 8  # DCS, SOS, PM and APC strings are consumed and ignored
+
+# Transition actions (internal)
+_NONE = 0
+_EXECUTE = 1
+_COLLECT = 2
+_PARAM = 3
+_ESC_DISPATCH = 4
+_CSI_DISPATCH = 5
+_OSC_PUT = 6
+
+_MAX_PARAMS = 32        # Extra parameters are dropped
+_MAX_PARAM_VALUE = 65535
+_NON_ASCII = 0x80       # Table index used for every character above 0x7F
+
+_GROUND_CONTROL = compile('[\x00-\x1f\x7f]')   # End of a printable run
+_OSC_END = compile('[\x07\x18\x1a\x1b]')        # BEL, CAN, SUB or ESC end an OSC string
+_STRING_END = compile('[\x18\x1a\x1b]')         # CAN, SUB or ESC end an ignored string
+
+
+def _build_table():
+    """
+    This function is used to build the transition table.
+    :return a list indexed by state, of lists indexed by character code, of (action, next state) tuples
+    """
+    table = [[(_NONE, state)] * (_NON_ASCII + 1) for state in range(STRING_IGNORE + 1)]
+
+    def add(state, codes, action, next_state=None):
+        for code in codes:
+            table[state][code] = (action, state if next_state is None else next_state)
+
+    c0 = [c for c in range(0x20) if c not in (0x18, 0x1A, 0x1B)]
+
+    add(ESCAPE, c0, _EXECUTE)
+    add(ESCAPE, range(0x20, 0x30), _COLLECT, ESCAPE_INTERMEDIATE)
+    add(ESCAPE, range(0x30, 0x7F), _ESC_DISPATCH, GROUND)
+    add(ESCAPE, [0x5B], _NONE, CSI_ENTRY)               # [
+    add(ESCAPE, [0x5D], _NONE, OSC_STRING)              # ]
+    add(ESCAPE, [0x50, 0x58, 0x5E, 0x5F], _NONE, STRING_IGNORE)    # P X ^ _
+    add(ESCAPE, [_NON_ASCII], _NONE, GROUND)
+
+    add(ESCAPE_INTERMEDIATE, c0, _EXECUTE)
+    add(ESCAPE_INTERMEDIATE, range(0x20, 0x30), _COLLECT)
+    add(ESCAPE_INTERMEDIATE, range(0x30, 0x7F), _ESC_DISPATCH, GROUND)
+    add(ESCAPE_INTERMEDIATE, [_NON_ASCII], _NONE, GROUND)
+
+    add(CSI_ENTRY, c0, _EXECUTE)
+    add(CSI_ENTRY, range(0x20, 0x30), _COLLECT, CSI_INTERMEDIATE)
+    add(CSI_ENTRY, range(0x30, 0x3C), _PARAM, CSI_PARAM)
+    add(CSI_ENTRY, range(0x3C, 0x40), _COLLECT, CSI_PARAM)     # Private markers < = > ?
+    add(CSI_ENTRY, range(0x40, 0x7F), _CSI_DISPATCH, GROUND)
+    add(CSI_ENTRY, [_NON_ASCII], _NONE, GROUND)
+
+    add(CSI_PARAM, c0, _EXECUTE)
+    add(CSI_PARAM, range(0x20, 0x30), _COLLECT, CSI_INTERMEDIATE)
+    add(CSI_PARAM, range(0x30, 0x3C), _PARAM)
+    add(CSI_PARAM, range(0x3C, 0x40), _NONE, CSI_IGNORE)
+    add(CSI_PARAM, range(0x40, 0x7F), _CSI_DISPATCH, GROUND)
+    add(CSI_PARAM, [_NON_ASCII], _NONE, GROUND)
+
+    add(CSI_INTERMEDIATE, c0, _EXECUTE)
+    add(CSI_INTERMEDIATE, range(0x20, 0x30), _COLLECT)
+    add(CSI_INTERMEDIATE, range(0x30, 0x40), _NONE, CSI_IGNORE)
+    add(CSI_INTERMEDIATE, range(0x40, 0x7F), _CSI_DISPATCH, GROUND)
+    add(CSI_INTERMEDIATE, [_NON_ASCII], _NONE, GROUND)
+
+    add(CSI_IGNORE, c0, _EXECUTE)
+    add(CSI_IGNORE, range(0x40, 0x7F), _NONE, GROUND)
+    add(CSI_IGNORE, [_NON_ASCII], _NONE, GROUND)
+
+    # OSC_STRING and STRING_IGNORE are scanned in runs by Parser.feed, and never reach the table
+    return table
+
+
+_TABLE = _build_table()
+
+
+class Parser:
+    def __init__(self):
+        """
+        This Class is used to split the terminal output into printable runs and control functions.
+        Incomplete sequences at the end of a chunk are kept, and completed by the next chunk.
+        """
+        self._state = GROUND
+        self._intermediates = ''
+        self._params = ''
+        self._osc = []
+
+    def reset(self):
+        self._state = GROUND
+        self._intermediates = ''
+        self._params = ''
+        self._osc = []
+
+    def get_state(self):
+        return self._state
+
+    def feed(self, data):
+        """
+        This method is used to parse a chunk of terminal output in a single pass.
+        :param data: The received text
+        :return list of action tuples, see the action constants at the top of this module
+        """
+        actions = []
+        append = actions.append
+        table = _TABLE
+        state = self._state
+        pos = 0
+        end = len(data)
+
+        while pos < end:
+            if state == GROUND:
+                # Collect the whole printable run at once
+                found = _GROUND_CONTROL.search(data, pos)
+                if not found:
+                    append((PRINT, data[pos:]))
+                    break
+                start = found.start()
+                if start > pos:
+                    append((PRINT, data[pos:start]))
+                char = data[start]
+                pos = start + 1
+                if char == '\x1b':
+                    state = self._enter_escape()
+                elif char != '\x7f':
+                    append((EXECUTE, char))
+                continue
+
+            if state == OSC_STRING or state == STRING_IGNORE:
+                found = (_OSC_END if state == OSC_STRING else _STRING_END).search(data, pos)
+                if not found:
+                    if state == OSC_STRING:
+                        self._osc.append(data[pos:])
+                    break
+                start = found.start()
+                if state == OSC_STRING:
+                    self._osc.append(data[pos:start])
+                    append((OSC_DISPATCH, ''.join(self._osc)))
+                    self._osc = []
+                char = data[start]
+                pos = start + 1
+                if char == '\x1b':
+                    state = self._enter_escape()
+                else:
+                    if char != '\x07':
+                        append((EXECUTE, char))    # CAN / SUB
+                    state = GROUND
+                continue
+
+            char = data[pos]
+            pos += 1
+            code = ord(char)
+
+            # Transitions from anywhere
+            if code == 0x1B:
+                state = self._enter_escape()
+                continue
+            if code == 0x18 or code == 0x1A:
+                append((EXECUTE, char))
+                state = GROUND
+                continue
+
+            action, next_state = table[state][code if code < _NON_ASCII else _NON_ASCII]
+            if action == _PARAM:
+                self._params += char
+            elif action == _COLLECT:
+                self._intermediates += char
+            elif action == _EXECUTE:
+                append((EXECUTE, char))
+            elif action == _CSI_DISPATCH:
+                append((CSI_DISPATCH, char, self._parse_params(), self._intermediates))
+            elif action == _ESC_DISPATCH:
+                append((ESC_DISPATCH, char, self._intermediates))
+
+            if next_state != state:
+                if next_state == OSC_STRING:
+                    self._osc = []
+                state = next_state
+
+        self._state = state
+        return actions
+
+    def _enter_escape(self):
+        self._intermediates = ''
+        self._params = ''
+        return ESCAPE
+
+    def _parse_params(self):
+        """
+        This method is used to convert the collected parameters to integers.
+        Missing parameters are returned as 0, the control function applies its own default.
+        Sub-parameters ( ':' ) are treated as normal parameters.
+        """
+        params = self._params
+        if not params:
+            return ()
+        values = []
+        for param in params.replace(':', ';').split(';')[:_MAX_PARAMS]:
+            if param:
+                try:
+                    values.append(min(int(param), _MAX_PARAM_VALUE))
+                except ValueError:
+                    values.append(0)
+            else:
+                values.append(0)
+        return tuple(values)
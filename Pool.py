@@ -0,0 +1,298 @@
+"""
+Process wide pool of SSH sessions, shared by the terminals.
+The sessions are keyed by (host, port, username, password digest). A PooledSession opens its channels on a session
+of its key that has a free channel, so a new terminal to a connected host costs a channel open instead of a TCP
+connection and a key exchange. Another session is started when all the sessions of the key are full.
+Every lease and every channel holds a reference on its session, a session with no reference is closed after
+IDLE_TIMEOUT.
+"""
+from threading import Lock, Timer
+from hashlib import sha256
+from time import monotonic
+from Transport import BaseSession, Session
+
+
+def pool_key(server, username='', password='', port=22):
+    """
+    :return the key of the sessions to a server, the password is only kept as a digest
+    """
+    return server, port, username, sha256(password.encode('utf-8')).hexdigest()
+
+
+class SessionPool:
+    IDLE_TIMEOUT = 300    # A session with no lease and no channel is closed after this time [s]
+    _INSTANCE = None
+    _INSTANCE_LOCK = Lock()
+
+    def __init__(self, idle_timeout=IDLE_TIMEOUT, factory=Session):
+        """
+        This Class is used to share the started sessions between the terminals.
+        Use SessionPool.instance() to get the process wide pool.
+        :param
+            idle_timeout: Time after which a session with no reference is closed [s]
+            factory: Creates a new session, started as session.start_session(server, username, password, timeout, port)
+        """
+        self._idle_timeout = idle_timeout
+        self._factory = factory
+        self._lock = Lock()
+        self._key_locks = {}      # Key: lock held while a session of the key is searched or started
+        self._sessions = {}       # Key: list of the started sessions
+        self._references = {}     # Session: number of leases and channels using it
+        self._idle_since = {}     # Session: time its last reference was released
+        self._timer = None
+
+    @classmethod
+    def instance(cls):
+        with cls._INSTANCE_LOCK:
+            if cls._INSTANCE is None:
+                cls._INSTANCE = SessionPool()
+            return cls._INSTANCE
+
+    def set_idle_timeout(self, idle_timeout):
+        self._idle_timeout = idle_timeout
+
+    def get_idle_timeout(self):
+        return self._idle_timeout
+
+    def get_sessions(self, key):
+        with self._lock:
+            return list(self._sessions.get(key, ()))
+
+    def get_references(self, session):
+        with self._lock:
+            return self._references.get(session, 0)
+
+    def acquire(self, key, arguments):
+        """
+        This method is used to get a started session of a key, a new one is started if none has a free channel.
+        :param
+            key: The key of the session, see pool_key
+            arguments: (server, username, password, connect timeout, port) used to start a new session
+        :return the session, with a reference given back by release
+        """
+        with self._key_lock(key):
+            session = self._find(key) or self._start(key, arguments)
+            with self._lock:
+                self._reference(session, 1)
+            return session
+
+    def open_channel(self, key, arguments, command=None, timeout=120):
+        """
+        This method is used to open a channel on a session of a key, a new session is started if all are full.
+        :param
+            key, arguments: See acquire
+            command: The command of an exec channel (default = a shell channel)
+            timeout: The channel timeout [s]
+        :return (session, channel), the channel holds a reference on the session given back by release
+        """
+        with self._key_lock(key):
+            session = self._find(key) or self._start(key, arguments)
+            channel = session.exec_channel(command, timeout) if command else session.open_channel(timeout)
+            if channel:
+                with self._lock:
+                    self._reference(session, 1)
+            return session, channel
+
+    def release(self, session):
+        """
+        This method is used to give back a reference on a session, it is closed after IDLE_TIMEOUT with no reference.
+        """
+        with self._lock:
+            if session in self._references:
+                self._reference(session, -1)
+
+    def evict_idle(self):
+        """
+        This method is used to close the sessions unused for more than IDLE_TIMEOUT.
+        """
+        now = monotonic()
+        evicted = []
+        with self._lock:
+            self._timer = None
+            for session, since in list(self._idle_since.items()):
+                if now - since >= self._idle_timeout:
+                    evicted.append(session)
+                    self._forget(session)
+            if self._idle_since:
+                self._schedule_eviction(min(self._idle_since.values()) + self._idle_timeout - now)
+        for session in evicted:
+            session.close_session()
+        return len(evicted)
+
+    def close_all(self):
+        """
+        This method is used to close every session of the pool, including the used ones.
+        """
+        with self._lock:
+            sessions = list(self._references)
+            for session in sessions:
+                self._forget(session)
+            if self._timer:
+                self._timer.cancel()
+                self._timer = None
+        for session in sessions:
+            session.close_session()
+
+    def _key_lock(self, key):
+        with self._lock:
+            return self._key_locks.setdefault(key, Lock())
+
+    def _find(self, key):
+        # Drop the dead sessions of the key, and return the first one with a free channel
+        dead = []
+        found = None
+        with self._lock:
+            for session in list(self._sessions.get(key, ())):
+                if not session.is_connected():
+                    dead.append(session)
+                    self._forget(session)
+                elif found is None and session.get_channel_count() < session.MAX_CHANNELS:
+                    found = session
+        for session in dead:
+            session.close_session()
+        return found
+
+    def _start(self, key, arguments):
+        session = self._factory()
+        if not session.start_session(*arguments):
+            raise ConnectionError(str(session.get_error()) or 'unable to connect')
+        with self._lock:
+            self._sessions.setdefault(key, []).append(session)
+            self._reference(session, 0)    # Idle until a lease or a channel uses it
+        return session
+
+    def _reference(self, session, count):
+        # Called with the lock held
+        references = self._references.get(session, 0) + count
+        self._references[session] = references
+        if references > 0:
+            self._idle_since.pop(session, None)
+        else:
+            self._idle_since[session] = monotonic()
+            if self._timer is None:
+                self._schedule_eviction(self._idle_timeout)
+
+    def _forget(self, session):
+        # Called with the lock held
+        for sessions in self._sessions.values():
+            if session in sessions:
+                sessions.remove(session)
+        self._references.pop(session, None)
+        self._idle_since.pop(session, None)
+
+    def _schedule_eviction(self, delay):
+        # Called with the lock held
+        self._timer = Timer(max(0, delay), self.evict_idle)
+        self._timer.daemon = True
+        self._timer.start()
+
+
+class PooledSession(BaseSession):
+    def __init__(self, pool=None):
+        """
+        This Class is used like a Session by a Connection, its channels are opened on the sessions of a pool.
+        Closing it only closes its own channels, the shared sessions stay in the pool for the other terminals.
+        :param pool: The SessionPool (default = SessionPool.instance())
+        """
+        super(PooledSession, self).__init__()
+        self._pool = pool if pool else SessionPool.instance()
+        self._key = None
+        self._arguments = None
+        self._home = None     # Session leased by start_session, it keeps the transport open between the channels
+        self._owners = {}     # Channel: the pooled session it belongs to
+
+    def get_pool(self):
+        return self._pool
+
+    def start_session(self, server, username='', password='', timeout=15, port=22):
+        """
+        This method is used to lease a session to server, an existing session of the pool is reused.
+        :param
+            server: The remote server in order to initiate ssh connection with
+            username: Remote server username
+            password: Remote server password
+            timeout: Timeout while trying to connect [s]
+            port: Remote server port
+        """
+        if self._home:
+            self.close_session()
+        key = pool_key(server, username, password, port)
+        arguments = server, username, password, timeout, port    # The channels may start another session
+        try:
+            self._home = self._pool.acquire(key, arguments)
+        except Exception as e:    # ConnectionError, socket errors, and SSHException from paramiko
+            print("opening session error")
+            self._error = e
+            return False
+        self._key = key
+        self._arguments = arguments
+        return True
+
+    def close_session(self):
+        """
+        This method is used to close the channels of the lease, and give back its session to the pool.
+        """
+        if not self._home:
+            return False
+        for channel in list(self.get_channels()):
+            self.close_channel(channel)
+        self._pool.release(self._home)
+        self._home = None
+        return True
+
+    def is_connected(self):
+        return self._home is not None and self._home.is_connected()
+
+    def set_keepalive(self, interval):
+        for session in set(self._owners.values()) | ({self._home} if self._home else set()):
+            session.set_keepalive(interval)
+
+    def probe(self):
+        """
+        This method is used to check the sessions serving the channels of the lease.
+        """
+        if not self._home:
+            raise EOFError('session closed')
+        for session in set(self._owners.values()) | {self._home}:
+            session.probe()
+
+    def open_channel(self, timeout=120):
+        """
+        This method is used to open a shell channel, on another session of the pool if the leased one is full.
+        :return the shell channel
+        """
+        return self._open(None, timeout)
+
+    def exec_channel(self, command, timeout=120):
+        """
+        This method is used to open a channel running a single command, see Session.exec_channel.
+        :return the command channel
+        """
+        return self._open(command, timeout)
+
+    def _open(self, command, timeout):
+        if self.is_connected():
+            try:
+                session, channel = self._pool.open_channel(self._key, self._arguments, command, timeout)
+            except Exception as e:    # ConnectionError, socket errors, and SSHException from paramiko
+                print("opening channel error")
+                self._error = e
+                return None
+            if channel:
+                self._owners[channel] = session
+                self.add_channel(channel)
+                return channel
+            self._error = session.get_error()
+        # return None
+
+    def close_channel(self, channel):
+        """
+        This method is used to close a channel of the lease, and give back its reference on the pooled session.
+        """
+        session = self._owners.pop(channel, None)
+        if session is None:
+            return False
+        session.close_channel(channel)
+        self.remove_channel(channel)
+        self._pool.release(session)
+        return True
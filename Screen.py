@@ -0,0 +1,636 @@
+"""
+Qt independent model of the terminal screen.
+The screen is a grid of cells, every cell is a codepoint and an interned attribute id.
+"""
+from array import array
+from sys import byteorder
+from itertools import groupby
+from Parser import PRINT, EXECUTE, CSI_DISPATCH, ESC_DISPATCH, OSC_DISPATCH
+
+
+# Attribute flags
+BOLD = 0x01
+FAINT = 0x02
+ITALIC = 0x04
+UNDERLINE = 0x08
+BLINK = 0x10
+INVERSE = 0x20
+HIDDEN = 0x40
+STRIKE = 0x80
+
+# Colors are stored as integers: DEFAULT_COLOR, a palette index (0 - 255) or TRUE_COLOR | 0xRRGGBB
+DEFAULT_COLOR = -1
+TRUE_COLOR = 0x1000000
+
+DEFAULT_ATTR = 0    # Id of (DEFAULT_COLOR, DEFAULT_COLOR, 0)
+BLANK = 0x20        # Codepoint of an empty cell
+
+CELL_ENCODING = 'utf-32-le' if byteorder == 'little' else 'utf-32-be'    # Same layout as array('I')
+
+_SGR_SET = {1: BOLD, 2: FAINT, 3: ITALIC, 4: UNDERLINE, 5: BLINK, 6: BLINK, 7: INVERSE, 8: HIDDEN, 9: STRIKE}
+_SGR_RESET = {21: BOLD | FAINT, 22: BOLD | FAINT, 23: ITALIC, 24: UNDERLINE, 25: BLINK, 27: INVERSE, 28: HIDDEN,
+              29: STRIKE}
+
+
+def line_end(chars, attrs):
+    """
+    This function is used to find the length of a line without its trailing blanks.
+    :return the index after the last cell that is not a blank with default attribute
+    """
+    end = len(chars)
+    while end and chars[end - 1] == BLANK and attrs[end - 1] == DEFAULT_ATTR:
+        end -= 1
+    return end
+
+
+def line_runs(chars, attrs, end):
+    """
+    This function is used to group the first [end] cells of a line into runs of the same attribute.
+    :return list of (text, attribute id) tuples
+    """
+    text = chars[:end].tobytes().decode(CELL_ENCODING)
+    runs = []
+    start = 0
+    for attr_id, cells in groupby(attrs[:end]):
+        count = sum(1 for _ in cells)
+        runs.append((text[start:start + count], attr_id))
+        start += count
+    return runs
+
+
+class Attributes:
+    def __init__(self):
+        """
+        This Class is used to intern the attribute tuples (foreground, background, flags) to small integer ids.
+        """
+        self._ids = {}
+        self._attributes = []
+        self.intern((DEFAULT_COLOR, DEFAULT_COLOR, 0))
+
+    def __len__(self):
+        return len(self._attributes)
+
+    def intern(self, attribute):
+        attr_id = self._ids.get(attribute)
+        if attr_id is None:
+            attr_id = len(self._attributes)
+            self._ids[attribute] = attr_id
+            self._attributes.append(attribute)
+        return attr_id
+
+    def get(self, attr_id):
+        return self._attributes[attr_id]
+
+
+class Screen:
+    TAB_SIZE = 8
+    SCROLL_LIMIT = 64    # Maximum number of recorded row shifts per frame, beyond it the whole screen is repainted
+
+    def __init__(self, width=80, height=24, attributes=None):
+        """
+        This Class is used to keep the state of the terminal screen, independent from the GUI.
+        :param
+            width: Number of columns
+            height: Number of rows
+            attributes: Attributes table, shared with the scrollback
+        """
+        self.width = width
+        self.height = height
+        self.attributes = attributes if attributes else Attributes()
+        self._chars = []
+        self._attrs = []
+        self._inactive = ([], [])    # Rows of the buffer not shown, primary or alternate
+        self._dirty = bytearray(height)
+        self._scrolls = []
+        self._history = []
+        self._title_handler = None
+        self._bell_handler = None
+        self.reset()
+
+    def reset(self):
+        """
+        This method is used to return the screen to its initial state ( RIS ).
+        The lines scrolled off the screen and not taken yet stay in the history, see take_history.
+        """
+        self._chars = [self._blank_chars() for _ in range(self.height)]
+        self._attrs = [self._blank_attrs() for _ in range(self.height)]
+        self._inactive = ([self._blank_chars() for _ in range(self.height)],
+                          [self._blank_attrs() for _ in range(self.height)])
+        self.alternate_screen = False
+        self._dirty = bytearray(b'\x01' * self.height)
+        self._scrolls = []
+        self.x = 0
+        self.y = 0
+        self.top = 0
+        self.bottom = self.height - 1
+        self._wrap_pending = False
+        self._fg = DEFAULT_COLOR
+        self._bg = DEFAULT_COLOR
+        self._flags = 0
+        self._attr = DEFAULT_ATTR
+        self._saved_cursor = (0, 0, DEFAULT_COLOR, DEFAULT_COLOR, 0)
+        self._inactive_saved_cursor = self._saved_cursor    # Every buffer has its own saved cursor, like xterm
+        self.title = ''
+        self.autowrap = True
+        self.newline_mode = False
+        self.cursor_visible = True
+        self.application_cursor_mode = False
+        self.bracketed_paste_mode = False
+        self.application_keypad_mode = False
+
+    def _blank_chars(self):
+        return array('I', [BLANK]) * self.width
+
+    def _blank_attrs(self, attr=DEFAULT_ATTR):
+        return array('I', [attr]) * self.width
+
+    def set_title_handler(self, handler):
+        self._title_handler = handler
+
+    def set_bell_handler(self, handler):
+        self._bell_handler = handler
+
+    def get_line(self, y):
+        """
+        :return the codepoints and attribute ids arrays of row y
+        """
+        return self._chars[y], self._attrs[y]
+
+    def get_line_text(self, y):
+        return self._chars[y].tobytes().decode(CELL_ENCODING)
+
+    def line_end(self, y):
+        """
+        :return the index after the last cell of row y that is not a blank with default attribute
+        """
+        return line_end(self._chars[y], self._attrs[y])
+
+    def take_dirty(self):
+        """
+        This method is used by the renderer to collect the changed rows.
+        :return list of the dirty row numbers, the flags are cleared
+        """
+        dirty = [y for y in range(self.height) if self._dirty[y]]
+        self._dirty = bytearray(self.height)
+        return dirty
+
+    def take_scrolls(self):
+        """
+        This method is used by the renderer to collect the row shifts, to move the painted rows instead of
+        repainting them. The dirty flags move with the rows, they apply after the shifts.
+        :return list of (top, bottom, count): the rows [top, bottom] moved up by count rows (down if count < 0),
+                or None if there were too many shifts and every row is dirty
+        """
+        scrolls = self._scrolls
+        self._scrolls = []
+        return scrolls
+
+    def _record_scroll(self, top, bottom, count):
+        scrolls = self._scrolls
+        if scrolls is None:
+            return
+        if scrolls and scrolls[-1][:2] == (top, bottom) and (scrolls[-1][2] > 0) == (count > 0):
+            # Successive shifts of the same region in the same direction are merged
+            size = bottom - top + 1
+            scrolls[-1] = (top, bottom, max(-size, min(scrolls[-1][2] + count, size)))
+        elif len(scrolls) < self.SCROLL_LIMIT:
+            scrolls.append((top, bottom, count))
+        else:
+            self._scrolls = None
+            self.set_dirty()
+
+    def take_history(self):
+        """
+        This method is used by the renderer to collect the rows that scrolled off the top of the screen.
+        :return list of (codepoints, attribute ids) arrays, oldest first
+        """
+        history = self._history
+        self._history = []
+        return history
+
+    def set_dirty(self, first=0, last=None):
+        last = self.height - 1 if last is None else last
+        for y in range(first, last + 1):
+            self._dirty[y] = 1
+
+    def process(self, actions):
+        """
+        This method is used to apply the actions emitted by the Parser.
+        """
+        for action in actions:
+            kind = action[0]
+            if kind == PRINT:
+                self.draw(action[1])
+            elif kind == EXECUTE:
+                self.execute(action[1])
+            elif kind == CSI_DISPATCH:
+                self.csi_dispatch(action[1], action[2], action[3])
+            elif kind == ESC_DISPATCH:
+                self.esc_dispatch(action[1], action[2])
+            elif kind == OSC_DISPATCH:
+                self.osc_dispatch(action[1])
+
+    """ Printing """
+    def draw(self, text):
+        """
+        This method is used to write a printable run at the cursor position, wrapping at the right margin.
+        """
+        width = self.width
+        while text:
+            if self._wrap_pending:
+                self._wrap_pending = False
+                if self.autowrap:
+                    self.x = 0
+                    self.index()
+            x = self.x
+            count = min(width - x, len(text))
+            cells = array('I')
+            cells.frombytes(text[:count].encode(CELL_ENCODING, 'replace'))
+            text = text[count:]
+            self._chars[self.y][x:x + count] = cells
+            self._attrs[self.y][x:x + count] = array('I', [self._attr]) * count
+            self._dirty[self.y] = 1
+            x += count
+            if x >= width:
+                self.x = width - 1
+                self._wrap_pending = True
+            else:
+                self.x = x
+
+    def execute(self, char):
+        """
+        This method is used to apply a single control character (C0).
+        """
+        if char == '\n' or char == '\x0b' or char == '\x0c':    # LF, VT, FF
+            if self.newline_mode:
+                self.x = 0
+            self.index()
+        elif char == '\r':                                       # CR
+            self.x = 0
+        elif char == '\x08':                                     # BS
+            self.x = max(self.x - 1, 0)
+        elif char == '\t':                                       # TAB
+            self.x = min((self.x // self.TAB_SIZE + 1) * self.TAB_SIZE, self.width - 1)
+        elif char == '\x07':                                     # BEL
+            if self._bell_handler:
+                self._bell_handler()
+            return
+        else:
+            return
+        self._wrap_pending = False
+
+    """ Cursor and scrolling """
+    def index(self):
+        """
+        This method is used to move the cursor down one line, the scroll region scrolls up at its bottom margin.
+        """
+        if self.y == self.bottom:
+            self.scroll_up(1)
+        elif self.y < self.height - 1:
+            self.y += 1
+
+    def reverse_index(self):
+        """
+        This method is used to move the cursor up one line, the scroll region scrolls down at its top margin.
+        """
+        if self.y == self.top:
+            self.scroll_down(1)
+        elif self.y > 0:
+            self.y -= 1
+
+    def scroll_up(self, count=1, top=None, bottom=None, history=True):
+        """
+        This method is used to shift the rows [top, bottom] up, blank rows enter at the bottom.
+        The rows are moved by reference, only the new rows are dirty.
+        :param
+            count: Number of rows
+            top: First row (default = top margin of the scroll region)
+            bottom: Last row (default = bottom margin of the scroll region)
+            history: Keep the rows leaving the top of the screen as history
+        """
+        top = self.top if top is None else top
+        bottom = self.bottom if bottom is None else bottom
+        count = min(count, bottom - top + 1)
+        if count <= 0:
+            return
+        history = history and top == 0 and not self.alternate_screen    # Full screen applications have no history
+        erase_attr = self._erase_attr()
+        for _ in range(count):
+            chars = self._chars.pop(top)
+            attrs = self._attrs.pop(top)
+            del self._dirty[top]
+            if history:
+                self._history.append((chars, attrs))
+            self._chars.insert(bottom, self._blank_chars())
+            self._attrs.insert(bottom, self._blank_attrs(erase_attr))
+            self._dirty.insert(bottom, 1)
+        self._record_scroll(top, bottom, count)
+
+    def scroll_down(self, count=1, top=None, bottom=None):
+        """
+        This method is used to shift the rows [top, bottom] down, blank rows enter at the top.
+        """
+        top = self.top if top is None else top
+        bottom = self.bottom if bottom is None else bottom
+        count = min(count, bottom - top + 1)
+        if count <= 0:
+            return
+        erase_attr = self._erase_attr()
+        for _ in range(count):
+            del self._chars[bottom]
+            del self._attrs[bottom]
+            del self._dirty[bottom]
+            self._chars.insert(top, self._blank_chars())
+            self._attrs.insert(top, self._blank_attrs(erase_attr))
+            self._dirty.insert(top, 1)
+        self._record_scroll(top, bottom, -count)
+
+    def insert_lines(self, count=1):
+        """
+        This method is used to insert blank lines at the cursor row, the rows below move down in the scroll region.
+        """
+        if self.top <= self.y <= self.bottom:
+            self.scroll_down(count, self.y, self.bottom)
+            self.x = 0
+            self._wrap_pending = False
+
+    def delete_lines(self, count=1):
+        """
+        This method is used to delete lines at the cursor row, the rows below move up in the scroll region.
+        """
+        if self.top <= self.y <= self.bottom:
+            self.scroll_up(count, self.y, self.bottom, history=False)
+            self.x = 0
+            self._wrap_pending = False
+
+    def set_scroll_region(self, top, bottom):
+        if 0 <= top < bottom < self.height:
+            self.top = top
+            self.bottom = bottom
+            self.move_to(0, 0)
+
+    def move_to(self, x, y):
+        self.x = min(max(x, 0), self.width - 1)
+        self.y = min(max(y, 0), self.height - 1)
+        self._wrap_pending = False
+
+    def switch_screen(self, alternate, clear=False):
+        """
+        This method is used to show the alternate or the primary buffer, the buffers are swapped without copy.
+        :param
+            alternate: Show the alternate buffer, otherwise the primary buffer
+            clear: Blank the alternate buffer, when entering it or before leaving it
+        """
+        if alternate == self.alternate_screen:
+            if alternate and clear:
+                self.erase_in_display(2)
+            return
+        if self.alternate_screen and clear:
+            self._clear_rows(self._chars, self._attrs)
+        self._chars, self._attrs, self._inactive = self._inactive[0], self._inactive[1], (self._chars, self._attrs)
+        self._saved_cursor, self._inactive_saved_cursor = self._inactive_saved_cursor, self._saved_cursor
+        self.alternate_screen = alternate
+        if alternate and clear:
+            self._clear_rows(self._chars, self._attrs)
+        self._wrap_pending = False
+        self.set_dirty()
+
+    def _clear_rows(self, chars, attrs):
+        for y in range(self.height):
+            chars[y] = self._blank_chars()
+            attrs[y] = self._blank_attrs()
+
+    def save_cursor(self):
+        self._saved_cursor = (self.x, self.y, self._fg, self._bg, self._flags)
+
+    def restore_cursor(self):
+        x, y, self._fg, self._bg, self._flags = self._saved_cursor
+        self._attr = self.attributes.intern((self._fg, self._bg, self._flags))
+        self.move_to(x, y)
+
+    """ Erasing """
+    def _erase_attr(self):
+        # Erased cells keep the current background color only
+        if self._bg == DEFAULT_COLOR:
+            return DEFAULT_ATTR
+        return self.attributes.intern((DEFAULT_COLOR, self._bg, 0))
+
+    def erase(self, y, first, last):
+        """
+        This method is used to blank the cells [first, last) of row y.
+        """
+        count = last - first
+        if count > 0:
+            self._chars[y][first:last] = array('I', [BLANK]) * count
+            self._attrs[y][first:last] = array('I', [self._erase_attr()]) * count
+            self._dirty[y] = 1
+
+    def erase_in_display(self, mode):
+        if mode == 0:      # Erase Below (from cursor down)
+            self.erase(self.y, self.x, self.width)
+            rows = range(self.y + 1, self.height)
+        elif mode == 1:    # Erase Above (from cursor up)
+            self.erase(self.y, 0, self.x + 1)
+            rows = range(0, self.y)
+        elif mode == 2 or mode == 3:    # Erase All
+            rows = range(self.height)
+        else:
+            return
+        for y in rows:
+            self.erase(y, 0, self.width)
+
+    def erase_in_line(self, mode):
+        if mode == 0:      # Clear from cursor to end of line
+            self.erase(self.y, self.x, self.width)
+        elif mode == 1:    # Clear from cursor to start of line
+            self.erase(self.y, 0, self.x + 1)
+        elif mode == 2:    # Clear entire line
+            self.erase(self.y, 0, self.width)
+
+    def insert_characters(self, count):
+        chars, attrs = self._chars[self.y], self._attrs[self.y]
+        count = min(count, self.width - self.x)
+        chars[self.x:] = array('I', [BLANK]) * count + chars[self.x:self.width - count]
+        attrs[self.x:] = array('I', [self._erase_attr()]) * count + attrs[self.x:self.width - count]
+        self._dirty[self.y] = 1
+
+    def delete_characters(self, count):
+        chars, attrs = self._chars[self.y], self._attrs[self.y]
+        count = min(count, self.width - self.x)
+        chars[self.x:] = chars[self.x + count:] + array('I', [BLANK]) * count
+        attrs[self.x:] = attrs[self.x + count:] + array('I', [self._erase_attr()]) * count
+        self._dirty[self.y] = 1
+
+    """ Graphic rendition """
+    def select_graphic_rendition(self, params):
+        fg, bg, flags = self._fg, self._bg, self._flags
+        params = params or (0,)
+        i = 0
+        while i < len(params):
+            code = params[i]
+            if code == 0:
+                fg, bg, flags = DEFAULT_COLOR, DEFAULT_COLOR, 0
+            elif code in _SGR_SET:
+                flags |= _SGR_SET[code]
+            elif code in _SGR_RESET:
+                flags &= ~_SGR_RESET[code]
+            elif 30 <= code <= 37:
+                fg = code - 30
+            elif 40 <= code <= 47:
+                bg = code - 40
+            elif 90 <= code <= 97:       # Bright foreground
+                fg = code - 90 + 8
+            elif 100 <= code <= 107:     # Bright background
+                bg = code - 100 + 8
+            elif code == 39:
+                fg = DEFAULT_COLOR
+            elif code == 49:
+                bg = DEFAULT_COLOR
+            elif code == 38 or code == 48:
+                # Extended colors: 38;5;{index} or 38;2;{r};{g};{b}
+                color = None
+                if i + 2 < len(params) and params[i + 1] == 5:
+                    color = min(params[i + 2], 255)
+                    i += 2
+                elif i + 4 < len(params) and params[i + 1] == 2:
+                    red, green, blue = [min(c, 255) for c in params[i + 2:i + 5]]
+                    color = TRUE_COLOR | (red << 16) | (green << 8) | blue
+                    i += 4
+                if color is not None:
+                    if code == 38:
+                        fg = color
+                    else:
+                        bg = color
+            i += 1
+        self._fg, self._bg, self._flags = fg, bg, flags
+        self._attr = self.attributes.intern((fg, bg, flags))
+
+    """ Control functions """
+    def csi_dispatch(self, final, params, intermediates):
+        """
+        This method is used to apply a complete control sequence ( CSI + parameters + final character ).
+        :param
+            final: The final character of the sequence
+            params: Tuple of integer parameters, missing parameters are 0
+            intermediates: The private marker and intermediate characters
+        """
+        count = max(params[0], 1) if params else 1
+
+        if intermediates:
+            if intermediates == '?':
+                self.set_private_modes(params, final == 'h')
+            return
+
+        if final == 'm':                     # SGR - Select Graphic Rendition
+            self.select_graphic_rendition(params)
+        elif final == 'H' or final == 'f':   # CUP - Cursor Position [row;column] (default = [1,1])
+            col = max(params[1], 1) if len(params) > 1 else 1
+            self.move_to(col - 1, count - 1)
+        elif final == 'A':                   # CUU - Cursor Up
+            self.move_to(self.x, self.y - count)
+        elif final == 'B':                   # CUD - Cursor Down
+            self.move_to(self.x, self.y + count)
+        elif final == 'C':                   # CUF - Cursor Forward
+            self.move_to(self.x + count, self.y)
+        elif final == 'D':                   # CUB - Cursor Backward
+            self.move_to(self.x - count, self.y)
+        elif final == 'E':                   # CNL - Cursor Next Line
+            self.move_to(0, self.y + count)
+        elif final == 'F':                   # CPL - Cursor Previous Line
+            self.move_to(0, self.y - count)
+        elif final == 'G' or final == '`':   # CHA - Cursor Character Absolute
+            self.move_to(count - 1, self.y)
+        elif final == 'd':                   # VPA - Line Position Absolute
+            self.move_to(self.x, count - 1)
+        elif final == 'J':                   # ED - Erase in Display
+            self.erase_in_display(params[0] if params else 0)
+        elif final == 'K':                   # EL - Erase in Line
+            self.erase_in_line(params[0] if params else 0)
+        elif final == 'X':                   # ECH - Erase Characters
+            self.erase(self.y, self.x, min(self.x + count, self.width))
+        elif final == '@':                   # ICH - Insert Characters
+            self.insert_characters(count)
+        elif final == 'P':                   # DCH - Delete Characters
+            self.delete_characters(count)
+        elif final == 'L':                   # IL - Insert Lines
+            self.insert_lines(count)
+        elif final == 'M':                   # DL - Delete Lines
+            self.delete_lines(count)
+        elif final == 'S':                   # SU - Scroll Up
+            self.scroll_up(count)
+        elif final == 'T':                   # SD - Scroll Down
+            self.scroll_down(count)
+        elif final == 'r':                   # DECSTBM - Set Top and Bottom Margins [top;bottom] (default = screen)
+            bottom = params[1] if len(params) > 1 and params[1] else self.height
+            self.set_scroll_region(count - 1, min(bottom, self.height) - 1)
+        elif final == 's':                   # Save cursor
+            self.save_cursor()
+        elif final == 'u':                   # Restore cursor
+            self.restore_cursor()
+        elif final == 'h' or final == 'l':
+            if 20 in params:                 # LNM - Automatic Newline
+                self.newline_mode = final == 'h'
+
+    def set_private_modes(self, params, value):
+        """
+        This method is used to apply DECSET ( <ESC>[?{value}h ) and DECRST ( <ESC>[?{value}l ).
+        """
+        for mode in params:
+            if mode == 1:        # Cursor keys in application mode
+                self.application_cursor_mode = value
+            elif mode == 7:      # Auto-wrap mode
+                self.autowrap = value
+            elif mode == 25:     # Show cursor
+                self.cursor_visible = value
+            elif mode == 2004:   # Bracketed paste
+                self.bracketed_paste_mode = value
+            elif mode == 47:     # Alternate screen buffer
+                self.switch_screen(value)
+            elif mode == 1047:   # Alternate screen buffer, cleared when leaving it
+                self.switch_screen(value, clear=not value)
+            elif mode == 1049:   # Save cursor and switch to the cleared alternate screen buffer, or back and restore
+                if value:
+                    self.save_cursor()
+                    self.switch_screen(True, clear=True)
+                else:
+                    self.switch_screen(False)
+                    self.restore_cursor()
+
+    def esc_dispatch(self, final, intermediates):
+        """
+        This method is used to apply an escape sequence ( ESC + final character ).
+        """
+        if intermediates:
+            return
+        if final == '=':      # Set keypad to application mode
+            self.application_keypad_mode = True
+        elif final == '>':    # Set keypad to normal numeric mode
+            self.application_keypad_mode = False
+        elif final == 'D':    # IND - Index
+            self.index()
+            self._wrap_pending = False
+        elif final == 'E':    # NEL - Next Line
+            self.x = 0
+            self.index()
+            self._wrap_pending = False
+        elif final == 'M':    # RI - Reverse Index
+            self.reverse_index()
+            self._wrap_pending = False
+        elif final == '7':    # DECSC - Save Cursor
+            self.save_cursor()
+        elif final == '8':    # DECRC - Restore Cursor
+            self.restore_cursor()
+        elif final == 'c':    # RIS - Reset to Initial State
+            newline_mode = self.newline_mode
+            self.reset()
+            self.newline_mode = newline_mode
+
+    def osc_dispatch(self, string):
+        """
+        This method is used to apply an operating system command ( <ESC>]{value};{string} + ST|BEL ).
+        """
+        code, _, text = string.partition(';')
+        if code in ('0', '2'):    # Update Terminal Title, ignore all other codes
+            self.title = text
+            if self._title_handler:
+                self._title_handler(text)
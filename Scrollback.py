@@ -0,0 +1,223 @@
+"""
+Scrollback store for the lines that scrolled off the top of the screen.
+Every line is kept as a single bytes object:
+    number of runs (uint16) + runs array (length, attribute id) + UTF-8 text
+Lines with the default attribute only are stored without runs.
+With an Archive, the lines dropped from the ring are spilled to disk and stay reachable.
+"""
+from array import array
+from struct import Struct
+from sys import getsizeof
+from threading import Lock
+from Screen import DEFAULT_ATTR, CELL_ENCODING, line_end, line_runs
+
+
+_HEADER = Struct('<H')
+_RUN_SIZE = 2 * array('I').itemsize
+
+
+def encode_line(runs):
+    """
+    This function is used to encode a line given as a list of (text, attribute id) runs.
+    """
+    text = ''.join([run[0] for run in runs])
+    if len(runs) == 1 and runs[0][1] == DEFAULT_ATTR or not runs:
+        return _HEADER.pack(0) + text.encode('utf-8')
+    lengths = array('I')
+    for run_text, attr_id in runs:
+        lengths.append(len(run_text))
+        lengths.append(attr_id)
+    return _HEADER.pack(len(runs)) + lengths.tobytes() + text.encode('utf-8')
+
+
+def decode_line(entry):
+    """
+    This function is used to decode a stored line.
+    :return list of (text, attribute id) runs
+    """
+    count = _HEADER.unpack_from(entry)[0]
+    start = _HEADER.size + count * _RUN_SIZE
+    text = entry[start:].decode('utf-8')
+    if not count:
+        return [(text, DEFAULT_ATTR)] if text else []
+    lengths = array('I')
+    lengths.frombytes(entry[_HEADER.size:start])
+    runs = []
+    position = 0
+    for i in range(0, len(lengths), 2):
+        runs.append((text[position:position + lengths[i]], lengths[i + 1]))
+        position += lengths[i]
+    return runs
+
+
+def decode_text(entry):
+    """
+    This function is used to decode the text of a stored line, without its attributes.
+    """
+    return entry[_HEADER.size + _HEADER.unpack_from(entry)[0] * _RUN_SIZE:].decode('utf-8')
+
+
+class Scrollback:
+    MAX_LINES = 100000    # Default line cap
+
+    def __init__(self, max_lines=MAX_LINES, max_bytes=None):
+        """
+        This Class is used to keep the scrollback lines in a ring, the oldest lines are dropped first.
+        :param
+            max_lines: Maximum number of lines
+            max_bytes: Maximum memory used by the lines [bytes] (default = no limit)
+        """
+        self._max_lines = max_lines
+        self._max_bytes = max_bytes
+        self._lines = []
+        self._start = 0        # Index of the oldest line in the ring
+        self._count = 0
+        self._bytes = 0
+        self._dropped = 0      # Number of lines lost since the scrollback was created
+        self._archive = None
+        self._lock = Lock()    # The lines can be read by a search thread
+
+    def __len__(self):
+        return self._count + (len(self._archive) if self._archive is not None else 0)
+
+    def set_archive(self, archive):
+        """
+        This method is used to keep the lines dropped from the ring in an Archive, instead of losing them.
+        :param archive: The Archive, or None to stop archiving
+        The lines of the replaced archive are lost, they are counted as dropped so the line numbers do not change.
+        """
+        with self._lock:
+            old_archive = self._archive
+            if old_archive is not None:
+                self._dropped += len(old_archive)
+            self._archive = archive
+        if old_archive is not None:
+            old_archive.close()
+
+    def get_archive(self):
+        return self._archive
+
+    def clear(self):
+        with self._lock:
+            self._dropped += len(self)
+            if self._archive is not None:
+                self._archive.clear()
+            self._lines = []
+            self._start = 0
+            self._count = 0
+            self._bytes = 0
+
+    def set_limits(self, max_lines, max_bytes=None):
+        """
+        This method is used to change the line and memory caps, the oldest lines are dropped if needed.
+        """
+        with self._lock:
+            lines = [self._lines[(self._start + i) % len(self._lines)] for i in range(self._count)]
+            if len(lines) > max_lines:
+                for entry in lines[:len(lines) - max_lines]:
+                    self._spill(entry)
+                lines = lines[len(lines) - max_lines:]
+            self._max_lines = max_lines
+            self._max_bytes = max_bytes
+            self._lines = lines
+            self._start = 0
+            self._count = len(lines)
+            self._bytes = sum(getsizeof(line) for line in lines)
+            self._trim()
+
+    def get_limits(self):
+        return self._max_lines, self._max_bytes
+
+    def get_dropped(self):
+        """
+        :return the number of lines lost from the head of the scrollback, the absolute number of line 0
+        """
+        return self._dropped
+
+    def memory_usage(self):
+        """
+        :return the memory used by the scrollback [bytes]
+        """
+        archive_usage = self._archive.memory_usage() if self._archive is not None else 0
+        return self._bytes + getsizeof(self._lines) + archive_usage
+
+    def append(self, chars, attrs, end=None):
+        """
+        This method is used to add a screen line, given as codepoints and attribute ids arrays.
+        :param end: Number of cells to keep (default = without the trailing blanks)
+        """
+        end = line_end(chars, attrs) if end is None else end
+        if attrs.count(DEFAULT_ATTR) == len(attrs):    # Plain line, no runs
+            self.append_entry(_HEADER.pack(0) + chars[:end].tobytes().decode(CELL_ENCODING).encode('utf-8'))
+        else:
+            self.append_entry(encode_line(line_runs(chars, attrs, end)))
+
+    def append_entry(self, entry):
+        """
+        This method is used to add an encoded line.
+        """
+        with self._lock:
+            if self._count == self._max_lines:
+                self._drop_oldest()
+            index = (self._start + self._count) % self._max_lines
+            if index == len(self._lines):
+                self._lines.append(entry)
+            else:
+                self._lines[index] = entry
+            self._count += 1
+            self._bytes += getsizeof(entry)
+            self._trim()
+
+    def _trim(self):
+        if self._max_bytes:
+            while self._count > 1 and self._bytes > self._max_bytes:
+                self._drop_oldest()
+
+    def _drop_oldest(self):
+        entry = self._lines[self._start]
+        self._lines[self._start] = None
+        self._bytes -= getsizeof(entry)
+        self._start = (self._start + 1) % self._max_lines
+        self._count -= 1
+        self._spill(entry)
+
+    def _spill(self, entry):
+        if self._archive is not None:
+            self._archive.append(entry)
+        else:
+            self._dropped += 1
+
+    def get_entry(self, index):
+        with self._lock:
+            return self._get_entry(index)
+
+    def _get_entry(self, index):
+        if self._archive is not None:
+            archived = len(self._archive)
+            if index < archived:
+                return self._archive.get_entry(index)
+            index -= archived
+        if not 0 <= index < self._count:
+            raise IndexError('scrollback index out of range')
+        return self._lines[(self._start + index) % self._max_lines]
+
+    def get_text_by_number(self, number):
+        """
+        This method is used to read a line by its absolute number, that does not change when old lines are lost.
+        :param number: The line number, counted from the first line since the scrollback was created
+        :return the line text, or None if the line is lost
+        """
+        with self._lock:
+            index = number - self._dropped
+            if not 0 <= index < len(self):
+                return None
+            return decode_text(self._get_entry(index))
+
+    def get_line(self, index):
+        """
+        :return list of (text, attribute id) runs of line [index], 0 is the oldest line
+        """
+        return decode_line(self.get_entry(index))
+
+    def get_text(self, index):
+        return decode_text(self.get_entry(index))
@@ -0,0 +1,143 @@
+"""
+Search in the scrollback store.
+The lines are indexed in blocks, every block keeps a bitmap of the hashed trigrams of its lowercase text.
+A literal search only scans the blocks whose bitmap holds all the trigrams of the pattern.
+"""
+from re import compile, escape, IGNORECASE
+from threading import Lock
+from collections import deque
+
+
+class SearchIndex:
+    BLOCK_LINES = 64      # Number of lines per block
+    BITMAP_BITS = 8192    # Size of the trigram bitmap of a block
+
+    def __init__(self, scrollback):
+        """
+        This Class is used to keep the trigram index of a Scrollback, it is updated incrementally.
+        Appending to the scrollback does not index: the index catches up lazily, when update is called by a search.
+        :param scrollback: The indexed Scrollback
+        """
+        self._scrollback = scrollback
+        self._blocks = deque()        # Bitmaps of the completed blocks
+        self._first_block = 0         # Number of the first block in _blocks
+        self._current = bytearray(self.BITMAP_BITS // 8)
+        self._indexed = 0             # Number of the next line to index
+        self._lock = Lock()
+
+    def get_indexed(self):
+        return self._indexed
+
+    @classmethod
+    def trigram_bits(cls, text):
+        """
+        :return set of the bitmap positions of the trigrams of a lowercase text
+        """
+        mask = cls.BITMAP_BITS - 1
+        return {hash(text[i:i + 3]) & mask for i in range(len(text) - 2)}
+
+    def update(self):
+        """
+        This method is used to index the lines added since the last update, and forget the lost lines.
+        """
+        with self._lock:
+            scrollback = self._scrollback
+            first = scrollback.get_dropped()
+            end = first + len(scrollback)
+            if self._indexed < first or self._indexed > end:
+                # Lines were lost before they were indexed, or the scrollback was cleared
+                self._blocks.clear()
+                self._first_block = first // self.BLOCK_LINES
+                self._current = bytearray(self.BITMAP_BITS // 8)
+                self._indexed = first
+            while self._blocks and self._first_block < first // self.BLOCK_LINES:
+                self._blocks.popleft()
+                self._first_block += 1
+
+            for number in range(self._indexed, end):
+                text = scrollback.get_text_by_number(number)
+                if text:
+                    current = self._current
+                    for bit in self.trigram_bits(text.lower()):
+                        current[bit >> 3] |= 1 << (bit & 7)
+                self._indexed = number + 1
+                if self._indexed % self.BLOCK_LINES == 0:
+                    self._blocks.append(bytes(self._current))
+                    self._current = bytearray(self.BITMAP_BITS // 8)
+
+    def candidate_blocks(self, literal, reverse=True):
+        """
+        This method is used to find the blocks that can hold a literal.
+        :param
+            literal: The lowercase literal, or None to return every block
+            reverse: Return the newest block first
+        :return list of (first line number, end line number) of the candidate blocks
+        """
+        with self._lock:
+            bits = self.trigram_bits(literal) if literal and len(literal) >= 3 else ()
+            first = self._scrollback.get_dropped()
+            current_block = self._indexed // self.BLOCK_LINES
+            bitmaps = [(self._first_block + i, bitmap) for i, bitmap in enumerate(self._blocks)]
+            bitmaps.append((current_block, bytes(self._current)))
+            blocks = []
+            for block, bitmap in bitmaps:
+                if all(bitmap[bit >> 3] & (1 << (bit & 7)) for bit in bits):
+                    blocks.append((max(block * self.BLOCK_LINES, first),
+                                   min((block + 1) * self.BLOCK_LINES, self._indexed)))
+        return blocks[::-1] if reverse else blocks
+
+
+class Searcher:
+    def __init__(self, scrollback):
+        """
+        This Class is used to search the lines of a Scrollback, with plain, case insensitive or regex patterns.
+        """
+        self._scrollback = scrollback
+        self._index = SearchIndex(scrollback)
+
+    def get_index(self):
+        return self._index
+
+    def find(self, pattern, case_sensitive=False, regex=False, reverse=True, cancel=None, first_number=None,
+             end_number=None):
+        """
+        This method is used to find a pattern in the scrollback, the matches are generated lazily.
+        :param
+            pattern: The searched text, or regular expression if regex is True
+            case_sensitive: Match the letters case
+            regex: The pattern is a regular expression
+            reverse: Start with the newest line
+            cancel: threading.Event stopping the search when set
+            first_number, end_number: Only search the lines [first_number, end_number[ (default = every line)
+        :return generator of (line number, start, end), the line number is absolute (see Scrollback.get_dropped)
+        """
+        self._index.update()
+        expression = compile_pattern(pattern, case_sensitive, regex)
+        literal = None if regex else pattern.lower()
+        for first, end in self._index.candidate_blocks(literal, reverse):
+            if cancel and cancel.is_set():
+                return
+            if first_number is not None:
+                first = max(first, first_number)
+            if end_number is not None:
+                end = min(end, end_number)
+            numbers = range(end - 1, first - 1, -1) if reverse else range(first, end)
+            lines = ((number, self._scrollback.get_text_by_number(number)) for number in numbers)
+            for result in find_in_lines(expression, lines):
+                yield result
+
+
+def compile_pattern(pattern, case_sensitive=False, regex=False):
+    return compile(pattern if regex else escape(pattern), 0 if case_sensitive else IGNORECASE)
+
+
+def find_in_lines(expression, lines):
+    """
+    This function is used to find a compiled pattern in (line number, text) pairs.
+    :return generator of (line number, start, end), empty matches are skipped
+    """
+    for number, text in lines:
+        if text:
+            for found in expression.finditer(text):
+                if found.end() > found.start():
+                    yield number, found.start(), found.end()
@@ -0,0 +1,217 @@
+"""
+Transcript of a channel written to disk.
+The reading thread only appends the received bytes to a bounded queue. A writer thread collects the queued chunks
+into large buffered writes, strips the escape sequences in text mode, and rotates the log by size or age, with an
+optional gzip of the rotated files. When the disk can not keep up, the queue policy drops the new chunks (default)
+or blocks the reader.
+"""
+from threading import Thread, Condition
+from collections import deque
+from codecs import getincrementaldecoder
+from time import monotonic
+from os import path, remove, rename
+from shutil import copyfileobj
+from re import compile
+import gzip
+
+
+# Escape sequences: CSI, OSC / DCS / APC / PM strings, charset designations, and the other two characters sequences
+ESCAPE_SEQUENCE = compile(r'\x1b(?:\[[0-?]*[ -/]*[@-~]|[\]P_^X][^\x07\x1b]*(?:\x07|\x1b\\)|[()*+].|[ -/]*[0-~])')
+CONTROL_CHARS = compile(r'[\x00-\x08\x0b-\x1a\x1c-\x1f\x7f]')    # Except the tabs, the line feeds and ESC
+MAX_SEQUENCE = 4096    # An unterminated sequence longer than this is written as text [characters]
+
+
+def strip_escapes(text):
+    """
+    This function is used to convert terminal output to plain text: no escape sequences, no control characters.
+    """
+    return CONTROL_CHARS.sub('', ESCAPE_SEQUENCE.sub('', text.replace('\r\n', '\n')))
+
+
+class SessionLog:
+    QUEUE_SIZE = 8 * 1024 * 1024    # Maximum size of the queued chunks [bytes]
+    BATCH_SIZE = 65536              # The writer waits for this size, or BATCH_DELAY, before writing [bytes]
+    BATCH_DELAY = 0.05              # Maximum time a chunk waits for a batch [s]
+    FLUSH_INTERVAL = 1              # The written data reaches the file at least this often [s]
+    BUFFER_SIZE = 1024 * 1024       # Size of the file buffer [bytes]
+
+    def __init__(self, file_path, mode='raw', max_bytes=None, interval=None, backups=5, compress=False,
+                 queue_size=QUEUE_SIZE, policy='drop', encoding='utf-8'):
+        """
+        This Class is used to log the data received by a Connection, it is fed by Connection.set_session_log.
+        :param
+            file_path: The log file, it is appended to
+            mode: 'raw' to write the received bytes, or 'text' to write plain text with the escape sequences stripped
+            max_bytes: The log is rotated when it reaches this size [bytes] (default = no size rotation)
+            interval: The log is rotated when it is older than this time [s] (default = no time rotation)
+            backups: Number of rotated files kept: file_path.1 (the newest) to file_path.<backups>
+            compress: Compress the rotated files with gzip (file_path.1.gz ...)
+            queue_size: Maximum size of the data waiting for the writer thread [bytes]
+            policy: 'drop' the chunks received when the queue is full, or 'block' the reader until there is room
+            encoding: Encoding of the received data, used in text mode
+        """
+        if mode not in ('raw', 'text'):
+            raise ValueError('mode must be raw or text')
+        if policy not in ('drop', 'block'):
+            raise ValueError('policy must be drop or block')
+        self._path = file_path
+        self._mode = mode
+        self._max_bytes = max_bytes
+        self._interval = interval
+        self._backups = backups
+        self._compress = compress
+        self._queue_size = queue_size
+        self._policy = policy
+        self._decoder = getincrementaldecoder(encoding)('replace')
+        self._carry = ''          # Start of an escape sequence split between two batches
+        self._queue = deque()
+        self._pending = 0         # Number of queued bytes
+        self._dropped = 0         # Number of bytes dropped by the 'drop' policy
+        self._blocked = 0         # Number of readers waiting for room in the queue, with the 'block' policy
+        self._written = 0         # Number of bytes written to the current file
+        self._condition = Condition()
+        self._closed = False
+        self._file = None         # None when the log could not be reopened, the next batch tries again
+        self._opened = None       # Time the current file was opened
+        self._compressor = None   # Thread compressing the last rotated file
+        self._open()
+        self._thread = Thread(target=self._run, name='SessionLog')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def get_path(self):
+        return self._path
+
+    def get_pending(self):
+        return self._pending
+
+    def get_dropped(self):
+        """
+        :return the number of received bytes not logged, because the queue was full
+        """
+        return self._dropped
+
+    def record(self, raw_data):
+        """
+        This method is used to queue a received chunk, it can be called from any thread.
+        With the 'drop' policy it never waits: a chunk that does not fit in the queue is dropped.
+        :return False if the chunk was dropped
+        """
+        with self._condition:
+            if self._closed:
+                return False
+            if self._pending + len(raw_data) > self._queue_size:
+                if self._policy == 'drop':
+                    self._dropped += len(raw_data)
+                    return False
+                self._blocked += 1
+                self._condition.notify_all()    # Write now, do not wait for a batch
+                while self._pending and self._pending + len(raw_data) > self._queue_size and not self._closed:
+                    self._condition.wait()
+                self._blocked -= 1
+            self._queue.append(raw_data)
+            self._pending += len(raw_data)
+            if self._pending >= self.BATCH_SIZE:
+                self._condition.notify_all()
+        return True
+
+    def close(self):
+        """
+        This method is used to write the queued data, and close the log.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                # Wait for a full batch, the batch delay, or the periodic flush
+                deadline = monotonic() + (self.BATCH_DELAY if self._queue else self.FLUSH_INTERVAL)
+                while self._pending < self.BATCH_SIZE and not self._closed and not self._blocked:
+                    remaining = deadline - monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                    if self._queue and deadline - monotonic() > self.BATCH_DELAY:
+                        deadline = monotonic() + self.BATCH_DELAY
+                chunks = list(self._queue)
+                self._queue.clear()
+                self._pending = 0
+                closed = self._closed
+                self._condition.notify_all()    # Wake up the readers blocked on a full queue
+            try:
+                if self._file is None:
+                    self._open()
+                if chunks:
+                    self._write(b''.join(chunks), closed)
+                self._file.flush()
+                if self._interval and monotonic() - self._opened >= self._interval and self._written:
+                    self._rotate()
+            except Exception as e:    # The writer keeps running, or a reader blocked on a full queue would hang
+                print("session log error: %s" % e)
+            if closed:
+                if self._file:
+                    self._file.close()
+                if self._compressor:
+                    self._compressor.join()
+                return
+
+    def _write(self, data, final=False):
+        if self._mode == 'text':
+            text = self._carry + self._decoder.decode(data, final)
+            self._carry = ''
+            start = text.rfind('\x1b')
+            if start >= 0 and not final and len(text) - start < MAX_SEQUENCE and \
+                    not ESCAPE_SEQUENCE.match(text, start):
+                text, self._carry = text[:start], text[start:]    # Completed by the next batch
+            if text.endswith('\r'):    # Can be the first half of a '\r\n'
+                text, self._carry = text[:-1], '\r' + self._carry
+            data = strip_escapes(text).encode('utf-8')
+        self._file.write(data)
+        self._written += len(data)
+        if self._max_bytes and self._written >= self._max_bytes:    # Checked per batch, not per byte
+            self._rotate()
+
+    def _open(self):
+        self._file = open(self._path, 'ab', buffering=self.BUFFER_SIZE)
+        self._written = self._file.tell()
+        self._opened = monotonic()
+
+    def _rotate(self):
+        """
+        This method is used to move the log to file_path.1, shifting the older files, and start a new log.
+        The rotated file is compressed by a background thread, the writer goes on with the new log.
+        """
+        self._file.close()
+        self._file = None
+        if self._compressor:
+            self._compressor.join()    # file_path.1 is compressed before it is shifted
+            self._compressor = None
+        rotated = None
+        try:
+            suffix = '.gz' if self._compress else ''
+            for index in range(self._backups - 1, 0, -1):
+                source = '%s.%d%s' % (self._path, index, suffix)
+                if path.exists(source):
+                    rename(source, '%s.%d%s' % (self._path, index + 1, suffix))
+            if self._backups > 0:
+                rotated = '%s.1' % self._path
+                rename(self._path, rotated)
+            else:
+                remove(self._path)
+        finally:
+            self._open()    # Appends to the old log if it could not be moved
+        if self._compress and rotated:
+            self._compressor = Thread(target=self._compress_file, args=(rotated,), name='SessionLogCompressor')
+            self._compressor.daemon = True
+            self._compressor.start()
+
+    def _compress_file(self, rotated):
+        try:
+            with open(rotated, 'rb') as source, gzip.open(rotated + '.gz', 'wb') as target:
+                copyfileobj(source, target)
+            remove(rotated)
+        except OSError as e:
+            print("session log compression error: %s" % e)
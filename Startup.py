@@ -0,0 +1,111 @@
+"""
+Startup benchmark of the terminal: import time, time to the first paint, and time to the shell prompt.
+Usage:
+    python Startup.py                                   # Local shell (/bin/sh), the prompt is "$ "
+    python Startup.py --host 10.0.0.1 --username user --password secret --prompt "$ "
+    xvfb-run python Startup.py                          # Qt 4 has no offscreen platform, a headless machine needs Xvfb
+The import times are measured in fresh interpreters, so they are cold start times. The first paint and the prompt
+are measured in this process, from before importing the GUI modules, like a user starting main.py.
+"""
+from argparse import ArgumentParser
+from os import environ, path
+from subprocess import check_output, DEVNULL
+from sys import executable, platform
+from time import perf_counter
+
+
+IMPORTED_MODULES = ['Transport', 'Terminal', 'paramiko']
+
+
+def import_time(module, repeat=5):
+    """
+    This function is used to measure the import time of a module in new interpreters.
+    :return the median import time [s], or None if the module can not be imported
+    """
+    code = 'from time import perf_counter; start = perf_counter(); import %s; print(perf_counter() - start)' % module
+    times = []
+    for _ in range(repeat):
+        try:
+            output = check_output([executable, '-c', code], cwd=path.dirname(path.abspath(__file__)), stderr=DEVNULL)
+        except Exception:
+            return None
+        times.append(float(output))
+    times.sort()
+    return times[len(times) // 2]
+
+
+def startup(arguments):
+    """
+    This function is used to start a terminal as main.py does, and time its milestones.
+    :return dictionary of the times since the start [s], a milestone not reached is None
+    """
+    start = perf_counter()
+    from PyQt4.QtGui import QApplication
+    from PyQt4.QtCore import QObject, QEvent, QTimer, SIGNAL
+    from Terminal import QTerminal
+    imported = perf_counter()
+
+    application = QApplication([])
+    times = {'import': imported - start, 'first_paint': None, 'connected': None, 'prompt': None}
+
+    class PaintFilter(QObject):
+        def eventFilter(self, watched, event):
+            if event.type() == QEvent.Paint and times['first_paint'] is None:
+                times['first_paint'] = perf_counter() - start
+            return False
+
+    def on_connected(started):
+        if started:
+            times['connected'] = perf_counter() - start
+
+    def on_prompt(*args):
+        if times['prompt'] is None:
+            times['prompt'] = perf_counter() - start
+            application.quit()
+
+    if arguments.host:
+        from Transport import Session
+        session = Session()
+        start_arguments = {'server': arguments.host, 'username': arguments.username, 'password': arguments.password}
+    else:
+        from LocalBackground import LocalSession
+        session = LocalSession()
+        start_arguments = {'command': ['/bin/sh', '-i'], 'env': dict(environ, TERM='xterm', PS1=arguments.prompt)}
+    terminal = QTerminal(session=session)
+    paint_filter = PaintFilter()
+    terminal.viewport().installEventFilter(paint_filter)
+    QObject.connect(terminal.get_connection(), SIGNAL("connected(bool)"), on_connected)
+    terminal.add_trigger(arguments.prompt, on_prompt)
+    terminal.resize(1030, 670)
+    terminal.show()
+    terminal.start_session(**start_arguments)
+
+    QTimer.singleShot(int(arguments.timeout * 1000), application.quit)
+    application.exec_()
+    terminal.close()
+    return times
+
+
+def main():
+    parser = ArgumentParser(description='Benchmark the terminal startup.')
+    parser.add_argument('--host', help='SSH server (default = local shell)')
+    parser.add_argument('--username', default='', help='SSH username')
+    parser.add_argument('--password', default='', help='SSH password')
+    parser.add_argument('--prompt', default='$ ', help='text ending the shell prompt')
+    parser.add_argument('--timeout', type=float, default=30, help='maximum time to the prompt [s]')
+    parser.add_argument('--repeat', type=int, default=5, help='number of interpreters per import time')
+    arguments = parser.parse_args()
+    if platform.startswith('linux') and not environ.get('DISPLAY'):
+        parser.error('the terminal needs an X display, run the benchmark under xvfb-run on a headless machine')
+
+    times = startup(arguments)    # First, before the import times warm the disk cache
+    print('%-24s %10s' % ('milestone', 'time'))
+    for name in ('import', 'first_paint', 'connected', 'prompt'):
+        print('%-24s %10s' % (name, '%.1fms' % (times[name] * 1000) if times[name] is not None else '-'))
+    for module in IMPORTED_MODULES:
+        duration = import_time(module, arguments.repeat)
+        print('%-24s %10s' % ('import ' + module, '%.1fms' % (duration * 1000) if duration is not None else '-'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+"""
+Container of many terminals, in tabs that can be split.
+Only the visible terminals are rendered: the terminals of the hidden tabs keep parsing their output into their
+screen and scrollback, and are repainted once when their tab is shown again (see QTerminal.set_rendering).
+"""
+from PyQt4.QtGui import QTabWidget, QSplitter, QShortcut, QKeySequence
+from PyQt4.QtCore import Qt, SIGNAL
+from Terminal import QTerminal
+
+
+class QTerminalTabs(QTabWidget):
+    def __init__(self, master=None):
+        """
+        This Class is used to host terminals in tabs, every tab holds a splitter of one or more terminals.
+        Keys: Ctrl+Shift+T opens a tab like the current terminal, Ctrl+Shift+D splits it, Ctrl+Shift+W closes it,
+        Ctrl+PageDown / Ctrl+PageUp move to the next / previous tab.
+        :param master: The parent widget
+        """
+        super(QTerminalTabs, self).__init__(master)
+        self.master = master
+        self._starts = {}       # Terminal: (session factory, arguments, keyword arguments) it was started with
+        self._closing = False
+        self.setTabsClosable(True)
+        self.setMovable(True)
+        self.setDocumentMode(True)
+        self.setWindowTitle('Terminal')
+        QTabWidget.connect(self, SIGNAL("tabCloseRequested(int)"), self.close_tab)
+        QTabWidget.connect(self, SIGNAL("currentChanged(int)"), self._on_current_changed)
+
+        # Shortcuts, they are seen before the terminals get the keys
+        self._shortcuts = []
+        for keys, slot in (('Ctrl+Shift+T', self.duplicate_terminal),                        # New tab like the current
+                           ('Ctrl+Shift+D', lambda: self.duplicate_terminal(split=True)),    # Split the current one
+                           ('Ctrl+Shift+W', self.close_terminal),                            # Close the current one
+                           ('Ctrl+PgDown', lambda: self._move_tab(1)),                       # Next tab
+                           ('Ctrl+PgUp', lambda: self._move_tab(-1))):                       # Previous tab
+            shortcut = QShortcut(QKeySequence(keys), self)
+            shortcut.setContext(Qt.WidgetWithChildrenShortcut)
+            QShortcut.connect(shortcut, SIGNAL("activated()"), slot)
+            self._shortcuts.append(shortcut)
+
+    def add_terminal(self, session=None, connection=None, split=None, orientation=Qt.Horizontal):
+        """
+        This method is used to add a terminal in a new tab, or next to another terminal.
+        :param
+            session: The session of the terminal, see QTerminal
+            connection: The connection of the terminal, see QTerminal
+            split: The terminal split to hold the new one (default = open a new tab)
+            orientation: Qt.Horizontal or Qt.Vertical, direction of the split
+        :return the new QTerminal
+        """
+        terminal = QTerminal(session=session, connection=connection)
+        QTerminal.connect(terminal, SIGNAL("title_changed(QString)"), lambda title: self._set_title(terminal, title))
+        QTerminal.connect(terminal, SIGNAL("closed()"), lambda: self._remove_terminal(terminal))
+        if split is not None and self._get_splitter(split):
+            splitter = self._get_splitter(split)
+            if splitter.count() == 1:
+                splitter.setOrientation(orientation)
+            splitter.insertWidget(splitter.indexOf(split) + 1, terminal)
+        else:
+            splitter = QSplitter(orientation)
+            splitter.setChildrenCollapsible(False)
+            splitter.addWidget(terminal)
+            self.setCurrentIndex(self.addTab(splitter, terminal.windowTitle()))
+        terminal.setFocus()
+        return terminal
+
+    def open_terminal(self, factory, *args, **kwargs):
+        """
+        This method is used to add a terminal on a new session, and start the session in the background.
+        :param
+            factory: Creates the session, e.g. Pool.PooledSession to share the transports of the same host
+            args, kwargs: The arguments of session.start_session
+        :return the new QTerminal
+        """
+        split = kwargs.pop('split', None)
+        orientation = kwargs.pop('orientation', Qt.Horizontal)
+        terminal = self.add_terminal(factory(), split=split, orientation=orientation)
+        self._starts[terminal] = factory, args, kwargs
+        terminal.start_session(*args, **kwargs)
+        return terminal
+
+    def duplicate_terminal(self, terminal=None, split=False, orientation=Qt.Horizontal):
+        """
+        This method is used to open a terminal started like another one.
+        :param
+            terminal: The copied terminal (default = the current terminal)
+            split: Open the terminal next to the copied one, instead of a new tab
+            orientation: Direction of the split
+        :return the new QTerminal, or None if the terminal was not opened by open_terminal
+        """
+        terminal = terminal or self.current_terminal()
+        if terminal not in self._starts:
+            return None
+        factory, args, kwargs = self._starts[terminal]
+        return self.open_terminal(factory, *args, split=terminal if split else None, orientation=orientation,
+                                  **kwargs)
+
+    def current_terminal(self):
+        """
+        :return the focused terminal of the current tab, or its first terminal
+        """
+        splitter = self.currentWidget()
+        if not splitter:
+            return None
+        focused = splitter.focusWidget()
+        for index in range(splitter.count()):
+            if splitter.widget(index) is focused:
+                return focused
+        return splitter.widget(0)
+
+    def get_terminals(self):
+        terminals = []
+        for tab in range(self.count()):
+            splitter = self.widget(tab)
+            terminals.extend(splitter.widget(index) for index in range(splitter.count()))
+        return terminals
+
+    def close_terminal(self, terminal=None):
+        """
+        This method is used to close a terminal and its session, an empty tab is removed.
+        :param terminal: The closed terminal (default = the current terminal)
+        """
+        terminal = terminal or self.current_terminal()
+        if terminal:
+            terminal.close()    # Emits "closed()", see _remove_terminal
+
+    def close_tab(self, index):
+        splitter = self.widget(index)
+        for terminal in [splitter.widget(i) for i in range(splitter.count())]:
+            terminal.close()
+
+    def closeEvent(self, *args, **kwargs):
+        self._closing = True
+        for terminal in self.get_terminals():
+            terminal.close()
+        return QTabWidget.closeEvent(self, *args, **kwargs)
+
+    def _move_tab(self, step):
+        if self.count():
+            self.setCurrentIndex((self.currentIndex() + step) % self.count())
+
+    def _get_splitter(self, terminal):
+        for tab in range(self.count()):
+            if self.widget(tab).indexOf(terminal) >= 0:
+                return self.widget(tab)
+        return None
+
+    def _set_title(self, terminal, title):
+        splitter = self._get_splitter(terminal)
+        if splitter:
+            self.setTabText(self.indexOf(splitter), title)
+            if splitter is self.currentWidget():
+                self.setWindowTitle(title)
+
+    def _remove_terminal(self, terminal):
+        self._starts.pop(terminal, None)
+        splitter = self._get_splitter(terminal)
+        if not splitter:
+            return
+        terminal.hide()
+        terminal.setParent(None)
+        terminal.deleteLater()
+        if splitter.count() == 0:
+            self.removeTab(self.indexOf(splitter))
+            splitter.deleteLater()
+        if self.count() == 0:
+            if not self._closing:
+                self.close()
+        elif self.current_terminal():
+            self.current_terminal().setFocus()
+
+    def _on_current_changed(self, index):
+        # The hidden tabs stop rendering by themselves, the shown one catches up on its showEvent
+        terminal = self.current_terminal()
+        if terminal:
+            self.setWindowTitle(terminal.windowTitle())
+            terminal.setFocus()
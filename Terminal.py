@@ -1,59 +1,141 @@
-from PyQt4.QtGui import QTextCursor, QTextEdit, QFont, QTextCharFormat, QFontMetrics, QColor
-from PyQt4.QtCore import QTimer, Qt, QCoreApplication, SIGNAL
+from PyQt4.QtGui import QAbstractScrollArea, QPainter, QStaticText, QTransform, QRegion, QFont, QFontMetrics, QColor, \
+    QLabel
+from PyQt4.QtCore import QTimer, Qt, QCoreApplication, QRect, SIGNAL
 from Background import Connection
 from ControlSequence import *
-from re import match, sub, findall, finditer
+from Parser import Parser, PRINT, EXECUTE
+from Screen import *
+from Scrollback import Scrollback
+from Archive import Archive
+from Search import Searcher, compile_pattern, find_in_lines
+from Trigger import TriggerEngine
+from SessionLog import SessionLog
+from threading import Thread, Lock, Event
+from time import monotonic
+from logging import getLogger, DEBUG
+from re import IGNORECASE, finditer
+from collections import OrderedDict, deque
+from itertools import chain
+from sys import maxsize
 
 
-class QTerminal(QTextEdit):
+logger = getLogger(__name__)    # Traces the received data at the DEBUG level
+
+
+class QTerminal(QAbstractScrollArea):
     TIMEOUT = 60       # Timeout after 60 [s]
-    MAX_OUTPUT = 1000  # Maximum output is 1000 lines
+    MAX_OUTPUT = 100000         # Maximum output is 100000 lines
+    MAX_OUTPUT_BYTES = None     # Maximum memory used by the output [bytes] (default = no limit)
+    ARCHIVE_OUTPUT = None       # Compression of the lines beyond MAX_OUTPUT spilled to disk: None, 'zlib' or 'lzma'
     MAX_HISTORY = 100  # Maximum history is 100 lines
     SCREEN_HEIGHT = 24
     SCREEN_WIDTH = 80
+    FRAME_INTERVAL = 16   # Minimum time between two frames [ms] (~60 Hz)
+    FRAME_BUDGET = 10     # Maximum parsing time per frame [ms], the rest is left for the next frame
+    FRAME_CHUNK = 4096    # Number of characters parsed between two budget checks
+    OVERLAY_INTERVAL = 500    # Refresh period of the metrics overlay [ms]
+    CLOSE_ON_LOGOUT = True    # Close the terminal when the shell prints "logout"
+    ROW_CACHE = 2048          # Number of laid out rows kept, a row is laid out again only when its content changes
+    SEARCH_PAGE = 2000        # Lines searched above and below the view, the page follows the view [lines]
+    SEARCH_BATCH = 500        # Maximum number of matches added per GUI event
     FG_COLOR = QColor(100, 100, 100)
     BG_COLOR = QColor(255, 255, 255)
     SELECT_FG_COLOR = QColor(255, 255, 255)
     SELECT_BG_COLOR = QColor(40, 90, 240)
+    MATCH_BG_COLOR = QColor(255, 230, 80)
+    CURRENT_MATCH_BG_COLOR = QColor(255, 150, 50)
+    PALETTE = [Qt.black, Qt.red, Qt.green, Qt.yellow, Qt.blue, Qt.magenta, Qt.cyan, Qt.white]
 
-    def __init__(self, master=None, session=None):
+    def __init__(self, master=None, session=None, connection=None):
+        """
+        :param
+            master: The parent widget
+            session: The Session used to open the terminal channel, if it is not started yet see start_session
+            connection: The Connection serving the channel (default = Connection), e.g. AsyncConnection
+        """
         super(QTerminal, self).__init__(master)
         self.master = master
 
         # Define the connection
         self._session = session
-        self._connection = Connection()
+        self._connection = connection if connection else Connection()
         if self._session:
             self._connection.set_session(self._session)
-            self._connection.start_connection()
+            if self._session.is_connected():
+                self._connection.start_connection()
+
+        # noinspection PyArgumentList
+        self._app = QCoreApplication.instance()
 
         # Define timer
         self._timeout = self.TIMEOUT * 1000  # _timeout in [ms]
         self.timer = QTimer(self)
         self.timer.setSingleShot(True)
 
-        # Update the GUI
-        self._application_cursor_mode = False
-        self._application_keypad_mode = False
+        # Define the frame timer, the received text is rendered once per frame
+        self._pending = deque()    # Received text not parsed yet, as chunks
+        self._last_frame = 0
+        self._frame_budget = self.FRAME_BUDGET
+        self.frame_timer = QTimer(self)
+        self.frame_timer.setSingleShot(True)
+
+        # Define the metrics, shared with the connection, and their overlay
+        self._metrics = self._connection.get_metrics()
+        self._overlay = None
+        self.overlay_timer = QTimer(self)
+
+        # Define the escape sequence parser and the screen model
+        self._parser = Parser()
+        self._screen = Screen(self.SCREEN_WIDTH, self.SCREEN_HEIGHT)
+        self._scrollback = Scrollback(self.MAX_OUTPUT, self.MAX_OUTPUT_BYTES)
+        if self.ARCHIVE_OUTPUT:
+            self._scrollback.set_archive(Archive(self.ARCHIVE_OUTPUT))
+        self._styles = {}
+        self._row_cache = OrderedDict()
+        self._lines = []                 # Runs of every view row, as they are painted
+        self._damage = QRegion()         # Area of the viewport waiting to be painted
+        self._cursor_row = None          # View row of the painted cursor
+        self._selection = None           # Anchor and end of the selection: (line number, column)
+        self._rendering = True           # The view follows the screen, see set_rendering
+        self._stale = False              # The view missed screen changes while it was not rendered
+
+        # Define the scrollback search, it runs in a background thread
+        self._searcher = Searcher(self._scrollback)
+        self._search_cancel = Event()
+        self._search_results = []
+        self._search_lock = Lock()
+        self._search_matches = {}
+        self._search_query = None        # (pattern, case_sensitive, regex) of the last search
+        self._search_page = None         # Line numbers [first, end[ searched around the view
+        self._find_cancel = Event()      # Stops the running find_next / find_previous
+        self._found = None               # Match found by the find worker, taken by _show_found
+        self._current_match = None       # (line number, start, end) of the match found by find_next / find_previous
+
+        # Define the output triggers, the received text is scanned once for all of them
+        self._triggers = TriggerEngine()
+        if self.CLOSE_ON_LOGOUT:
+            self._triggers.add_regex(r'^\r?logout\r?$', lambda *args: QTimer.singleShot(0, self.close), 'logout')
+        self._screen.set_title_handler(self.set_title)
+        self._screen.set_bell_handler(self._app.beep)
+
+        # Update the GUI, the viewport is painted as a grid of cells
         self.font = QFont("Lucida Console", 10)
+        self.font.setStyleHint(QFont.TypeWriter)
+        self.font.setFixedPitch(True)
         self.setFont(self.font)
-        self.document().setMaximumBlockCount(self.MAX_OUTPUT)
-        self.setCurrentCharFormat(self.default_text_format())    # Reset the text format
-        self.set_title('Terminal')
-        self._selection_cursor = self.textCursor()
-        self._select_cursor_format = self.currentCharFormat()
-        self._deselect_cursor_format = self.currentCharFormat()
-        self._select_cursor_format.setBackground(self.SELECT_BG_COLOR)
-        self._select_cursor_format.setForeground(self.SELECT_FG_COLOR)
-        self._deselect_cursor_format.setBackground(self.BG_COLOR)
-        self._deselect_cursor_format.setForeground(self.FG_COLOR)
-        # noinspection PyArgumentList
-        self._app = QCoreApplication.instance()
+        metrics = QFontMetrics(self.font)
+        self._cell_width = metrics.width('M')
+        self._line_height = metrics.lineSpacing()
+        self._ascent = metrics.ascent()
+        self.setFocusPolicy(Qt.StrongFocus)
+        self.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+        self.setVerticalScrollBarPolicy(Qt.ScrollBarAlwaysOn)
+        self._scroll_bar = self.verticalScrollBar()    # Moves through the scrollback, the view holds visible lines only
+        self.viewport().setAttribute(Qt.WA_OpaquePaintEvent)
+        self.viewport().setCursor(Qt.IBeamCursor)
         self._clipboard = self._app.clipboard()
-
-        # Update cursor and cursor position
-        self.setCursorWidth(QFontMetrics(self.font).width('M'))
-        self.setCursor(Qt.IBeamCursor)
+        self.clear()
+        self.set_title('Terminal')
 
         # Update signals connections
         self._connect_signals()
@@ -63,92 +145,82 @@ class QTerminal(QTextEdit):
 
     def _connect_signals(self):
         # Connect pyqt signals
-        QTerminal.connect(self, SIGNAL("selectionChanged()"), self.on_selection_changed)
-        Connection.connect(self._connection, SIGNAL("add_text(QString)"), self.add_received_text)
+        Connection.connect(self._connection, SIGNAL("data_ready()"), self.schedule_frame)
         Connection.connect(self._connection, SIGNAL("clear_all()"), self.clear)
+        Connection.connect(self._connection, SIGNAL("connecting()"), lambda: self.set_title('Connecting ...'))
+        Connection.connect(self._connection, SIGNAL("connected(bool)"), self.on_connected)
         Connection.connect(self._connection, SIGNAL("reset_timer()"), lambda: self.timer.start(self._timeout))
         Connection.connect(self._connection, SIGNAL("stop_timer()"), self.timer.stop)
         QTimer.connect(self.timer, SIGNAL("timeout()"), self._connection.timeout)
+        QTimer.connect(self.frame_timer, SIGNAL("timeout()"), self.render_frame)
+        QTimer.connect(self.overlay_timer, SIGNAL("timeout()"), self._update_overlay)
+        QTerminal.connect(self._scroll_bar, SIGNAL("valueChanged(int)"), self.materialize)
+        QTerminal.connect(self, SIGNAL("search_results()"), self._add_search_results)
+        QTerminal.connect(self, SIGNAL("search_found()"), self._show_found)
 
     def closeEvent(self, *args, **kwargs):
         self._connection.close_session()
-        return QTextEdit.closeEvent(self, *args, **kwargs)
+        self.stop_logging()
+        self.emit(SIGNAL("closed()"))
+        return QAbstractScrollArea.closeEvent(self, *args, **kwargs)
+
+    def showEvent(self, event):
+        if self._stale and self._rendering:    # Catch up on the output received while hidden, in one repaint
+            self.materialize()
+        return QAbstractScrollArea.showEvent(self, event)
+
+    def focusNextPrevChild(self, next_child):
+        return False    # Tab is sent to the terminal
 
     def resizeEvent(self, event):
-        frame_format = self.document().rootFrame().frameFormat()
-        frame_format.setBottomMargin(self.viewport().height() - QFontMetrics(self.document().defaultFont()).height() - 2)
-        self.document().rootFrame().setFrameFormat(frame_format)
-        return QTextEdit.resizeEvent(self, event)
-
-    def focusInEvent(self, event):
-        if self._connection:
-            self._connection.set_reading_interval(Connection.DATA_READ_INT)    # Reset the data reading interval
-        return QTextEdit.focusInEvent(self, event)
-
-    def focusOutEvent(self, event):
-        if self._connection:
-            # increase the data reading interval, as to reduce the application load
-            self._connection.set_reading_interval(Connection.DATA_READ_INT * 20)
-        return QTextEdit.focusOutEvent(self, event)
+        result = QAbstractScrollArea.resizeEvent(self, event)
+        self.materialize()
+        if self._overlay:
+            self._update_overlay()
+        return result
 
     def mousePressEvent(self, event):
         if event.button() == Qt.MiddleButton:
-            self.paste()
+            self.paste(self._clipboard.text())
             return
 
         elif event.button() == Qt.LeftButton:
-            self._clear_cursor_selection()
-            self._selection_cursor.setPosition(self.cursorForPosition(event.pos()).position(), QTextCursor.MoveAnchor)
+            cell = self._cell_at(event.pos())
+            self.set_selection(cell, cell)
             return
 
         elif event.button() == Qt.RightButton:
             return
 
-        return QTextEdit.mousePressEvent(self, event)
+        return QAbstractScrollArea.mousePressEvent(self, event)
 
     def mouseReleaseEvent(self, event):
-        return
+        if event.button() == Qt.LeftButton:
+            self.copy_selection()
 
     def mouseDoubleClickEvent(self, event):
-        if event.button() == Qt.LeftButton:
-            self._clear_cursor_selection()
-            self._selection_cursor.movePosition(self.cursorForPosition(event.pos()).StartOfWord, QTextCursor.MoveAnchor)
-            self._selection_cursor.movePosition(QTextCursor.EndOfWord, QTextCursor.KeepAnchor)
-            self._selection_cursor.setCharFormat(self._select_cursor_format)
-            if self._selection_cursor.hasSelection:
-                self._clipboard.setText(self._selection_cursor.selectedText())
-        return
+        if event.button() == Qt.LeftButton:    # Select the word under the mouse
+            number, column = self._cell_at(event.pos())
+            for word in finditer(r'\w+', self._line_text(number)):
+                if word.start() <= column <= word.end():
+                    self.set_selection((number, word.start()), (number, word.end()))
+                    self.copy_selection()
+                    break
 
     def mouseMoveEvent(self, event):
-        if event.buttons() == Qt.LeftButton:
-            self._selection_cursor.setCharFormat(self._deselect_cursor_format)
-            self._selection_cursor.setPosition(self.cursorForPosition(event.pos()).position(), QTextCursor.KeepAnchor)
-            self._selection_cursor.setCharFormat(self._select_cursor_format)
-            if self._selection_cursor.hasSelection:
-                self._clipboard.setText(self._selection_cursor.selectedText())
-        return QTextEdit.mouseMoveEvent(self, event)
-
-    def _clear_cursor_selection(self):
-        if self._selection_cursor.hasSelection():
-            self._selection_cursor.setCharFormat(self._deselect_cursor_format)
-            self._selection_cursor.clearSelection()
+        if event.buttons() == Qt.LeftButton and self._selection:
+            self.set_selection(self._selection[0], self._cell_at(event.pos()))
 
     def keyPressEvent(self, event):
         if event.modifiers() == Qt.NoModifier:
             if event.key() == Qt.Key_Up:          # Move cursor up
-                text = (SS3 if self._application_cursor_mode else CSI) + 'A'
+                text = (SS3 if self._screen.application_cursor_mode else CSI) + 'A'
             elif event.key() == Qt.Key_Down:      # Move cursor down
-                text = (SS3 if self._application_cursor_mode else CSI) + 'B'
+                text = (SS3 if self._screen.application_cursor_mode else CSI) + 'B'
             elif event.key() == Qt.Key_Right:     # Move cursor right
-                text = (SS3 if self._application_cursor_mode else CSI) + 'C'
+                text = (SS3 if self._screen.application_cursor_mode else CSI) + 'C'
             elif event.key() == Qt.Key_Left:      # Move cursor left
-                text = (SS3 if self._application_cursor_mode else CSI) + 'D'
-            elif event.key() == Qt.Key_Return:    # Move cursor to end of line then send command
-                cursor = self.textCursor()
-                cursor.movePosition(QTextCursor.EndOfLine, QTextCursor.MoveAnchor)
-                cursor.setCharFormat(self.currentCharFormat())
-                self.setTextCursor(cursor)
-                text = event.text()
+                text = (SS3 if self._screen.application_cursor_mode else CSI) + 'D'
             elif event.key() == Qt.Key_Escape:    # Read data in buffer - Send "End Of Transmission" (same as CRTL + D)
                 # text = EOT
                 text = event.text()
@@ -160,12 +232,10 @@ class QTerminal(QTextEdit):
 
         elif event.modifiers() == Qt.ControlModifier:
             if event.key() == Qt.Key_A:           # Select All
-                self._clear_cursor_selection()
-                self._selection_cursor.movePosition(QTextCursor.Start, QTextCursor.MoveAnchor)
-                self._selection_cursor.movePosition(QTextCursor.End, QTextCursor.KeepAnchor)
-                self._selection_cursor.setCharFormat(self._select_cursor_format)
-                if self._selection_cursor.hasSelection:
-                    self._clipboard.setText(self._selection_cursor.selectedText())
+                first_number = self._scrollback.get_dropped()
+                last_number = first_number + len(self._scrollback) + self._screen.height - 1
+                self.set_selection((first_number, 0), (last_number, len(self._line_text(last_number))))
+                self.copy_selection()
             elif event.key() == Qt.Key_B:         # Break Terminal - sent "Start Of Text"
                 self.send_text(SOH)
             elif event.key() == Qt.Key_C:         # Break Terminal - sent "End of Text"
@@ -182,6 +252,11 @@ class QTerminal(QTextEdit):
                 self.send_text(SUB)
             return
 
+        elif event.modifiers() == Qt.ControlModifier | Qt.ShiftModifier:
+            if event.key() == Qt.Key_M:           # Show / hide the metrics overlay
+                self.toggle_metrics_overlay()
+                return
+
         elif event.modifiers() == Qt.ShiftModifier:
             if event.text():
                 self.send_text(event.text())
@@ -195,332 +270,844 @@ class QTerminal(QTextEdit):
         #             self.set_cursor_pos(self._readonly_end_pos, QTextCursor.MoveAnchor)
         #             return
 
-        return QTextEdit.keyPressEvent(self, event)
+        return QAbstractScrollArea.keyPressEvent(self, event)
 
     def send_text(self, cmd=''):
+        self._scroll_bar.setValue(self._scroll_bar.maximum())    # Back to the live screen
         if self._connection.is_connected():
             self._connection.send(str(cmd))
-        elif cmd == '\r':
+        elif cmd == '\r' and not self._connection.is_connecting():
             self.clear()
             self._connection.start_connection()
 
-    def on_selection_changed(self):
-        if self.textCursor().selectedText():
-            self.copy()
-
-    def print_data(self, data):
-        for char_i in data:
-            # Decode ASCII character
-            if char_i == BEL:    # Beep
-                self._app.beep()
-
-            elif char_i == BS:   # Backspace
-                if not self._application_cursor_mode:
-                    cursor = self.textCursor()
-                    cursor.movePosition(QTextCursor.Left, QTextCursor.MoveAnchor)
-                    cursor.setCharFormat(self.currentCharFormat())
-                    self.setTextCursor(cursor)
-
-            elif str(char_i):    # Normal characters
-                # Replace the existing character
-                cursor = self.textCursor()
-                cursor.movePosition(QTextCursor.Right, QTextCursor.KeepAnchor)
-                cursor.setCharFormat(self.currentCharFormat())
-                cursor.insertText(str(char_i))
-                self.setTextCursor(cursor)
+    def start_session(self, *args, **kwargs):
+        """
+        This method is used to start the session of the terminal in the background, the window is shown in the
+        connecting state meanwhile, and the channel is opened once connected.
+        :param
+            args, kwargs: The arguments of session.start_session, e.g. server, username, password
+        """
+        return self._connection.start_session(*args, **kwargs)
 
-    def add_received_text(self, data):
-        print(repr(data))
-        if ESC in data:
-            # Slice the data with Escape
-            new_data_list = [ESC + d for d in data.split(ESC)]
-            new_data_list[0] = new_data_list[0][1:]
-            for data_slice in new_data_list:
-                self.print_data(self.decode_data(data_slice))
+    def on_connected(self, started):
+        self.set_title('Terminal' if started else 'Not connected')
+
+    def clear(self):
+        """
+        This method is used to reset the screen and the scrollback.
+        """
+        self._pending = deque()
+        self._selection = None
+        self._parser.reset()
+        self._screen.reset()
+        self._screen.take_history()    # Cleared with the scrollback
+        self._scrollback.clear()
+        self._triggers.reset()
+        self.clear_search()
+        self.materialize()
+
+    def get_connection(self):
+        return self._connection
+
+    def get_scrollback(self):
+        return self._scrollback
+
+    def set_scrollback_limits(self, max_lines, max_bytes=None):
+        """
+        This method is used to change the scrollback caps.
+        :param
+            max_lines: Maximum number of lines
+            max_bytes: Maximum memory used by the lines [bytes] (default = no limit)
+        """
+        self._scrollback.set_limits(max_lines, max_bytes)
+        self.materialize()
+
+    def set_scrollback_archive(self, compression='zlib'):
+        """
+        This method is used to spill the lines beyond the scrollback caps to a compressed temporary file.
+        :param compression: 'zlib', 'lzma', or None to drop these lines
+        """
+        self._scrollback.set_archive(Archive(compression) if compression else None)
+        self.materialize()
+
+    def search(self, pattern, case_sensitive=False, regex=False):
+        """
+        This method is used to search the scrollback and the screen in a background thread.
+        Only a page of SEARCH_PAGE lines around the view is highlighted, the page is searched again when the view
+        moves out of it. The matches are collected as they are found, and the visible ones are highlighted.
+        find_next and find_previous move the view to the matches of the whole scrollback.
+        :param
+            pattern: The searched text, or regular expression if regex is True
+            case_sensitive: Match the letters case
+            regex: The pattern is a regular expression
+        """
+        self.clear_search()
+        self._search_query = pattern, case_sensitive, regex
+        self._search_around_view()
+
+    def clear_search(self):
+        """
+        This method is used to stop the running search and remove the highlighted matches.
+        """
+        self._search_query = None
+        self._search_page = None
+        self._find_cancel.set()
+        self._current_match = None
+        self._stop_search()
+
+    def get_search_matches(self):
+        """
+        :return sorted list of (line number, start, end) found by the last search in the page around the view
+        """
+        return sorted((number, start, end) for number, spans in self._search_matches.items() for start, end in spans)
+
+    def _stop_search(self):
+        self._search_cancel.set()
+        self._search_cancel = Event()
+        with self._search_lock:
+            self._search_results = []
+        self._search_matches = {}
+        self._damage_rows()
+
+    def find_previous(self):
+        """
+        This method is used to move the view to the match before the current one, in the whole scrollback.
+        The search runs in a background thread, "search_found(bool)" is emitted when it ends.
+        """
+        self._find(True)
+
+    def find_next(self):
+        """
+        This method is used to move the view to the match after the current one, see find_previous.
+        """
+        self._find(False)
+
+    def get_current_match(self):
+        """
+        :return (line number, start, end) of the match shown by find_next / find_previous, or None
+        """
+        return self._current_match
+
+    def _find(self, backward):
+        def worker():
+            expression = compile_pattern(pattern, case_sensitive, regex)
+            if backward:
+                matches = chain(find_in_lines(expression, reversed(screen_lines)),
+                                self._searcher.find(pattern, case_sensitive, regex, True, cancel,
+                                                    end_number=min(number + 1, screen_number)))
+            else:
+                matches = chain(self._searcher.find(pattern, case_sensitive, regex, False, cancel,
+                                                    first_number=number),
+                                find_in_lines(expression, screen_lines))
+            found = None
+            for match in matches:
+                if cancel.is_set():
+                    return
+                if found and match[0] != found[0]:
+                    break    # The lines come in search order, the nearest match of the first line is kept
+                if (match[:2] < reference) if backward else (match[:2] > reference):
+                    if not found or (match[1] > found[1]) == backward:
+                        found = match
+            with self._search_lock:
+                if cancel.is_set():
+                    return
+                self._found = (found,)    # (None,) when there is no match
+            self.emit(SIGNAL("search_found()"))
+
+        if not self._search_query:
+            return
+        self._find_cancel.set()
+        self._find_cancel = cancel = Event()
+        pattern, case_sensitive, regex = self._search_query
+        if self._current_match:
+            reference = self._current_match[:2]
+        elif backward:
+            reference = (self._first_number() + len(self._lines), -1)    # From the end of the view
         else:
-            self.print_data(self.decode_data(data))
+            reference = (self._first_number() - 1, maxsize)               # From the start of the view
+        number = reference[0]
+        screen_number = self._scrollback.get_dropped() + len(self._scrollback)
+        screen_lines = [(screen_number + y, self._screen.get_line_text(y)) for y in range(self._screen.height)
+                        if (screen_number + y <= number if backward else screen_number + y >= number)]
+        Thread(target=worker).start()
+
+    def _show_found(self):
+        with self._search_lock:
+            found = self._found
+            self._found = None
+        if found is None:
+            return
+        found = found[0]
+        if found:
+            if self._current_match:
+                self._damage_number(self._current_match[0])
+            self._current_match = found
+            number, start, end = found
+            spans = self._search_matches.setdefault(number, [])
+            if (start, end) not in spans:
+                spans.append((start, end))
+            bar = self._scroll_bar
+            view_number = self._first_number()
+            if not view_number <= number < view_number + len(self._lines):
+                index = number - self._scrollback.get_dropped()
+                bar.setValue(max(0, min(bar.maximum(), index - self._view_rows() // 2)))    # Centered
+            self._damage_number(number)
+        self.emit(SIGNAL("search_found(bool)"), bool(found))
+
+    def _damage_number(self, number):
+        row = number - self._first_number()
+        if 0 <= row < len(self._lines):
+            self._damage_rows(row, row + 1)
+
+    def _search_around_view(self, keep=False):
+        """
+        This method is used to search the page of lines around the view, the lines nearest the end first.
+        :param keep: Keep the highlighted matches of the scrollback lines, when the page follows the view
+        """
+        def worker():
+            screen_matches = find_in_lines(compile_pattern(pattern, case_sensitive, regex), reversed(screen_lines))
+            scrollback_matches = self._searcher.find(pattern, case_sensitive, regex, cancel=cancel,
+                                                     first_number=first, end_number=end)
+            for matches in (screen_matches, scrollback_matches):
+                for found in matches:
+                    with self._search_lock:
+                        if cancel.is_set():
+                            return
+                        notify = not self._search_results
+                        self._search_results.append(found)
+                    if notify:
+                        self.emit(SIGNAL("search_results()"))
+
+        pattern, case_sensitive, regex = self._search_query
+        view_number = self._first_number()
+        first = max(self._scrollback.get_dropped(), view_number - self.SEARCH_PAGE)
+        end = view_number + self._view_rows() + self.SEARCH_PAGE
+        self._search_page = first, end
+        first_number = self._scrollback.get_dropped() + len(self._scrollback)
+        if keep:
+            # The scrollback lines do not change, only the matches out of the page and on the screen are dropped
+            self._search_cancel.set()
+            self._search_cancel = Event()
+            with self._search_lock:
+                self._search_results = []
+            for number in [number for number in self._search_matches
+                           if not first <= number < end or number >= first_number]:
+                del self._search_matches[number]
+                self._damage_number(number)
+        else:
+            self._stop_search()
+        cancel = self._search_cancel
+        screen_lines = [(first_number + y, self._screen.get_line_text(y)) for y in range(self._screen.height)
+                        if first <= first_number + y < end]
+        Thread(target=worker).start()
+
+    def _follow_search(self):
+        """
+        This method is used to search a new page when the view comes near the edge of the searched page.
+        """
+        if not self._search_query:
+            return
+        first, end = self._search_page
+        view_number = self._first_number()
+        margin = self.SEARCH_PAGE // 2
+        if (view_number < first + margin and first > self._scrollback.get_dropped()) or \
+                view_number + self._view_rows() > end - margin:
+            self._search_around_view(keep=True)
+
+    def _add_search_results(self):
+        # A batch per event, so a search with many matches does not block the GUI thread
+        with self._search_lock:
+            results = self._search_results[:self.SEARCH_BATCH]
+            del self._search_results[:self.SEARCH_BATCH]
+            remaining = bool(self._search_results)
+        for number, start, end in results:
+            spans = self._search_matches.setdefault(number, [])
+            if (start, end) not in spans:    # Found again by a page overlapping the previous one
+                spans.append((start, end))
+        self._highlight_matches()
+        if remaining:
+            QTimer.singleShot(0, self._add_search_results)
+
+    def _highlight_matches(self):
+        """
+        This method is used to repaint the view rows holding matches, they are highlighted when painted.
+        """
+        first_number = self._first_number()
+        for row in range(len(self._lines)):
+            if first_number + row in self._search_matches:
+                self._damage_rows(row, row + 1)
+
+    def scrollback_memory_usage(self):
+        """
+        :return the memory used by the scrollback [bytes]
+        """
+        return self._scrollback.memory_usage()
+
+    def set_selection(self, anchor, end):
+        """
+        This method is used to select the text between two positions, the positions stay on their lines when the
+        output scrolls.
+        :param
+            anchor: (line number, column) where the selection started, see Scrollback.get_dropped
+            end: (line number, column) where the selection ends
+        """
+        self._selection = (anchor, end)
+        self._damage_rows()
+
+    def get_selection(self):
+        """
+        :return the sorted (first, last) positions of the selection, or None if nothing is selected
+        """
+        if not self._selection or self._selection[0] == self._selection[1]:
+            return None
+        return min(self._selection), max(self._selection)
 
-        # Close connection on exit
-        if match('.*\n?logout\n+', data):
-            self.close()
+    def selected_text(self):
+        selection = self.get_selection()
+        if not selection:
+            return ''
+        (first_number, first_column), (last_number, last_column) = selection
+        lines = []
+        for number in range(first_number, last_number + 1):
+            text = self._line_text(number)
+            lines.append(text[first_column if number == first_number else 0:
+                              last_column if number == last_number else len(text)])
+        return '\n'.join(lines)
 
-    def insertFromMimeData(self, mime_data):
-        self.send_text(self._clipboard.text())
-        return
+    def copy_selection(self):
+        text = self.selected_text()
+        if text:
+            self._clipboard.setText(text)
+
+    def _line_text(self, number):
+        """
+        :return the text of a line given by its number, counting the scrollback lines then the screen lines
+        """
+        index = number - self._scrollback.get_dropped()
+        count = len(self._scrollback)
+        if 0 <= index < count:
+            return self._scrollback.get_text(index)
+        if count <= index < count + self._screen.height:
+            return self._screen.get_line_text(index - count)[:self._screen.line_end(index - count)]
+        return ''
+
+    def add_received_text(self, data):
+        """
+        This method is used to queue text for the next frame.
+        """
+        self._pending.append(data)
+        self.schedule_frame()
+
+    def set_frame_budget(self, budget):
+        """
+        This method is used to limit the parsing time of a single frame.
+        :param budget: Maximum parsing time per frame [ms]
+        """
+        self._frame_budget = budget
+
+    def schedule_frame(self):
+        """
+        This method is used to start the frame timer, the frame is rendered immediately if the terminal was idle.
+        """
+        if not self.frame_timer.isActive():
+            elapsed = (monotonic() - self._last_frame) * 1000
+            self.frame_timer.start(max(0, int(self.FRAME_INTERVAL - elapsed)))
+
+    def render_frame(self):
+        """
+        This method is used to parse the text received since the last frame, then repaint the screen once.
+        The received chunks are taken from the connection one by one while the frame budget lasts, the rest waits
+        in the connection, whose reader stops reading the channel when too much is waiting (see MAX_BACKLOG).
+        """
+        self._last_frame = monotonic()
+        deadline = self._last_frame + self._frame_budget / 1000
+        pending = self._pending
+        parsed = []     # Parsed chunks, only joined for the DEBUG trace
+        parsed_chars = 0
+        printed = []    # Printed text and line breaks, seen by the triggers
+        while monotonic() <= deadline:
+            data = pending.popleft() if pending else self._connection.take_chunk()
+            if data is None:
+                break
+            for start in range(0, len(data), self.FRAME_CHUNK):
+                end = start + self.FRAME_CHUNK
+                actions = self._parser.feed(data[start:end])
+                self._screen.process(actions)
+                printed.extend(action[1] for action in actions
+                               if action[0] == PRINT or action[0] == EXECUTE and action[1] in '\r\n')
+                if monotonic() > deadline and end < len(data):
+                    pending.appendleft(data[end:])    # Only the rest of this chunk is copied
+                    data = data[:end]
+                    break
+            parsed.append(data)
+            parsed_chars += len(data)
+        if pending or self._connection.get_backlog():
+            self.schedule_frame()
+        if not parsed:
+            return
+        if logger.isEnabledFor(DEBUG):
+            logger.debug('received %r', ''.join(parsed))
+        self._triggers.feed(''.join(printed))    # Without the escape sequences splitting the matches
+        parse_end = monotonic()
+        self.paint_screen()
+
+        metrics = self._metrics
+        if metrics.enabled:
+            metrics.count('frames')
+            metrics.count('chars_parsed', parsed_chars)
+            metrics.observe('parse_ms', (parse_end - self._last_frame) * 1000)
+            metrics.observe('render_ms', (monotonic() - parse_end) * 1000)
+            metrics.gauge('row_cache', len(self._row_cache))
+
+    def add_trigger(self, pattern, callback, regex=False, case_sensitive=True, literal=None):
+        """
+        This method is used to call a callback when a pattern is received, see Trigger.TriggerEngine.
+        :param
+            pattern: The literal, or regular expression searched in every line if regex is True
+            callback: Called as callback(matched text, position in the received text)
+            regex: The pattern is a regular expression
+            case_sensitive: Match the letters case
+            literal: Text that every match of the regular expression contains, to skip the other lines
+        :return the trigger id
+        """
+        if regex:
+            return self._triggers.add_regex(pattern, callback, literal, 0 if case_sensitive else IGNORECASE)
+        return self._triggers.add_literal(pattern, callback, case_sensitive)
+
+    def remove_trigger(self, trigger_id):
+        self._triggers.remove(trigger_id)
+
+    def start_logging(self, path, mode='raw', **options):
+        """
+        This method is used to log the output of the terminal channel to a file, see SessionLog.SessionLog.
+        :param
+            path: The log file
+            mode: 'raw' for the received bytes, or 'text' for plain text with the escape sequences stripped
+            options: max_bytes, interval, backups, compress, queue_size and policy of the SessionLog
+        :return the SessionLog
+        """
+        self.stop_logging()
+        session_log = SessionLog(path, mode, **options)
+        self._connection.set_session_log(session_log)
+        return session_log
+
+    def stop_logging(self):
+        session_log = self._connection.get_session_log()
+        if session_log:
+            self._connection.set_session_log(None)
+            session_log.close()
+
+    def get_metrics(self):
+        return self._metrics
+
+    def set_metrics_enabled(self, enabled):
+        """
+        This method is used to start or stop collecting the metrics of the terminal and its connection.
+        """
+        self._metrics.set_enabled(enabled)
+
+    def dump_metrics(self, path=None):
+        """
+        This method is used to export the metrics as JSON.
+        :param path: The written file (default = only return the JSON text)
+        """
+        return self._metrics.dump(path)
+
+    def set_metrics_overlay(self, visible):
+        """
+        This method is used to show the metrics over the terminal, showing them enables the metrics.
+        """
+        if visible:
+            if not self._overlay:
+                self._overlay = QLabel(self.viewport())
+                self._overlay.setAttribute(Qt.WA_TransparentForMouseEvents)
+                self._overlay.setFont(QFont("Lucida Console", 8))
+                self._overlay.setStyleSheet('background-color: rgba(0, 0, 0, 160); color: white; padding: 4px;')
+            self._metrics.set_enabled(True)
+            self._update_overlay()
+            self._overlay.show()
+            self.overlay_timer.start(self.OVERLAY_INTERVAL)
+        elif self._overlay:
+            self.overlay_timer.stop()
+            self._overlay.hide()
+
+    def toggle_metrics_overlay(self):
+        self.set_metrics_overlay(not (self._overlay and self._overlay.isVisible()))
+
+    def _update_overlay(self):
+        self._overlay.setText(self._metrics.format() or 'No metrics yet')
+        self._overlay.adjustSize()
+        self._overlay.move(self.viewport().width() - self._overlay.width(), 0)
+
+    def paste(self, text):
+        """
+        This method is used to send a paste to the connection, without blocking on large pastes.
+        The line breaks are sent as carriage returns, and the text is bracketed if the application asked for it.
+        """
+        self._scroll_bar.setValue(self._scroll_bar.maximum())    # Back to the live screen
+        text = text.replace('\r\n', '\r').replace('\n', '\r')
+        if text and self._connection.is_connected():
+            self._connection.paste(text, self._screen.bracketed_paste_mode)
 
     def set_title(self, title):
         self.setWindowTitle(title.strip() if title.strip() else 'Terminal')
+        self.emit(SIGNAL("title_changed(QString)"), self.windowTitle())
 
-    def decode_data(self, data):
-        def moving_cursor(d, pattern):
-            """
-            This function is used to moves the cursor by COUNT rows/column depending on the received data.
-            The default count is 1.
-            """
-            if pattern:
-                if pattern.group()[-1] == 'A':    # Move Cursor Up
-                    action = QTextCursor.Up
-                elif pattern.group()[-1] == 'B':  # Move Cursor Down
-                    action = QTextCursor.Down
-                elif pattern.group()[-1] == 'C':  # Move Cursor Right
-                    action = QTextCursor.Right
-                elif pattern.group()[-1] == 'D':  # Move Cursor Left
-                    action = QTextCursor.Left
-                elif pattern.group()[-1] == 'E':  # Move Cursor Next Block
-                    action = QTextCursor.NextBlock
-                elif pattern.group()[-1] == 'F':  # Move Cursor Previous Block
-                    action = QTextCursor.PreviousBlock
-                else:
-                    action = None
-
-                if action:
-                    count = pattern.group()[2:-1]
-                    if count:
-                        try:
-                            cursor.movePosition(action, QTextCursor.MoveAnchor, int(count))
-                        except ValueError:
-                            print("Receiving non-integer value for escape sequence.")
-                    else:  # same as value = 1
-                        cursor.movePosition(action, QTextCursor.MoveAnchor)
-                    return sub("%s\d*[ABCDEF]" % rCSI, '', d)
-            return d
-
-        def moving_cursor_to_pos(d, pattern):
-            """
-            This function is used to scroll the text depending on the received data.
-            Sets the cursor position where subsequent text will begin.
-            If no row/column parameters are provided ( i.e. <ESC>[H ), the cursor will
-            move to the home position, at the upper left of the screen.
-            """
-            if pattern:
-                row_col = pattern.group()[2:-1]
-                if row_col:
-                    try:
-                        row = int(row_col.split(';')[0])
-                        col = int(row_col.split(';')[1])
-                        cursor.movePosition(QTextCursor.Up, QTextCursor.MoveAnchor, row)
-                        cursor.movePosition(QTextCursor.PreviousCharacter, QTextCursor.MoveAnchor, col)
-                    except ValueError:
-                        print("Receiving non-integer value for escape sequence.")
-                else:
-                    # self.verticalScrollBar().setValue(self.verticalScrollBar().maximum())
-                    cursor.movePosition(QTextCursor.Start, QTextCursor.MoveAnchor)
-                return sub("%s(\d+;\d+)?H" % rCSI, '', d)
-            return d
-
-        cursor = self.textCursor()
-        text_format = self.currentCharFormat()
-
-        # Decode escape characters
-        if ESC in data:
-            if data.startswith(CSI):        # CSI Codes ( ESC + [ )
-                """ Moving Cursor Patterns """
-                data = moving_cursor(data, match("%s\d*[ABCDEF]" % rCSI, data))   # pattern = <ESC>[{value} A|B|C|D|E|F
-
-                # Move Cursor Position [row;column] (default = [1,1])
-                data = moving_cursor_to_pos(data, match("%s(\d+;\d+)?H" % rCSI, data))   # pattern = <ESC>[{value};{value}H
-
-                """ Changing cursor mode """
-                # Set cursor key to application mode
-                matched_pattern = match("%s\?1h" % rCSI, data)   # pattern = <ESC>[?1h
-                if matched_pattern:
-                    print(matched_pattern.group())
-                    data = sub("%s\?1h" % rCSI, '', data)
-                    self._application_cursor_mode = True
-
-                # Set cursor key to normal mode (cursor mode)
-                matched_pattern = match("%s\?1l" % rCSI, data)  # pattern = <ESC>[?1l
-                if matched_pattern:
-                    data = sub("%s\?1l" % rCSI, '', data)
-                    self._application_cursor_mode = False
-
-                """ Erase Patterns """
-                # Text Erase in Display
-                matched_pattern = match("%s\d*J" % rCSI, data)   # pattern = <ESC>[{value}J
-                if matched_pattern:
-                    data = sub("%s\d*J" % rCSI, '', data)
-                    matched_code = matched_pattern.group()[2:-1]
-                    if matched_code:
-                        if matched_code == 0:
-                            # EL0 = CSI + '0J'  ==> Erase Below (from cursor down)
-                            cursor.movePosition(QTextCursor.End, QTextCursor.KeepAnchor)
-                        elif matched_code == 1:
-                            # EL1 = CSI + '1J'  ==> Erase Above (from cursor up)
-                            cursor.movePosition(QTextCursor.Start, QTextCursor.KeepAnchor)
-                        elif matched_code == 2:
-                            # EL2 = CSI + '2J'  ==> Erase All
-                            cursor.movePosition(QTextCursor.End, QTextCursor.MoveAnchor)
-                            cursor.movePosition(QTextCursor.Start, QTextCursor.KeepAnchor)
-                        else:
-                            # unsupported number
-                            print("Unsupported escape sequence.")
-                    else:
-                        # EL = CSI + 'J'  ==> Erase Below (from cursor down)
-                        cursor.movePosition(QTextCursor.End, QTextCursor.KeepAnchor)
-                    if cursor.hasSelection():
-                        cursor.removeSelectedText()
-
-                # Text Erase in Line (EL)
-                matched_pattern = match("%s\d?K" % rCSI, data)     # pattern = <ESC>[{value}K
-                if matched_pattern:
-                    data = sub("%s\d?K" % rCSI, '', data)
-                    matched_code = matched_pattern.group()[2:-1]
-                    if matched_code:
-                        if matched_code == 0:
-                            # EL0 = CSI + '0K'  ==> Clear from cursor to end of line (from cursor right)
-                            cursor.movePosition(QTextCursor.EndOfLine, QTextCursor.KeepAnchor)
-                        elif matched_code == 1:
-                            # EL1 = CSI + '1K'  ==> Clear from cursor to start of line (from cursor left)
-                            cursor.movePosition(QTextCursor.StartOfLine, QTextCursor.KeepAnchor)
-                        elif matched_code == 2:
-                            # EL2 = CSI + '2K'  ==> Clear entire line
-                            cursor.movePosition(QTextCursor.EndOfLine, QTextCursor.MoveAnchor)
-                            cursor.movePosition(QTextCursor.StartOfLine, QTextCursor.KeepAnchor)
-                        else:
-                            # Cursor already in position, or unsupported number
-                            pass
-                    else:
-                        # EL = CSI + 'K'  ==> Clear from cursor to end of line (from cursor right)
-                        cursor.movePosition(QTextCursor.EndOfLine, QTextCursor.KeepAnchor)
-                    if cursor.hasSelection():
-                        cursor.removeSelectedText()
-
-                # Text Graphical Format
-                matched_pattern = match("%s(\d+;?)+m" % rCSI, data)      # pattern = <ESC>[{value};{value}m
-                if matched_pattern:
-                    data = data[len(matched_pattern.group()):]
-                    matched_code = finditer('\d+', matched_pattern.group())
-                    if matched_code:
-                        for code in matched_code:
-                            text_format = self.update_text_format(int(code.group()), text_format)
-
-            elif data.startswith(OSC):      # OSC Codes ( ESC + ] )
-                # Update Terminal Title
-                matched_pattern = match("%s\d+;.*(%s|%s)" % (rOSC, BEL, rST), data)   # pattern = <ESC>]{value};{string} + ST|BEL
-                if matched_pattern:
-                    data = data[len(matched_pattern.group()):]
-                    matched_code = str(findall('\d+', matched_pattern.group())[0])
-                    if matched_code in '02':    # Ignore all other codes
-                        self.set_title(matched_pattern.group()[4:-1])
+    def set_rendering(self, enabled):
+        """
+        This method is used to suspend or resume the view updates, a hidden terminal is never rendered.
+        While suspended, the output is still parsed into the screen and the scrollback at full speed, and the
+        triggers still fire, only the view is not updated. Resuming rebuilds the view once.
+        """
+        self._rendering = enabled
+        if enabled and self._stale and self.isVisible():
+            self.materialize()
 
-            else:
-                """ Changing keypad mode """
-                # Set keypad to application mode
-                matched_pattern = match("\x1B=", data)  # pattern = <ESC>=
-                if matched_pattern:
-                    data = sub("\x1B=", '', data)
-                    self._application_keypad_mode = True
-
-                # Set keypad to normal numeric mode
-                matched_pattern = match("\x1b>", data)  # pattern = <ESC>>
-                if matched_pattern:
-                    data = sub("\x1b>", '', data)
-                    self._application_keypad_mode = False
-
-        cursor.setCharFormat(text_format)
-        self.setTextCursor(cursor)
-        return sub(ESC, '', data)
-
-    def update_text_format(self, code, text_format):
-        # Set Default Text Graphical Format
-        default_format = self.default_text_format()
-
-        # Text attributes
-        if code == 0:                                      # Default
-            text_format = default_format
-        elif code == 1:                                    # Bold
-            text_format.setFontWeight(QFont.Bold)
-        elif code == 2:                                    # Low Intensity
-            text_format.setFontWeight(QFont.Light)
-        elif code == 3:                                    # Italic
-            text_format.setFontItalic(True)
-        elif code == 4:                                    # Underline
-            text_format.setUnderlineStyle(QTextCharFormat.SingleUnderline)
-            text_format.setFontUnderline(True)
-        elif code == 5:                                    # Blink, Appears as Bold
-            text_format.setFontWeight(QFont.Bold)
-        elif code == 6:                                    # Blink, Appears as Very Bold
-            text_format.setFontWeight(QFont.Black)
-        elif code == 7:                                    # Reverse/Inverse
-            foreground_color = text_format.foreground()
-            text_format.setForeground(text_format.background())
-            text_format.setBackground(foreground_color)
-        elif code == 8:                                    # Hidden/Invisible (for password)
-            text_format.setForeground(text_format.background())
-        elif code == 9:                                    # Crossed-out
-            text_format.setFontStrikeOut(True)
-        elif code == 21:                                   # Bold OFF
-            text_format.setFontWeight(QFont.Normal)
-        elif code == 22:                                   # Faint OFF
-            text_format.setFontWeight(QFont.Normal)
-        elif code == 23:                                   # Italic OFF
-            text_format.setFontItalic(False)
-        elif code == 24:                                   # Underline OFF
-            text_format.setUnderlineStyle(QTextCharFormat.NoUnderline)
-            text_format.setFontUnderline(False)
-        elif code == 25:                                   # Steady (Not Blinking/Bold)
-            text_format.setFontWeight(QFont.Normal)
-        elif code == 27:                                   # Positive (non-inverted)
-            foreground_color = text_format.foreground()
-            text_format.setForeground(text_format.background())
-            text_format.setBackground(foreground_color)
-        elif code == 28:                                   # Visible (not hidden)
-            text_format.setForeground(default_format.foreground())
-            text_format.setBackground(default_format.background())
-        elif code == 29:                                   # Crossed-out OFF
-            text_format.setFontStrikeOut(False)
-
-        # Foreground colors
-        elif code == 30:                                   # Foreground Black
-            text_format.setForeground(Qt.black)
-        elif code == 31:                                   # Foreground Red
-            text_format.setForeground(Qt.red)
-        elif code == 32:                                   # Foreground Green
-            text_format.setForeground(Qt.green)
-        elif code == 33:                                   # Foreground Yellow
-            text_format.setForeground(Qt.yellow)
-        elif code == 34:                                   # Foreground Blue
-            text_format.setForeground(Qt.blue)
-        elif code == 35:                                   # Foreground Magenta
-            text_format.setForeground(Qt.magenta)
-        elif code == 36:                                   # Foreground Cyan
-            text_format.setForeground(Qt.cyan)
-        elif code == 37:                                   # Foreground White
-            text_format.setForeground(Qt.white)
-        elif code == 39:                                   # Foreground Default
-            text_format.setForeground(default_format.foreground())
-
-        # Background colors
-        elif code == 40:                                   # Background Black
-            text_format.setBackground(Qt.black)
-        elif code == 41:                                   # Background Red
-            text_format.setBackground(Qt.red)
-        elif code == 42:                                   # Background Green
-            text_format.setBackground(Qt.green)
-        elif code == 43:                                   # Background Yellow
-            text_format.setBackground(Qt.yellow)
-        elif code == 44:                                   # Background Blue
-            text_format.setBackground(Qt.blue)
-        elif code == 45:                                   # Background Magenta
-            text_format.setBackground(Qt.magenta)
-        elif code == 46:                                   # Background Cyan
-            text_format.setBackground(Qt.cyan)
-        elif code == 47:                                   # Background White
-            text_format.setBackground(Qt.white)
-        elif code == 49:                                   # Background Default
-            text_format.setBackground(default_format.background())
+    def is_rendering(self):
+        return self._rendering and self.isVisible()
+
+    def _view_rows(self):
+        """
+        :return the number of lines in the view, the visible lines but never less than the screen lines
+        """
+        return max(self.viewport().height() // self._line_height, self._screen.height)
+
+    def _skip_rows(self):
+        """
+        :return the number of view rows above the viewport, when the viewport is smaller than the screen
+        """
+        return max(0, len(self._lines) - self.viewport().height() // self._line_height)
+
+    def _first_number(self):
+        """
+        :return the line number of the first view row, see Scrollback.get_dropped
+        """
+        return self._scrollback.get_dropped() + self._scroll_bar.value()
+
+    def _is_live(self):
+        return self._scroll_bar.value() == self._scroll_bar.maximum()
+
+    def _update_scroll_bar(self, dropped=0):
+        """
+        This method is used to update the scroll bar range to the scrollback length.
+        :param dropped: Number of lines dropped from the scrollback since the last update
+        :return True if the live screen is shown
+        """
+        bar = self._scroll_bar
+        live = bar.value() == bar.maximum()
+        rows = self._view_rows()
+        bar.blockSignals(True)
+        bar.setRange(0, max(0, len(self._scrollback) + self._screen.height - rows))
+        bar.setPageStep(rows)
+        bar.setValue(bar.maximum() if live else bar.value() - dropped)
+        bar.blockSignals(False)
+        return live
+
+    def _get_line_runs(self, index):
+        """
+        :return the runs of line [index] as a tuple, counting the scrollback lines then the screen lines
+        """
+        count = len(self._scrollback)
+        if index < count:
+            return tuple(self._scrollback.get_line(index))
+        chars, attrs = self._screen.get_line(index - count)
+        return tuple(line_runs(chars, attrs, self._screen.line_end(index - count)))
+
+    def materialize(self, *args):
+        """
+        This method is used to rebuild the view from the visible window of the scrollback and the screen.
+        """
+        screen = self._screen
+        self._update_scroll_bar()
+        top = self._scroll_bar.value()
+        total = len(self._scrollback) + screen.height
+        self._lines = [self._get_line_runs(index) for index in range(top, min(top + self._view_rows(), total))]
+        screen.take_dirty()
+        screen.take_scrolls()
+        self._stale = False
+        self._cursor_row = len(self._lines) - screen.height + screen.y if self._is_live() else None
+        self._damage_rows()
+        self._follow_search()
+
+    def paint_screen(self):
+        """
+        This method is used to copy the changes of the screen model to the view, and repaint the changed rows.
+        The lines scrolled off the screen are moved to the scrollback. While the live screen is shown, the view
+        holds the last scrollback lines followed by exactly SCREEN_HEIGHT screen lines, and only the rows marked
+        as dirty are rebuilt.
+        """
+        screen = self._screen
+        scrollback = self._scrollback
+        dropped = scrollback.get_dropped()
+        first_number = self._first_number()
+        history = screen.take_history()
+        for chars, attrs in history:
+            scrollback.append(chars, attrs)
+        live = self._update_scroll_bar(scrollback.get_dropped() - dropped)
+        if not self.is_rendering():
+            screen.take_dirty()    # The view is rebuilt when rendering resumes
+            screen.take_scrolls()
+            self._stale = True
+            return
+        if not live:
+            return    # The view is scrolled back, it is rebuilt when it moves
+
+        # Move the screen rows of the view like the screen rows moved
+        old_lines = self._lines
+        lines = list(old_lines)
+        first_line = len(lines) - screen.height
+        scrolls = screen.take_scrolls()
+        moves = []    # (first, last, count): the view rows moved by the screen scrolls, in their order
+        for top, bottom, count in scrolls or ():
+            self._shift_rows(lines, first_line + top, first_line + bottom, count)
+            if history and count > 0 and top == 0 and bottom == screen.height - 1:
+                top = -first_line    # The rows scrolled off the screen go up with the history rows of the view
+            moves.append((first_line + top, first_line + bottom, count))
+
+        # Insert the new scrollback lines before the first screen row, and drop the rows above the view
+        history_rows = min(len(scrollback), self._view_rows() - screen.height)
+        if history:
+            lines[first_line:first_line] = [tuple(scrollback.get_line(index)) for index in
+                                            range(len(scrollback) - min(len(history), history_rows), len(scrollback))]
+        extra_rows = len(lines) - screen.height - history_rows
+        if extra_rows > 0:
+            del lines[:extra_rows]
+
+        # Replace the changed screen rows
+        first_line = len(lines) - screen.height
+        for y in screen.take_dirty():
+            chars, attrs = screen.get_line(y)
+            lines[first_line + y] = tuple(line_runs(chars, attrs, screen.line_end(y)))
+        self._lines = lines
+
+        shift = self._first_number() - first_number
+        if scrolls is None and shift > 0:
+            moves = [(0, len(lines) - 1, shift)]    # Too many scrolls to follow, the whole view moved up
+        self._repaint_changes(old_lines, lines, moves)
+        self._cursor_row = first_line + screen.y
+        self._damage_rows(self._cursor_row, self._cursor_row + 1)
+        if history:
+            self._follow_search()    # The live view moved down
+
+    def _shift_rows(self, lines, first, last, count, fill=()):
+        """
+        This method is used to move the rows [first, last] of the view up by count rows (down if count < 0).
+        The rows leaving the range are dropped, and [fill] rows enter it, they are rebuilt as dirty rows.
+        """
+        rows = min(abs(count), last - first + 1)
+        if count > 0:
+            lines[first:last + 1] = lines[first + rows:last + 1] + [fill] * rows
         else:
-            pass
-
-        return text_format
-
-    def default_text_format(self):
-        text_format = self.currentCharFormat()
-        text_format.setFontWeight(QFont.Normal)
-        text_format.setFontItalic(False)
-        text_format.setUnderlineStyle(QTextCharFormat.NoUnderline)
-        text_format.setFontUnderline(False)
-        text_format.setFontStrikeOut(False)
-        text_format.setForeground(self.FG_COLOR)
-        text_format.setBackground(self.BG_COLOR)
-        return text_format
+            lines[first:last + 1] = [fill] * rows + lines[first:last + 1 - rows]
+
+    def _repaint_changes(self, old_lines, lines, moves):
+        """
+        This method is used to repaint only the rows of the view that changed.
+        The painted pixels of every moved region are scrolled first, in the order the screen scrolled, so only
+        the rows entering a region and the rows really changed are painted again.
+        :param
+            old_lines: The painted view
+            lines: The new view
+            moves: List of (first, last, count): the view rows [first, last] moved up by count rows (down if < 0)
+        """
+        rows = len(lines)
+        if len(old_lines) != rows:
+            self._damage_rows()
+            return
+        painted = list(old_lines)    # The rows shown by the pixels of the viewport
+        if self._cursor_row is not None and 0 <= self._cursor_row < rows:
+            painted[self._cursor_row] = None    # The old cursor is erased wherever its row moved
+        if moves and self._damage.isEmpty():
+            viewport = self.viewport()
+            line_height = self._line_height
+            skip = self._skip_rows()
+            for first, last, count in moves:
+                if abs(count) > last - first:
+                    continue    # Every row of the region is replaced
+                rect = QRect(0, (first - skip) * line_height, viewport.width(), (last - first + 1) * line_height)
+                viewport.scroll(0, -count * line_height, rect)    # The overlay does not move
+                self._shift_rows(painted, first, last, count, None)
+        for row in range(rows):
+            if lines[row] != painted[row]:
+                self._damage_rows(row, row + 1)
+
+    def _damage_rows(self, first=0, last=None):
+        """
+        This method is used to schedule the repaint of the view rows [first, last[ (default = the whole view).
+        """
+        viewport = self.viewport()
+        if last is None:
+            rect = viewport.rect()
+        else:
+            skip = self._skip_rows()
+            rect = QRect(0, (first - skip) * self._line_height, viewport.width(), (last - first) * self._line_height)
+        self._damage = self._damage.united(rect)
+        viewport.update(rect)
+
+    def flush(self):
+        """
+        This method is used to paint the damaged rows immediately, without waiting for the event loop.
+        """
+        if not self._damage.isEmpty():
+            self.viewport().repaint(self._damage)
+
+    def paintEvent(self, event):
+        """
+        This method is used to paint the view rows crossing the damaged area, from their cached layout.
+        """
+        start = monotonic()
+        screen = self._screen
+        line_height = self._line_height
+        cell_width = self._cell_width
+        rect = event.rect()
+        painter = QPainter(self.viewport())
+        painter.fillRect(rect, self.BG_COLOR)
+
+        skip = self._skip_rows()
+        first_number = self._first_number()
+        selection = self.get_selection()
+        first_row = skip + max(0, rect.top() // line_height)
+        last_row = min(len(self._lines), skip + rect.bottom() // line_height + 1)
+        for row in range(first_row, last_row):
+            y = (row - skip) * line_height
+            layout = self._layout_row(self._lines[row])
+            for x, width, text, style in layout:
+                if style[1] is not None:
+                    painter.fillRect(x, y, width, line_height, style[1])
+            for match_start, match_end in self._search_matches.get(first_number + row, ()):
+                current = self._current_match == (first_number + row, match_start, match_end)
+                painter.fillRect(match_start * cell_width, y, (match_end - match_start) * cell_width, line_height,
+                                 self.CURRENT_MATCH_BG_COLOR if current else self.MATCH_BG_COLOR)
+            self._draw_texts(painter, layout, y)
+            if selection:
+                self._draw_selection(painter, layout, y, first_number + row, selection)
+
+        # Block cursor, the character below it is painted with the background color
+        cursor_row = self._cursor_row
+        if screen.cursor_visible and cursor_row is not None and first_row <= cursor_row < last_row:
+            x = screen.x * cell_width
+            y = (cursor_row - skip) * line_height
+            painter.fillRect(x, y, cell_width, line_height, self.FG_COLOR)
+            painter.setPen(self.BG_COLOR)
+            painter.setFont(self.font)
+            painter.drawText(x, y + self._ascent, screen.get_line_text(screen.y)[screen.x:screen.x + 1])
+        painter.end()
+        self._damage = QRegion()
+
+        metrics = self._metrics
+        if metrics.enabled:
+            metrics.observe('paint_ms', (monotonic() - start) * 1000)
+            metrics.count('painted_rows', max(0, last_row - first_row))
+            metrics.gauge('row_cache', len(self._row_cache))
+
+    def _draw_texts(self, painter, layout, y, pen=None):
+        for x, width, text, style in layout:
+            if text is not None:
+                painter.setPen(pen or style[0])
+                painter.setFont(style[2])
+                painter.drawStaticText(x, y, text)
+
+    def _draw_selection(self, painter, layout, y, number, selection):
+        """
+        This method is used to paint the selected part of a row with the selection colors.
+        """
+        (first_number, first_column), (last_number, last_column) = selection
+        if not first_number <= number <= last_number:
+            return
+        length = (layout[-1][0] + layout[-1][1]) // self._cell_width if layout else 0
+        start = first_column if number == first_number else 0
+        end = last_column if number == last_number else max(length, 1)
+        if end <= start:
+            return
+        rect = QRect(start * self._cell_width, y, (end - start) * self._cell_width, self._line_height)
+        painter.fillRect(rect, self.SELECT_BG_COLOR)
+        painter.save()
+        painter.setClipRect(rect)
+        self._draw_texts(painter, layout, y, self.SELECT_FG_COLOR)
+        painter.restore()
+
+    def _layout_row(self, runs):
+        """
+        This method is used to get the layout of a row: (x, width, static text, style) per run.
+        The layouts are cached by runs, so a row is laid out again only when its content changes.
+        """
+        layout = self._row_cache.get(runs)
+        if layout is not None:
+            self._row_cache.move_to_end(runs)
+            return layout
+        layout = []
+        column = 0
+        for text, attr_id in runs:
+            style = self._style(attr_id)
+            static_text = None
+            if text.strip() or style[3] & (UNDERLINE | STRIKE):    # Blank runs only paint their background
+                static_text = QStaticText(text)
+                static_text.setTextFormat(Qt.PlainText)
+                static_text.prepare(QTransform(), style[2])
+            layout.append((column * self._cell_width, len(text) * self._cell_width, static_text, style))
+            column += len(text)
+        self._row_cache[runs] = layout
+        if len(self._row_cache) > self.ROW_CACHE:
+            self._row_cache.popitem(last=False)
+        return layout
+
+    def _cell_at(self, position):
+        """
+        :return the (line number, column) of the cell boundary nearest to a viewport position
+        """
+        row = position.y() // self._line_height + self._skip_rows()
+        row = min(max(row, 0), max(len(self._lines) - 1, 0))
+        column = max(0, (position.x() + self._cell_width // 2) // self._cell_width)
+        return self._first_number() + row, column
+
+    def _style(self, attr_id):
+        """
+        This method is used to get the style of a screen attribute: (foreground, background, font, flags).
+        The styles are cached by attribute tuple (foreground, background, flags).
+        """
+        attribute = self._screen.attributes.get(attr_id)
+        style = self._styles.get(attribute)
+        if style is None:
+            style = self._styles[attribute] = self._build_style(*attribute)
+        return style
+
+    def _build_style(self, fg, bg, flags):
+        foreground = self._color(fg, self.FG_COLOR)
+        background = self._color(bg, self.BG_COLOR)
+        if flags & INVERSE:
+            foreground, background = background, foreground
+        if flags & HIDDEN:                                 # Hidden/Invisible (for password)
+            foreground = background
+
+        font = QFont(self.font)
+        if flags & BOLD:                                   # Bold
+            font.setWeight(QFont.Bold)
+        elif flags & FAINT:                                # Low Intensity
+            font.setWeight(QFont.Light)
+        elif flags & BLINK:                                # Blink, Appears as Bold
+            font.setWeight(QFont.Bold)
+        if flags & ITALIC:                                 # Italic
+            font.setItalic(True)
+        if flags & UNDERLINE:                              # Underline
+            font.setUnderline(True)
+        if flags & STRIKE:                                 # Crossed-out
+            font.setStrikeOut(True)
+        # The view is filled with the default background, only the other backgrounds are painted
+        return foreground, None if background == self.BG_COLOR else background, font, flags
+
+    def _color(self, color, default):
+        """
+        This method is used to convert a screen color (palette index or true color) to QColor.
+        """
+        if color == DEFAULT_COLOR:
+            return default
+        if color & TRUE_COLOR:
+            return QColor((color >> 16) & 0xFF, (color >> 8) & 0xFF, color & 0xFF)
+        if color < 8:
+            return QColor(self.PALETTE[color])
+        if color < 16:
+            return QColor(self.PALETTE[color - 8]).lighter(150)
+        if color < 232:                                    # 6x6x6 color cube
+            color -= 16
+            return QColor(*[(0, 95, 135, 175, 215, 255)[c] for c in (color // 36, (color // 6) % 6, color % 6)])
+        return QColor(*[8 + (color - 232) * 10] * 3)       # Gray scale
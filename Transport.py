@@ -0,0 +1,310 @@
+"""
+Transports of the terminal, with no GUI dependency.
+A session opens channels, a channel provides recv, recv_ready, send, fileno, settimeout and close, like a paramiko
+Channel. The Writer sends to a channel from a background thread.
+paramiko (and cryptography) are only imported by the first SSH connection, they take most of the startup time.
+"""
+from threading import Thread, Condition, current_thread
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from time import sleep
+from _socket import error
+
+
+PASTE_START = '\x1b[200~'
+PASTE_END = '\x1b[201~'
+
+
+class Writer:
+    COALESCE_WINDOW = 0.005    # Keystrokes sent within this window are written together [s]
+    WRITE_SIZE = 32768         # Maximum size of a single write, a paste is split in writes of this size [bytes]
+
+    def __init__(self, channel):
+        """
+        This Class is used to write to a channel from a background thread, so the GUI thread never blocks on send.
+        The thread only runs while there is data to write.
+        :param channel: The written channel
+        """
+        self._channel = channel
+        self._queue = deque()
+        self._pending = 0           # Number of queued bytes
+        self._condition = Condition()
+        self._thread = None
+        self._closed = False
+
+    def get_pending(self):
+        """
+        :return the number of bytes waiting to be written
+        """
+        return self._pending
+
+    def write(self, data, coalesce=True):
+        """
+        This method is used to queue data, it returns immediately.
+        :param
+            data: The text or bytes to write
+            coalesce: Wait COALESCE_WINDOW for more data before writing ( keystrokes )
+        :return False if the writer is closed
+        """
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        with self._condition:
+            if self._closed:
+                return False
+            self._queue.append(data)
+            self._pending += len(data)
+            if self._thread is None:
+                self._thread = Thread(target=self._run, args=(coalesce,), name='Writer')
+                self._thread.daemon = True
+                self._thread.start()
+        return True
+
+    def close(self):
+        """
+        This method is used to drop the queued data and stop the thread after its current write.
+        """
+        with self._condition:
+            self._closed = True
+            self._queue.clear()
+            self._pending = 0
+
+    def _run(self, coalesce):
+        try:
+            if coalesce:
+                sleep(self.COALESCE_WINDOW)    # Let the next keystrokes join the first one
+            while True:
+                with self._condition:
+                    if self._closed or not self._queue:
+                        self._thread = None
+                        return
+                    chunks = []
+                    size = 0
+                    while self._queue and size < self.WRITE_SIZE:
+                        chunks.append(self._queue.popleft())
+                        size += len(chunks[-1])
+                    self._pending -= size
+                self._send_all(b''.join(chunks))
+        except Exception as e:    # socket errors, and EOFError or SSHException from paramiko
+            print("sending command error: %s" % e)
+            self.close()
+        finally:
+            with self._condition:
+                if self._thread is current_thread():    # A new thread may already write the next data
+                    self._thread = None
+
+    def _send_all(self, data):
+        # The channel accepts part of the data when its window is full, send the rest until all is written
+        view = memoryview(data)
+        while view and not self._closed:
+            sent = self._channel.send(view[:self.WRITE_SIZE].tobytes())
+            if sent <= 0:
+                raise OSError('channel closed')
+            view = view[sent:]
+
+
+class BaseSession:
+    MAX_CHANNELS = 10      # Maximum number of opened channels per session
+
+    def __init__(self):
+        """
+        This Class is the transport used by a Connection, it opens the channels the terminal reads and writes.
+        A channel provides recv, recv_ready, send, fileno, settimeout and close, like a paramiko Channel.
+        """
+        self.channelCount = 0
+        self._channels = []
+        self._error = ''
+
+    def get_channel_count(self):
+        return len(self._channels)
+
+    def add_channel(self, channel):
+        self._channels.append(channel)
+
+    def remove_channel(self, channel):
+        if channel in self._channels:
+            self._channels.remove(channel)
+
+    def get_channels(self):
+        return self._channels
+
+    def get_error(self):
+        return self._error
+
+    def set_error(self, reason):
+        self._error = reason
+
+    def start_session(self, *args, **kwargs):
+        raise NotImplementedError
+
+    def close_session(self):
+        raise NotImplementedError
+
+    def is_connected(self):
+        raise NotImplementedError
+
+    def set_keepalive(self, interval):
+        pass    # The transport has no keepalive packets
+
+    def probe(self):
+        """
+        This method is used to check that the transport is still alive, it raises an exception if it is not.
+        """
+        if not self.is_connected():
+            raise EOFError('session closed')
+
+    def open_channel(self, timeout=120):
+        raise NotImplementedError
+
+    def exec_channel(self, command, timeout=120):
+        raise NotImplementedError
+
+    def close_channel(self, channel):
+        """
+        This method is used to close a channel of the session.
+        :param channel: The channel that will be closed
+        """
+        if channel in self.get_channels():
+            channel.close()
+            self.remove_channel(channel)
+            return True
+        return False
+
+
+class Session(BaseSession):
+    SESSIONS_COUNT = 0     # Number of opened sessions
+    KEEPALIVE = 30         # Period of the transport keepalive packets [s]
+
+    def __init__(self):
+        """
+        This Class is used to open an SSH connection (session) with remote server.
+        """
+        super(Session, self).__init__()
+        Session.SESSIONS_COUNT += 1
+        self._client = None
+
+    def set_client(self, client):
+        self._client = client
+
+    def get_client(self):
+        return self._client
+
+    def start_session(self, server, username='', password='', timeout=15, port=22):
+        """
+        This method is used to start a new connection to server.
+        :param
+            server: The remote server in order to initiate ssh connection with
+            username: Remote server username
+            password: Remote server password
+            timeout: Timeout while trying to connect [s]
+            port: Remote server port
+        """
+        from paramiko import SSHClient, AutoAddPolicy    # Imported on the first connection
+        try:
+            client = SSHClient()
+            client.set_missing_host_key_policy(AutoAddPolicy())
+            client.connect(server, port=port, username=username, password=password, timeout=timeout)
+            client.get_transport().set_keepalive(self.KEEPALIVE)
+            self.set_client(client)
+            return True
+        except error as e:
+            print("opening session error")
+            self._error = e
+            return False
+
+    def close_session(self):
+        """
+        This method is used to close the connection to remote server.
+        """
+        try:
+            if self.get_client():
+                self.get_client().close()
+                Session.SESSIONS_COUNT -= 1
+                return True
+            else:
+                return False
+        except error as e:
+            print("closing session error")
+            self._error = e
+            return False
+
+    def is_connected(self):
+        if self.get_client():
+            if self.get_client().get_transport():
+                if self.get_client().get_transport().is_active():
+                    return True
+        return False
+
+    def set_keepalive(self, interval):
+        """
+        This method is used to change the period of the keepalive packets sent by the transport.
+        :param interval: The period [s], 0 to disable the keepalive
+        """
+        self.KEEPALIVE = interval
+        if self.is_connected():
+            self.get_client().get_transport().set_keepalive(interval)
+
+    def probe(self):
+        """
+        This method is used to check the SSH transport, by sending an ignored message to the server.
+        """
+        self.get_client().get_transport().send_ignore()
+
+    def open_channel(self, timeout=120):
+        """
+        This method is used to open a new channel.
+        :return shell terminal status, and the shell channel
+        """
+        if self.get_channel_count() < self.MAX_CHANNELS and self.is_connected():
+            try:
+                channel = self.get_client().invoke_shell()
+                channel.settimeout(timeout)
+                self.add_channel(channel)
+                return channel
+            except error as e:
+                print("opening channel error")
+                self._error = e
+        # return None
+
+    def exec_channel(self, command, timeout=120):
+        """
+        This method is used to open a new channel running a single command, with no shell.
+        The error output is merged in the output, the exit status is given by channel.recv_exit_status().
+        :return the command channel
+        """
+        if self.get_channel_count() < self.MAX_CHANNELS and self.is_connected():
+            try:
+                channel = self.get_client().get_transport().open_session()
+                channel.settimeout(timeout)
+                channel.set_combine_stderr(True)
+                channel.exec_command(command)
+                self.add_channel(channel)
+                return channel
+            except error as e:
+                print("opening channel error")
+                self._error = e
+        # return None
+
+
+def start_sessions(starts, workers=16):
+    """
+    This function is used to start several sessions concurrently, the total time is about the slowest session's.
+    :param
+        starts: List of (session, arguments dictionary of session.start_session)
+                e.g. [(Session(), {'server': '10.0.0.1', 'username': 'user', 'password': 'secret'})]
+        workers: Maximum number of sessions started at the same time
+    :return list of start_session results, in the starts order, a session that raised is False with its
+            exception given by session.get_error()
+    """
+    if not starts:
+        return []
+    with ThreadPoolExecutor(max_workers=min(workers, len(starts))) as pool:
+        futures = [pool.submit(session.start_session, **arguments) for session, arguments in starts]
+    results = []
+    for (session, arguments), future in zip(starts, futures):
+        try:
+            results.append(future.result())
+        except Exception as e:    # e.g. AuthenticationException, the other sessions are still returned
+            print("starting session error")
+            session.set_error(e)
+            results.append(False)
+    return results
@@ -0,0 +1,214 @@
+"""
+Output triggers: callbacks fired when a literal or a regular expression appears in the received text.
+All the literals are matched by a single Aho-Corasick automaton, so the cost per character does not depend on the
+number of triggers. The regular expressions run on complete lines only, and only on the lines holding their
+prefilter literal if they have one. The automaton state and the current line are kept between two chunks, so a
+match split across chunks is found.
+"""
+from re import compile, escape, IGNORECASE
+from collections import deque
+
+
+class AhoCorasick:
+    def __init__(self, patterns):
+        """
+        This Class is used to find many literals in a single pass over the text.
+        :param patterns: List of the literals, the matches are reported by literal index
+        """
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [()]
+        self._lengths = [len(pattern) for pattern in patterns]
+        for index, pattern in enumerate(patterns):
+            state = 0
+            for char in pattern:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(())
+                    self._goto[state][char] = next_state
+                state = next_state
+            self._out[state] += (index,)
+
+        # Breadth first, the failure state of a node is known once its parent's is
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                failure = self._fail[state]
+                while failure and char not in self._goto[failure]:
+                    failure = self._fail[failure]
+                self._fail[next_state] = self._goto[failure].get(char, 0)
+                self._out[next_state] += self._out[self._fail[next_state]]
+
+        # From the root, skip directly to the next character starting a literal
+        first_chars = ''.join(escape(char) for char in self._goto[0])
+        self._first = compile('[%s]' % first_chars).search if first_chars else None
+
+    def get_length(self, index):
+        return self._lengths[index]
+
+    def feed(self, text, state=0):
+        """
+        This method is used to scan a chunk of text.
+        :param
+            text: The scanned text
+            state: The state returned by the previous chunk, 0 for a new stream
+        :return list of (literal index, position of the last character of the match), and the new state
+        """
+        goto, fail, out, first = self._goto, self._fail, self._out, self._first
+        matches = []
+        if first is None:
+            return matches, 0
+        position = 0
+        length = len(text)
+        while position < length:
+            if not state:
+                found = first(text, position)
+                if not found:
+                    break
+                position = found.start()
+            char = text[position]
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for index in out[state]:
+                matches.append((index, position))
+            position += 1
+        return matches, state
+
+
+class TriggerEngine:
+    MAX_LINE = 4096    # Maximum length of the current line kept for the regular expressions [characters]
+
+    def __init__(self):
+        """
+        This Class is used to fire callbacks on the literals and regular expressions found in a text stream.
+        The callbacks are called as callback(text, position), position is the offset of the match in the stream.
+        """
+        self._triggers = {}         # Trigger id: (kind, pattern, callback, prefilter literal, case sensitive)
+        self._next_id = 0
+        self._automata = None       # (case sensitive, case insensitive), rebuilt when the triggers change
+        self._states = [0, 0]
+        self._always = []           # Regular expressions with no prefilter, searched in every line
+        self._offset = 0            # Offset of the next chunk in the stream
+        self._line = ''             # Start of the current line, received in the previous chunks
+        self._line_offset = 0
+        self._line_candidates = set()
+
+    def __len__(self):
+        return len(self._triggers)
+
+    def add_literal(self, literal, callback, case_sensitive=True):
+        """
+        This method is used to fire a callback on every occurrence of a literal.
+        :return the trigger id
+        """
+        return self._add(('literal', literal, callback, None, case_sensitive))
+
+    def add_regex(self, pattern, callback, literal=None, flags=0):
+        """
+        This method is used to fire a callback on the lines matching a regular expression.
+        :param
+            pattern: The regular expression, searched in every complete line (without its '\\n')
+            callback: Called with the matched text and its position
+            literal: Text that every match contains, only the lines holding it are searched
+            flags: The re flags of the pattern, IGNORECASE applies to the literal too
+        :return the trigger id
+        """
+        return self._add(('regex', compile(pattern, flags), callback, literal, not flags & IGNORECASE))
+
+    def _add(self, trigger):
+        trigger_id = self._next_id
+        self._next_id += 1
+        self._triggers[trigger_id] = trigger
+        self._automata = None
+        return trigger_id
+
+    def remove(self, trigger_id):
+        if self._triggers.pop(trigger_id, None) is not None:
+            self._automata = None
+            self._line_candidates.discard(trigger_id)
+
+    def reset(self):
+        """
+        This method is used to start a new stream, the partial matches are forgotten.
+        """
+        self._states = [0, 0]
+        self._offset = 0
+        self._line = ''
+        self._line_offset = 0
+        self._line_candidates = set()
+
+    def _build(self):
+        # Every automaton keeps the trigger id of each of its literals
+        literals = ([], [])
+        for trigger_id, (kind, pattern, callback, literal, case_sensitive) in self._triggers.items():
+            literal = pattern if kind == 'literal' else literal
+            if literal:
+                literals[0 if case_sensitive else 1].append(
+                    (trigger_id, literal if case_sensitive else literal.lower()))
+        self._automata = tuple((AhoCorasick([literal for _, literal in group]), [trigger_id for trigger_id, _ in group])
+                               for group in literals)
+        self._states = [0, 0]
+        self._always = [trigger_id for trigger_id, trigger in self._triggers.items()
+                        if trigger[0] == 'regex' and not trigger[3]]
+
+    def feed(self, text):
+        """
+        This method is used to scan the next chunk of the stream, and fire the callbacks of its matches.
+        """
+        if not self._triggers or not text:
+            self._offset += len(text)
+            return
+        if self._automata is None:
+            self._build()
+
+        # Literals
+        prefilter_matches = []
+        for group, (automaton, trigger_ids) in enumerate(self._automata):
+            if not trigger_ids:
+                continue
+            matches, self._states[group] = automaton.feed(text if group == 0 else text.lower(), self._states[group])
+            for index, position in matches:
+                trigger_id = trigger_ids[index]
+                trigger = self._triggers.get(trigger_id)
+                if trigger is None:    # Removed by a callback
+                    continue
+                kind, pattern, callback = trigger[:3]
+                if kind == 'literal':
+                    start = position - automaton.get_length(index) + 1
+                    callback(pattern, self._offset + start)
+                else:
+                    prefilter_matches.append((position, trigger_id))
+        prefilter_matches.sort(reverse=True)
+
+        # Regular expressions, on the completed lines
+        start = 0
+        while True:
+            end = text.find('\n', start)
+            if end < 0:
+                break
+            while prefilter_matches and prefilter_matches[-1][0] < end:
+                self._line_candidates.add(prefilter_matches.pop()[1])
+            line = self._line + text[start:end]
+            self._match_line(line, self._line_offset)
+            start = end + 1
+            self._line = ''
+            self._line_offset = self._offset + start
+            self._line_candidates = set()
+        for _, trigger_id in prefilter_matches:
+            self._line_candidates.add(trigger_id)
+        self._line = (self._line + text[start:])[-self.MAX_LINE:]
+        self._offset += len(text)
+        self._line_offset = self._offset - len(self._line)
+
+    def _match_line(self, line, offset):
+        for trigger_id in self._always + list(self._line_candidates):
+            trigger = self._triggers.get(trigger_id)
+            if trigger:
+                for found in trigger[1].finditer(line):
+                    trigger[2](found.group(), offset + found.start())
@@ -1,15 +1,20 @@
 from Terminal import QTerminal
-from Background import Session
+from Tabs import QTerminalTabs
+from Pool import PooledSession
 from PyQt4.QtGui import QApplication
 from sys import argv
 
 
 if __name__ == '__main__':
     app = QApplication(argv)
-    _s = Session()
-    _s.start_session('10.74.231.56', 'myousry', '1qa2ws#ED')
-    win = QTerminal(session=_s)
+    win = QTerminalTabs()
     # win = PyQTerminal()
     win.resize(1030, 670)
     win.show()
+    # The window is shown first, the session is started in the background
+    if '--local' in argv:    # Local shell on a pseudo terminal, Unix only
+        from LocalBackground import LocalSession
+        win.open_terminal(LocalSession, width=QTerminal.SCREEN_WIDTH, height=QTerminal.SCREEN_HEIGHT)
+    else:                    # Ctrl+Shift+T opens another shell on the same SSH transport
+        win.open_terminal(PooledSession, '10.74.231.56', 'myousry', '1qa2ws#ED')
     exit(app.exec_())
@@ -0,0 +1,40 @@
+import unittest
+from Parser import Parser, PRINT, EXECUTE, CSI_DISPATCH, ESC_DISPATCH, OSC_DISPATCH
+
+
+def parse(chunks):
+    """
+    This function is used to parse chunks with a single parser, the split printable runs are joined.
+    """
+    parser = Parser()
+    actions = []
+    for chunk in chunks:
+        for action in parser.feed(chunk):
+            if action[0] == PRINT and actions and actions[-1][0] == PRINT:
+                actions[-1] = (PRINT, actions[-1][1] + action[1])
+            else:
+                actions.append(action)
+    return actions
+
+
+class ParserTest(unittest.TestCase):
+    STREAM = 'ab\x1b[1;31mred\x1b[0m\r\n\x1b]0;title\x07\x1b[?1049h\x1b(B\x1b[2;5r\x1bM\x1b[3L\tend\x1b]2;x\x1b\\'
+
+    def test_actions(self):
+        self.assertEqual(parse(['a\x1b[1;31mb\r\n']),
+                         [(PRINT, 'a'), (CSI_DISPATCH, 'm', (1, 31), ''), (PRINT, 'b'), (EXECUTE, '\r'),
+                          (EXECUTE, '\n')])
+        self.assertEqual(parse(['\x1b[?1049h']), [(CSI_DISPATCH, 'h', (1049,), '?')])
+        self.assertEqual(parse(['\x1b]0;title\x07']), [(OSC_DISPATCH, '0;title')])
+        self.assertEqual(parse(['\x1bM']), [(ESC_DISPATCH, 'M', '')])
+
+    def test_split_chunks(self):
+        # Every split of the stream gives the same actions
+        expected = parse([self.STREAM])
+        for split in range(1, len(self.STREAM)):
+            self.assertEqual(parse([self.STREAM[:split], self.STREAM[split:]]), expected, split)
+        self.assertEqual(parse(list(self.STREAM)), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+import unittest
+from Parser import Parser
+from Screen import Screen, CELL_ENCODING
+
+
+class ScreenTest(unittest.TestCase):
+    def setUp(self):
+        self.screen = Screen(10, 5)
+        self.parser = Parser()
+
+    def feed(self, text):
+        self.screen.process(self.parser.feed(text))
+
+    def rows(self):
+        return [self.screen.get_line_text(y).rstrip() for y in range(self.screen.height)]
+
+    def fill(self):
+        self.feed('\r\n'.join('line%d' % y for y in range(5)))
+
+    def test_print_and_wrap(self):
+        self.feed('0123456789ab')
+        self.assertEqual(self.rows()[:2], ['0123456789', 'ab'])
+        self.assertEqual((self.screen.x, self.screen.y), (2, 1))
+
+    def test_scroll_to_history(self):
+        self.feed('\r\n'.join('line%d' % y for y in range(7)))
+        self.assertEqual(self.rows(), ['line2', 'line3', 'line4', 'line5', 'line6'])
+        history = self.screen.take_history()
+        self.assertEqual([chars.tobytes().decode(CELL_ENCODING).rstrip() for chars, attrs in history], ['line0', 'line1'])
+
+    def test_reset_keeps_history(self):
+        # The lines scrolled off in the frame of a RIS still reach the scrollback
+        self.feed('\r\n'.join('line%d' % y for y in range(7)) + '\x1bc')
+        self.assertEqual(self.rows(), [''] * 5)
+        history = self.screen.take_history()
+        self.assertEqual([chars.tobytes().decode(CELL_ENCODING).rstrip() for chars, attrs in history],
+                         ['line0', 'line1'])
+
+    def test_scroll_region(self):
+        # DECSTBM: the line feeds at the bottom margin only scroll the region, and nothing goes to the history
+        self.fill()
+        self.screen.take_history()
+        self.feed('\x1b[2;4r\x1b[4;1H\n\n')
+        self.assertEqual(self.rows(), ['line0', 'line3', '', '', 'line4'])
+        self.assertEqual(self.screen.take_history(), [])
+
+    def test_index_reverse_index(self):
+        # IND at the bottom margin scrolls up, RI at the top margin scrolls down
+        self.fill()
+        self.feed('\x1b[2;4r\x1b[4;1H\x1bD')
+        self.assertEqual(self.rows(), ['line0', 'line2', 'line3', '', 'line4'])
+        self.feed('\x1b[2;1H\x1bM\x1bM')
+        self.assertEqual(self.rows(), ['line0', '', '', 'line2', 'line4'])
+
+    def test_insert_delete_lines(self):
+        self.fill()
+        self.feed('\x1b[2;1H\x1b[2L')
+        self.assertEqual(self.rows(), ['line0', '', '', 'line1', 'line2'])
+        self.feed('\x1b[3M')
+        self.assertEqual(self.rows(), ['line0', 'line2', '', '', ''])
+
+    def test_insert_delete_lines_in_region(self):
+        # IL / DL only move the lines between the cursor and the bottom margin
+        self.fill()
+        self.feed('\x1b[1;4r\x1b[2;1H\x1b[L')
+        self.assertEqual(self.rows(), ['line0', '', 'line1', 'line2', 'line4'])
+        self.feed('\x1b[2M')
+        self.assertEqual(self.rows(), ['line0', 'line2', '', '', 'line4'])
+
+    def test_alternate_screen(self):
+        # 1049 saves the cursor and shows a clear alternate screen, the primary screen comes back unchanged
+        self.fill()
+        self.feed('\x1b[3;4H\x1b[?1049h')
+        self.assertTrue(self.screen.alternate_screen)
+        self.assertEqual(self.rows(), [''] * 5)
+        self.feed('\x1b[1;1Hvim\x1b[5;1H\n\n')
+        self.assertEqual(self.screen.take_history(), [])
+        self.feed('\x1b[?1049l')
+        self.assertFalse(self.screen.alternate_screen)
+        self.assertEqual(self.rows(), ['line0', 'line1', 'line2', 'line3', 'line4'])
+        self.assertEqual((self.screen.x, self.screen.y), (3, 2))
+        self.feed('\x1b[?1049h')
+        self.assertEqual(self.rows(), [''] * 5)
+
+    def test_alternate_screen_saved_cursor(self):
+        # A cursor saved on the alternate screen does not replace the cursor saved by 1049
+        self.feed('abc\x1b[?1049h\x1b[4;4H\x1b7\x1b[?1049l')
+        self.assertEqual((self.screen.x, self.screen.y), (3, 0))
+        self.feed('\x1b[2;2H\x1b7\x1b[?1049h\x1b8')
+        self.assertEqual((self.screen.x, self.screen.y), (3, 3))
+        self.feed('\x1b[?1049l\x1b8')
+        self.assertEqual((self.screen.x, self.screen.y), (1, 1))
+
+    def test_dirty_rows(self):
+        self.screen.take_dirty()
+        self.feed('\x1b[3;1Hx')
+        self.assertEqual(list(self.screen.take_dirty()), [2])
+        self.assertEqual(list(self.screen.take_dirty()), [])
+
+    def test_scrolls(self):
+        self.fill()
+        self.screen.take_scrolls()
+        self.feed('\x1b[2;4r\x1b[4;1H\n\n')
+        self.assertEqual(self.screen.take_scrolls(), [(1, 3, 2)])
+
+
+if __name__ == '__main__':
+    unittest.main()
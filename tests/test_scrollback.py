@@ -0,0 +1,63 @@
+import unittest
+from Scrollback import Scrollback, encode_line
+from Archive import Archive
+
+
+def fill(scrollback, first, end):
+    for number in range(first, end):
+        scrollback.append_entry(encode_line([('line%d' % number, 0)]))
+
+
+class ScrollbackTest(unittest.TestCase):
+    def test_numbering(self):
+        scrollback = Scrollback(max_lines=10)
+        fill(scrollback, 0, 25)
+        self.assertEqual(len(scrollback), 10)
+        self.assertEqual(scrollback.get_dropped(), 15)
+        self.assertEqual(scrollback.get_text(0), 'line15')
+        self.assertEqual(scrollback.get_text_by_number(24), 'line24')
+        self.assertIsNone(scrollback.get_text_by_number(14))
+        self.assertIsNone(scrollback.get_text_by_number(25))
+
+    def test_clear(self):
+        scrollback = Scrollback(max_lines=10)
+        fill(scrollback, 0, 5)
+        scrollback.clear()
+        fill(scrollback, 5, 7)
+        self.assertEqual(scrollback.get_dropped(), 5)
+        self.assertEqual(scrollback.get_text_by_number(6), 'line6')
+
+    def test_set_limits(self):
+        scrollback = Scrollback(max_lines=10)
+        fill(scrollback, 0, 10)
+        scrollback.set_limits(4)
+        self.assertEqual(scrollback.get_dropped(), 6)
+        self.assertEqual([scrollback.get_text(index) for index in range(4)], ['line6', 'line7', 'line8', 'line9'])
+
+    def test_archive(self):
+        # The lines dropped from the ring go to the archive, they keep their numbers
+        scrollback = Scrollback(max_lines=10)
+        scrollback.set_archive(Archive('zlib', page_lines=4))
+        fill(scrollback, 0, 25)
+        self.assertEqual(len(scrollback), 25)
+        self.assertEqual(scrollback.get_dropped(), 0)
+        self.assertEqual([scrollback.get_text_by_number(number) for number in range(25)],
+                         ['line%d' % number for number in range(25)])
+
+    def test_replace_archive(self):
+        # The lines of a replaced archive are counted as dropped, the other lines keep their numbers
+        scrollback = Scrollback(max_lines=10)
+        scrollback.set_archive(Archive('lzma', page_lines=4))
+        fill(scrollback, 0, 25)
+        scrollback.set_archive(None)
+        self.assertEqual(scrollback.get_dropped(), 15)
+        self.assertEqual(len(scrollback), 10)
+        self.assertIsNone(scrollback.get_text_by_number(14))
+        self.assertEqual(scrollback.get_text_by_number(20), 'line20')
+        fill(scrollback, 25, 30)
+        self.assertEqual(scrollback.get_text_by_number(29), 'line29')
+        self.assertEqual(scrollback.get_dropped(), 20)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import unittest
+import gzip
+from os import listdir, path
+from shutil import rmtree
+from tempfile import mkdtemp
+from SessionLog import SessionLog, strip_escapes
+
+
+class SessionLogTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = mkdtemp()
+        self.path = path.join(self.directory, 'session.log')
+
+    def tearDown(self):
+        rmtree(self.directory)
+
+    def read(self, name):
+        with open(path.join(self.directory, name), 'rb') as log:
+            return log.read()
+
+    def test_strip_escapes(self):
+        self.assertEqual(strip_escapes('\x1b[?2004l\r\x1b[1;31mred\x1b[0m\r\n\x1b]0;title\x07end\x08'), 'red\nend')
+
+    def test_raw(self):
+        log = SessionLog(self.path)
+        for chunk in (b'abc', b'\x1b[1m', b'def\r\n'):
+            self.assertTrue(log.record(chunk))
+        log.close()
+        self.assertEqual(self.read('session.log'), b'abc\x1b[1mdef\r\n')
+        self.assertFalse(log.record(b'closed'))
+
+    def test_text(self):
+        # An escape sequence and a multibyte character split between two chunks are stripped and decoded
+        log = SessionLog(self.path, mode='text')
+        log.record(b'red \x1b[1;3')
+        log.record(b'1mtext\xc3')
+        log.record(b'\xa9\r\n')
+        log.close()
+        self.assertEqual(self.read('session.log').decode('utf-8'), 'red text\xe9\n')
+
+    def test_size_rotation(self):
+        # The rotated files hold at least max_bytes, the oldest ones are removed. A batch holds at most 8 chunks
+        data = [b'%d' % (index % 10) * 500 for index in range(20)]
+        log = SessionLog(self.path, max_bytes=1000, backups=2, policy='block', queue_size=4096)
+        for chunk in data:
+            log.record(chunk)
+        log.close()
+        self.assertEqual(sorted(listdir(self.directory)), ['session.log', 'session.log.1', 'session.log.2'])
+        self.assertGreaterEqual(len(self.read('session.log.1')), 1000)
+        self.assertGreaterEqual(len(self.read('session.log.2')), 1000)
+        kept = self.read('session.log.2') + self.read('session.log.1') + self.read('session.log')
+        self.assertTrue(b''.join(data).endswith(kept))
+
+    def test_compressed_rotation(self):
+        data = [b'%d' % (index % 10) * 500 for index in range(20)]
+        log = SessionLog(self.path, max_bytes=1000, backups=3, compress=True, policy='block', queue_size=4096)
+        for chunk in data:
+            log.record(chunk)
+        log.close()
+        self.assertEqual(sorted(listdir(self.directory)),
+                         ['session.log', 'session.log.1.gz', 'session.log.2.gz', 'session.log.3.gz'])
+        kept = []
+        for index in (3, 2, 1):
+            with gzip.open(path.join(self.directory, 'session.log.%d.gz' % index)) as rotated:
+                kept.append(rotated.read())
+        kept.append(self.read('session.log'))
+        self.assertTrue(b''.join(data).endswith(b''.join(kept)))
+
+    def test_drop_policy(self):
+        log = SessionLog(self.path, queue_size=100)
+        self.assertFalse(log.record(b'x' * 101))
+        self.assertEqual(log.get_dropped(), 101)
+        log.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import unittest
+from Transport import BaseSession, Writer, start_sessions
+
+
+class Channel:
+    def __init__(self, window=None, error=None):
+        self.data = b''
+        self.window = window    # Maximum number of bytes accepted per send
+        self.error = error
+
+    def send(self, data):
+        if self.error:
+            raise self.error
+        data = data[:self.window] if self.window else data
+        self.data += data
+        return len(data)
+
+
+class WriterTest(unittest.TestCase):
+    def wait(self, writer):
+        thread = writer._thread
+        if thread:
+            thread.join(5)
+
+    def test_coalesce(self):
+        channel = Channel(window=3)
+        writer = Writer(channel)
+        writer.write('ls')
+        writer.write(' -l\r')
+        self.wait(writer)
+        self.assertEqual(channel.data, b'ls -l\r')
+        self.assertEqual(writer.get_pending(), 0)
+        self.assertIsNone(writer._thread)
+
+    def test_send_error(self):
+        # Any exception of the channel closes the writer, and clears its thread
+        writer = Writer(Channel(error=EOFError('channel closed')))
+        self.assertTrue(writer.write('exit\r', coalesce=False))
+        self.wait(writer)
+        self.assertIsNone(writer._thread)
+        self.assertFalse(writer.write('more'))
+
+
+class StartSession(BaseSession):
+    def start_session(self, server, password=''):
+        if password != 'secret':
+            raise PermissionError('authentication failed')    # Like paramiko's AuthenticationException
+        return True
+
+
+class StartSessionsTest(unittest.TestCase):
+    def test_failed_start(self):
+        # A session raising is reported as not started, the other sessions are still returned
+        sessions = [StartSession() for _ in range(3)]
+        arguments = [{'server': 'a', 'password': 'secret'}, {'server': 'b', 'password': 'wrong'},
+                     {'server': 'c', 'password': 'secret'}]
+        self.assertEqual(start_sessions(list(zip(sessions, arguments))), [True, False, True])
+        self.assertIsInstance(sessions[1].get_error(), PermissionError)
+        self.assertEqual(start_sessions([]), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
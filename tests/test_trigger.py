@@ -0,0 +1,48 @@
+import unittest
+from re import IGNORECASE
+from Trigger import TriggerEngine
+
+
+class TriggerTest(unittest.TestCase):
+    def setUp(self):
+        self.engine = TriggerEngine()
+        self.matches = []
+
+    def callback(self, text, position):
+        self.matches.append((text, position))
+
+    def test_literal_across_chunks(self):
+        self.engine.add_literal('password:', self.callback)
+        for chunk in ('user pass', 'wo', 'rd: '):
+            self.engine.feed(chunk)
+        self.assertEqual(self.matches, [('password:', 5)])
+
+    def test_case_insensitive_literal(self):
+        self.engine.add_literal('Error', self.callback, case_sensitive=False)
+        self.engine.feed('an ERR')
+        self.engine.feed('OR and an error')
+        self.assertEqual(self.matches, [('Error', 3), ('Error', 16)])
+
+    def test_regex_across_chunks(self):
+        # The regular expressions run on the complete lines, a line split in many chunks is matched once
+        self.engine.add_regex(r'^\r?logout\r?$', self.callback, 'logout')
+        for chunk in ('$ exit\r\n\rlog', 'out', '\r', '\n'):
+            self.engine.feed(chunk)
+        self.assertEqual(self.matches, [('\rlogout\r', 8)])
+
+    def test_regex_without_literal(self):
+        self.engine.add_regex(r'\d+ errors', self.callback, flags=IGNORECASE)
+        self.engine.feed('build: 3 Err')
+        self.engine.feed('ors\nno errors\n')
+        self.assertEqual(self.matches, [('3 Errors', 7)])
+
+    def test_remove(self):
+        trigger_id = self.engine.add_literal('abc', self.callback)
+        self.engine.feed('ab')
+        self.engine.remove(trigger_id)
+        self.engine.feed('c')
+        self.assertEqual(self.matches, [])
+
+
+if __name__ == '__main__':
+    unittest.main()